@@ -0,0 +1,193 @@
+import threading
+import time
+from collections import deque
+from sqlalchemy import event, select, update
+from database import Room, Bed, Person
+
+
+class BedUnavailable(Exception):
+    """Raised when no vacant bed matches an allocation request."""
+
+
+class FreeBedIndex:
+    """
+    Per-room queues of vacant bed ids, loaded lazily in each process.
+
+    The index only proposes candidates; every allocation still claims its
+    bed with a guarded write, so a stale entry (a bed another worker has
+    filled) is simply dropped when its claim fails. Beds freed by other
+    workers show up when the index is reloaded, which happens once it runs
+    dry for a request or after max_age seconds. Candidates are popped
+    before their claim commits, so a transaction that rolls back puts its
+    beds back (see watch).
+    """
+
+    def __init__(self, max_age=60):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._rooms = None        # room id -> deque of vacant bed ids
+        self._room_block = {}     # room id -> block id
+        self._block_rooms = {}    # block id -> {room id: None}, rooms that have vacant beds
+        self._loaded_at = 0.0
+
+    def watch(self, session_factory):
+        """Returns the beds claimed by sessions of session_factory to the index if they roll back."""
+        event.listen(session_factory, 'after_commit', self._after_commit)
+        event.listen(session_factory, 'after_rollback', self._after_rollback)
+
+    def _after_commit(self, session):
+        session.info.pop('claimed_beds', None)
+
+    def _after_rollback(self, session):
+        for candidate in session.info.pop('claimed_beds', ()):
+            self.release(*candidate)
+
+    def invalidate(self):
+        with self._lock:
+            self._rooms = None
+
+    def _ensure_loaded(self, db_session):
+        if self._rooms is not None and time.monotonic() - self._loaded_at < self.max_age:
+            return
+        rooms, room_block, block_rooms = {}, {}, {}
+        rows = db_session.execute(
+            select(Bed.id, Bed.room_id, Room.block_id)
+            .join(Room, Bed.room_id == Room.id)
+            .where(Bed.is_occupied == False)
+            .order_by(Bed.room_id, Bed.id)
+        )
+        for bed_id, room_id, block_id in rows:
+            rooms.setdefault(room_id, deque()).append(bed_id)
+            room_block[room_id] = block_id
+            block_rooms.setdefault(block_id, {})[room_id] = None
+        self._rooms, self._room_block, self._block_rooms = rooms, room_block, block_rooms
+        self._loaded_at = time.monotonic()
+
+    def _pop(self, room_id):
+        beds = self._rooms.get(room_id)
+        if not beds:
+            return None
+        bed_id = beds.popleft()
+        if not beds:
+            del self._rooms[room_id]
+            self._block_rooms.get(self._room_block[room_id], {}).pop(room_id, None)
+        return bed_id
+
+    def next_candidate(self, db_session, block_id=None, room_id=None):
+        """
+        Pops the next vacant bed for the preference: the given room, else any
+        room of the given block, else any room at all. Returns
+        (bed_id, room_id, block_id) or None.
+        """
+        with self._lock:
+            self._ensure_loaded(db_session)
+            if room_id is not None:
+                bed_id = self._pop(room_id)
+                return (bed_id, room_id, self._room_block[room_id]) if bed_id else None
+            if block_id is not None:
+                room_ids = self._block_rooms.get(block_id)
+            else:
+                room_ids = self._rooms
+            if not room_ids:
+                return None
+            chosen = next(iter(room_ids))
+            return self._pop(chosen), chosen, self._room_block[chosen]
+
+    def release(self, bed_id, room_id, block_id):
+        """Puts a freed bed back (mark_person_left)."""
+        with self._lock:
+            if self._rooms is None:
+                return
+            beds = self._rooms.setdefault(room_id, deque())
+            if bed_id not in beds:
+                beds.append(bed_id)
+            self._room_block[room_id] = block_id
+            self._block_rooms.setdefault(block_id, {})[room_id] = None
+
+    def add_room(self, room_id, block_id, bed_ids):
+        """Registers the vacant beds of a new room."""
+        with self._lock:
+            if self._rooms is None or not bed_ids:
+                return
+            self._rooms[room_id] = deque(bed_ids)
+            self._room_block[room_id] = block_id
+            self._block_rooms.setdefault(block_id, {})[room_id] = None
+
+    def drop_room(self, room_id):
+        """Forgets a deleted room."""
+        with self._lock:
+            if self._rooms is None:
+                return
+            self._rooms.pop(room_id, None)
+            block_id = self._room_block.pop(room_id, None)
+            self._block_rooms.get(block_id, {}).pop(room_id, None)
+
+
+def _claim(db_session, bed_id, person_id):
+    """
+    Assigns bed_id to person_id only if it is still vacant; returns True on success.
+
+    On PostgreSQL the row is first locked with FOR UPDATE SKIP LOCKED, so a
+    bed another transaction is claiming right now is skipped instead of
+    waited on. The UPDATE itself is guarded by is_occupied = false, which on
+    SQLite (where writers are serialised) is what makes the claim atomic.
+    """
+    if db_session.get_bind().dialect.name == 'postgresql':
+        locked = db_session.execute(
+            select(Bed.id)
+            .where(Bed.id == bed_id, Bed.is_occupied == False)
+            .with_for_update(skip_locked=True)
+        ).first()
+        if locked is None:
+            return False
+    result = db_session.execute(
+        update(Bed)
+        .where(Bed.id == bed_id, Bed.is_occupied == False)
+        .values(is_occupied=True, person_id=person_id)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def _record_room(db_session, person_id, room_id):
+    """Notes the room of the resident's stay, which billing still needs after the bed is released."""
+    db_session.execute(
+        update(Person).where(Person.id == person_id).values(room_id=room_id)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def allocate_bed(db_session, free_beds, person_id, bed_id=None, block_id=None, room_id=None):
+    """
+    Assigns person_id to a vacant bed within the caller's transaction.
+
+    With bed_id the exact bed is claimed. Otherwise the next free bed is
+    auto-assigned, preferring room_id, then block_id. Returns
+    (bed_id, room_id, block_id); raises BedUnavailable when nothing is free.
+    """
+    if bed_id is not None:
+        row = db_session.execute(
+            select(Bed.room_id, Room.block_id).join(Room, Bed.room_id == Room.id).where(Bed.id == bed_id)
+        ).first()
+        if row is None or not _claim(db_session, bed_id, person_id):
+            raise BedUnavailable('That bed is no longer available. Please choose another one.')
+        _record_room(db_session, person_id, row.room_id)
+        return bed_id, row.room_id, row.block_id
+
+    reloaded = False
+    while True:
+        candidate = free_beds.next_candidate(db_session, block_id=block_id, room_id=room_id)
+        if candidate is None:
+            if reloaded:
+                if block_id is None and room_id is None:
+                    raise BedUnavailable('There are no vacant beds left.')
+                raise BedUnavailable('No vacant bed matches the chosen block or room.')
+            # Beds freed by other workers are only seen after a reload
+            free_beds.invalidate()
+            reloaded = True
+            continue
+        if _claim(db_session, candidate[0], person_id):
+            _record_room(db_session, person_id, candidate[1])
+            # Released back to free_beds if the transaction rolls back
+            db_session.info.setdefault('claimed_beds', []).append(candidate)
+            return candidate
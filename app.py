@@ -1,60 +1,277 @@
+import io
 import os
-from datetime import datetime
-from flask import Flask, render_template, request, redirect, url_for, session, flash, g,jsonify
-from sqlalchemy import create_engine
+import time
+from collections import namedtuple
+from datetime import date, datetime
+from functools import wraps
+import click
+from flask import (Flask, render_template, stream_template, request, redirect, url_for, session, flash, g, jsonify,
+                   send_file, has_app_context, get_template_attribute)
+from markupsafe import Markup
+from jinja2 import FileSystemBytecodeCache
+from werkzeug.local import LocalProxy
 from sqlalchemy.orm import sessionmaker
-from database import Base, Block, Room, Bed, Person, Payment, Worker,Admin,create_tables
+from database import engine, replica_engines, Block, Room, Bed, Person, Payment, Worker,Admin,ArchivedPerson,init_db,create_tables
 from config import Config
-from sqlalchemy.exc import IntegrityError
-# Import for initial setup
+from queries import (load_block_rooms, load_room_beds, load_payment_matrix, stream_payment_matrix, bed_table_query,
+                     guests_query, archived_guests_query, archived_payment_totals, filter_options, keyset_page,
+                     outstanding_dues, STREAM_BATCH_SIZE, MONTHS, LEDGER_YEARS)
+from stats import OccupancyCache, merge_occupancy, format_occupancy
+from bulk_import import import_csv, IMPORT_COLUMNS
+from ledger import upsert_payments, migrate_payments, PaymentUpdateError
+from query_plans import check_query_plans
+from allocator import FreeBedIndex, BedUnavailable, allocate_bed
+from page_cache import DataVersion, PageCache, CachedPage
+from live import BedEventFeed, bed_snapshot, record_bed_events, bed_state, bed_added, bed_removed, RELOAD
+from instrumentation import Instrumentation
+from reports import ReportJobs, REPORT_KINDS, report_formats, parse_month
+from trends import capture_snapshot, backfill, trend, HOSTEL
+from archive import archive_departed
+from provisioning import provision_block, ProvisioningError, DEFAULT_ROOM_PATTERN
+from fragments import FragmentCache
+from billing import save_readings, split_bills
+from routing import ReplicaRouter
+from properties import PropertyShards, PerProperty
 
 # Initialize Flask app
 app = Flask(__name__)
 app.config.from_object(Config)
 
-# Database setup
-engine = create_engine(app.config['SQLALCHEMY_DATABASE_URI'])
-Base.metadata.bind = engine
+# Compiled templates are kept on disk, so a restarted worker loads them
+# instead of compiling every template again on its first requests
+if app.config['TEMPLATE_CACHE_DIR']:
+    os.makedirs(app.config['TEMPLATE_CACHE_DIR'], exist_ok=True)
+    app.jinja_options = {**app.jinja_options,
+                         'bytecode_cache': FileSystemBytecodeCache(app.config['TEMPLATE_CACHE_DIR'])}
+
+# Database setup: one shared, pooled engine (see database.make_engine)
 DBSession = sessionmaker(bind=engine)
 
-def get_db_session():
-    """Provides a database session for the current request."""
-    if not hasattr(g, 'db_session'):
-        g.db_session = DBSession()
-    return g.db_session
+# SQL and render timings per request: Server-Timing headers and /metrics
+instrumentation = Instrumentation()
+instrumentation.init_app(app, engine)
+
+# Read-only views run on a healthy read replica when any are configured
+replica_router = ReplicaRouter(engine, replica_engines, check_interval=app.config['REPLICA_CHECK_INTERVAL'],
+                               max_lag=app.config['REPLICA_MAX_LAG'])
+for replica_engine in replica_engines:
+    instrumentation.instrument_engine(replica_engine)
+
+# Each property (hostel) has its own database, connection pool and
+# in-process caches; requests work on the one picked in their session
+shards = PropertyShards(app.config['PROPERTY_DATABASES'], app.config['DEFAULT_PROPERTY'], engine,
+                        idle_timeout=app.config['PROPERTY_POOL_IDLE_TIMEOUT'],
+                        max_workers=app.config['PROPERTY_QUERY_WORKERS'],
+                        on_create=instrumentation.instrument_engine)
+
+PropertyState = namedtuple('PropertyState', ['id', 'sessions', 'data_version', 'occupancy_cache', 'free_beds',
+                                             'fragment_cache', 'bed_feed', 'report_jobs'])
+
+def _property_state(property_id):
+    """
+    The session factory and in-process caches of one property, built the
+    first time this worker needs them. The default property keeps the
+    session factory, version file and report directory of a single-hostel
+    deployment; the others get their own beside them.
+    """
+    default = property_id == shards.default
+    sessions = DBSession if default else shards.sessionmaker(property_id)
+    suffix = '' if default else f'-{property_id}'
+
+    # Occupancy counters for /profile, kept current by the write routes
+    occupancy = OccupancyCache(max_age=app.config['OCCUPANCY_CACHE_MAX_AGE'])
+    occupancy.watch(sessions)
+
+    # Vacant beds per room, used to auto-assign beds without walking the hostel
+    free = FreeBedIndex(max_age=app.config['FREE_BED_INDEX_MAX_AGE'])
+    free.watch(sessions)
+
+    # Bumped on every commit that writes; rendered pages are cached per version
+    version = DataVersion(app.config['DATA_VERSION_FILE'] and app.config['DATA_VERSION_FILE'] + suffix,
+                          check_interval=app.config['DATA_VERSION_CHECK_INTERVAL'])
+    version.watch(sessions)
+    # Writes made by other workers also make this worker's counters stale
+    version.on_foreign_change(occupancy.invalidate)
+    version.on_foreign_change(free.invalidate)
+
+    # Month-end exports, generated on a thread pool outside the request cycle
+    # (and off the primary when there is a replica to read from)
+    read_sessions = (lambda: DBSession(bind=replica_router.read_engine())) if default else sessions
+    reports = ReportJobs(read_sessions, app.config['REPORTS_DIR'] + suffix, max_workers=app.config['REPORT_WORKERS'],
+                         retention=app.config['REPORT_RETENTION'])
+
+    return PropertyState(
+        id=property_id,
+        sessions=sessions,
+        data_version=version,
+        occupancy_cache=occupancy,
+        free_beds=free,
+        # Room and bed fragments, redrawn only when their room's version moves
+        fragment_cache=FragmentCache(max_entries=app.config['FRAGMENT_CACHE_SIZE']),
+        # Bed changes pushed to the accommodate page over Server-Sent Events
+        bed_feed=BedEventFeed(sessions, version, poll_interval=app.config['LIVE_POLL_INTERVAL'],
+                              db_poll_interval=app.config['LIVE_DB_POLL_INTERVAL']),
+        report_jobs=reports,
+    )
+
+properties = PerProperty(_property_state)
+# Built now so its session events are registered before the first request
+properties[shards.default]
+
+def current_property():
+    """
+    The PropertyState of the property this request (or CLI command) works
+    on; the default property outside the app context, e.g. in scripts.
+    """
+    return properties[g.get('property', shards.default) if has_app_context() else shards.default]
+
+# The current property's caches, under the names the views have always used
+occupancy_cache = LocalProxy(lambda: current_property().occupancy_cache)
+free_beds = LocalProxy(lambda: current_property().free_beds)
+data_version = LocalProxy(lambda: current_property().data_version)
+fragment_cache = LocalProxy(lambda: current_property().fragment_cache)
+bed_feed = LocalProxy(lambda: current_property().bed_feed)
+report_jobs = LocalProxy(lambda: current_property().report_jobs)
+
+# Rendered pages of every property, keyed by property as well as route
+page_cache = PageCache(max_entries=app.config['PAGE_CACHE_SIZE'])
+
+FRAGMENTS = '_fragments.html'
+
+@app.template_global('fragment')
+def render_fragment(template, macro, key, version, *args):
+    """A room or bed fragment from the current property's fragment cache."""
+    return fragment_cache.render(template, macro, key, version, *args)
+
+def get_db_session(primary=False):
+    """
+    Provides a database session for the current request, on the current
+    property's database. For the default property it is on a read replica
+    in views marked with @replica_reads, unless primary is set or the user
+    wrote something in the last REPLICA_STICKY_SECONDS; on the primary
+    otherwise.
+    """
+    state = current_property()
+    if (primary or state.id != shards.default or not g.get('read_only')
+            or session.get('primary_until', 0) > time.time()):
+        if not hasattr(g, 'db_session'):
+            g.db_session = state.sessions()
+        return g.db_session
+    if not hasattr(g, 'replica_session'):
+        bind = replica_router.read_engine()
+        g.db_replica = bind is not engine
+        g.replica_session = DBSession(bind=bind) if g.db_replica else get_db_session(primary=True)
+    return g.replica_session
+
+def replica_reads(methods=('GET',)):
+    """
+    Marks a view as read-only for the given methods, so get_db_session()
+    may hand it a session on a read replica (see routing.py).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            method = 'GET' if request.method == 'HEAD' else request.method
+            g.read_only = method in methods
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def wants_stream():
+    """True when the client asked for the full listing streamed instead of one page."""
+    return request.values.get('stream') == '1'
+
+def page_cursor():
+    """The keyset cursor (last id of the previous page) sent by the client, if any."""
+    return request.values.get('after', type=int)
+
+def cached_view(methods=('GET',)):
+    """
+    Serves a read-only view from the page cache, keyed by property, route,
+    request arguments and data version, and answers a matching If-None-Match with
+    304 before any query or template work. Streamed listings, requests with
+    flash messages waiting to be shown and responses that flashed are
+    never cached.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            method = 'GET' if request.method == 'HEAD' else request.method
+            if method not in methods or wants_stream() or session.get('_flashes'):
+                return view(*args, **kwargs)
+
+            key = page_cache.make_key((current_property().id, request.endpoint), request.values.items(multi=True),
+                                      data_version.current())
+            etag = page_cache.etag_for(key)
+            if method == 'GET' and etag in request.if_none_match:
+                response = app.response_class(status=304)
+            else:
+                page = page_cache.get(key)
+                if page is not None:
+                    response = app.response_class(page.body, mimetype=page.mimetype)
+                else:
+                    response = app.make_response(view(*args, **kwargs))
+                    if response.status_code != 200 or response.is_streamed or session.modified:
+                        return response
+                    # A replica may be up to REPLICA_MAX_LAG seconds behind, so a page it
+                    # rendered right after a write must not be kept under the new version
+                    if g.get('db_replica') and data_version.age() < app.config['REPLICA_MAX_LAG']:
+                        return response
+                    page_cache.put(key, CachedPage(response.get_data(), response.mimetype, etag))
+            response.set_etag(etag)
+            # Let the browser keep the page but revalidate it on every visit
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapper
+    return decorator
 
 @app.teardown_appcontext
 def close_db_session(error):
     """Closes the database session at the end of the request."""
     if hasattr(g, 'db_session'):
         g.db_session.close()
+    if hasattr(g, 'replica_session'):
+        g.replica_session.close()
+
+@app.after_request
+def stick_to_primary(response):
+    """After a request that may have written, keeps the user's reads on the primary for a while."""
+    if replica_router.replicas and request.method not in ('GET', 'HEAD') and not g.get('read_only'):
+        session['primary_until'] = time.time() + app.config['REPLICA_STICKY_SECONDS']
+    return response
 
-# --- Admin Credentials from config ---
-# Use the Config object directly to get admin credentials
-#ADMIN_USERNAME = Config.ADMIN_USERNAME
-#ADMIN_PASSWORD = Config.ADMIN_PASSWORD
 # --- Initial Admin Setup ---
-# Check and create the initial admin user if the database is empty
-with app.app_context():
-    create_tables()
-    Session = DBSession()
-    if Session.query(Admin).count() == 0:
-        # NOTE: In a production app, use password hashing (e.g., werkzeug.security)
-        default_admin = Admin(
-            username=Config.ADMIN_USERNAME, 
-            password=Config.ADMIN_PASSWORD
-        )
-        try:
-            Session.add(default_admin)
-            Session.commit()
-            print("Default admin user created.")
-        except IntegrityError:
-            Session.rollback()
-            print("Admin user already existed (IntegrityError handled).")
-    Session.close()
+# Tables, indexes and the default admin are created by the one-off
+# `flask --app app init-db` command (run on deploy), so importing the app
+# in each gunicorn worker issues no DDL or queries.
 
-# --- Admin Credentials from config (REMOVED) ---
-# Removed hardcoded credentials
+def property_option(command):
+    """Adds --property to a CLI command, choosing the hostel it works on, and --all-properties."""
+    @click.option('--property', 'property_id', help='Property to work on (default: DEFAULT_PROPERTY).')
+    @click.option('--all-properties', is_flag=True, help='Run once for every property, the default first.')
+    @wraps(command)
+    def wrapper(property_id, all_properties, *args, **kwargs):
+        if property_id is not None and property_id not in shards:
+            raise click.BadParameter(f'unknown property "{property_id}"', param_hint='--property')
+        if all_properties and property_id is not None:
+            raise click.BadParameter('give either --property or --all-properties', param_hint='--all-properties')
+        if not all_properties:
+            g.property = property_id or shards.default
+            return command(*args, **kwargs)
+        for property_id in shards.ids():
+            click.echo(f'Property "{property_id}":')
+            g.property = property_id
+            command(*args, **kwargs)
+    return wrapper
+
+@app.cli.command('init-db')
+@property_option
+def init_db_command():
+    """Creates the tables, indexes and the default admin user (just the tables for other properties)."""
+    if g.property == shards.default:
+        init_db()
+    else:
+        create_tables(shards.engine(g.property))
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -142,9 +359,35 @@ def logout():
 def require_login():
     """Checks if the user is logged in before each request."""
     # Ensure the login endpoint is not protected
-    if 'logged_in' not in session and request.endpoint not in ['login', 'static', None]:
+    # /metrics checks its own token so a scraper can reach it
+    if 'logged_in' not in session and request.endpoint not in ['login', 'static', 'metrics', None]:
         return redirect(url_for('login'))
 
+@app.before_request
+def select_property():
+    """Works on the property picked in the session, the default one until another is picked."""
+    property_id = session.get('property')
+    g.property = property_id if property_id in shards else shards.default
+    # The admin account lives in the default property's database
+    if request.endpoint in ('login', 'reset_password'):
+        g.property = shards.default
+
+@app.context_processor
+def inject_properties():
+    """The property switcher in base.html, shown when there is more than one."""
+    return {'property_ids': shards.ids(), 'current_property_id': g.get('property', shards.default)}
+
+@app.route('/property', methods=['POST'])
+def switch_property():
+    """Switches the hostel the following pages work on."""
+    property_id = request.form.get('property')
+    if property_id in shards:
+        session['property'] = property_id
+        flash(f'Now managing "{property_id}".')
+    else:
+        flash('Unknown property.', 'error')
+    return redirect(url_for('profile'))
+
 @app.route('/')
 def home():
     """Renders the home page."""
@@ -158,10 +401,17 @@ def build():
     
     if request.method == 'POST':
         action = request.form.get('action')
+        # Counter changes to report to the occupancy cache once committed
+        occupancy_cache.track(db_session)
+        occupancy_changes = []
+        new_room = None
+        provisioned = False
         if action == 'add_block':
             block_name = request.form.get('block_name')
             new_block = Block(name=block_name)
             db_session.add(new_block)
+            db_session.flush() # To get the new block's ID
+            occupancy_changes.append(dict(block_id=new_block.id, name=block_name))
             flash(f'Block "{block_name}" added successfully!')
         elif action == 'add_room':
             block_id = request.form.get('block_id')
@@ -176,14 +426,44 @@ def build():
                 for i in range(1, int(bed_count) + 1):
                     new_bed = Bed(bed_number=i, room=new_room)
                     db_session.add(new_bed)
+                db_session.flush() # To get the new bed IDs for the free-bed index
+                occupancy_changes.append(dict(block_id=int(block_id), rooms=1, beds=int(bed_count)))
+                block_name = db_session.get(Block, int(block_id)).name
+                record_bed_events(db_session, [
+                    bed_added(bed.id, bed.bed_number, new_room.id, room_name, int(block_id), block_name)
+                    for bed in new_room.beds
+                ])
                 flash(f'Room "{room_name}" with {bed_count} beds added successfully!')
+        elif action == 'provision_block':
+            block_name = request.form.get('block_name')
+            try:
+                result = provision_block(
+                    db_session, block_name,
+                    floors=request.form.get('floors', 0, type=int),
+                    rooms_per_floor=request.form.get('rooms_per_floor', 0, type=int),
+                    beds_per_room=request.form.get('beds_per_room', 0, type=int),
+                    room_pattern=request.form.get('room_pattern') or DEFAULT_ROOM_PATTERN,
+                )
+            except ProvisioningError as e:
+                db_session.rollback()
+                flash(str(e), 'error')
+                return redirect(url_for('build'))
+            occupancy_changes.append(dict(block_id=result.block_id, name=block_name.strip(),
+                                          rooms=result.rooms, beds=result.beds))
+            # Too many beds for deltas: live pages reload their snapshot
+            record_bed_events(db_session, [RELOAD])
+            provisioned = True
+            flash(f'Block "{block_name.strip()}" provisioned with {result.rooms} rooms and {result.beds} beds '
+                  f'in {result.seconds:.2f}s.')
         elif action == 'add_person':
-            bed_id = request.form.get('bed_id')
+            # An empty bed_id means "auto-assign", optionally within a preferred block
+            bed_id = request.form.get('bed_id', type=int)
+            block_pref = request.form.get('block_pref', type=int)
             person_name = request.form.get('person_name')
             aadhar = request.form.get('aadhar')
             joining_date_str = request.form.get('joining_date')
             
-            if not bed_id or not person_name or not aadhar or not joining_date_str:
+            if not person_name or not aadhar or not joining_date_str:
                 flash('Please fill all person details.')
             else:
                 try:
@@ -192,19 +472,55 @@ def build():
                     db_session.add(new_person)
                     db_session.flush() # To get the new person's ID
 
-                    bed = db_session.query(Bed).filter_by(id=bed_id).first()
-                    if bed:
-                        bed.is_occupied=True
-                        bed.person_id = new_person.id
+                    # Guarded claim, so two workers can never fill the same bed
+                    assigned_bed_id, room_id, block_id = allocate_bed(
+                        db_session, free_beds, new_person.id, bed_id=bed_id, block_id=block_pref
+                    )
+                    occupancy_changes.append(dict(block_id=block_id, occupied=1, persons=1))
+                    record_bed_events(db_session, [bed_state(assigned_bed_id, True, person_name)])
                     flash(f'Person "{person_name}" added and assigned to bed successfully!')
                 except ValueError:
                     flash('Invalid date format. Please use YYYY-MM-DD.')
-        db_session.commit()
+                except BedUnavailable as e:
+                    db_session.rollback()
+                    flash(str(e), 'error')
+                    return redirect(url_for('build'))
+        occupancy_cache.commit(db_session, *occupancy_changes)
+        if new_room is not None:
+            free_beds.add_room(new_room.id, new_room.block_id, [bed.id for bed in new_room.beds])
+        if provisioned:
+            # The beds were written through Core inserts; reload the index lazily
+            free_beds.invalidate()
         return redirect(url_for('build'))
 
-    blocks = db_session.query(Block).all()
+    blocks = load_block_rooms(db_session)
     # Correctly reference the template filename
-    return render_template('build.html', blocks=blocks)
+    return render_template('build.html', blocks=blocks, fragments=room_fragments(db_session, blocks),
+                           room_pattern=DEFAULT_ROOM_PATTERN)
+
+def room_fragments(db_session, blocks):
+    """
+    {room id: (room card, vacant bed options)} for every room of blocks.
+    Rooms whose version has not moved come straight from the fragment
+    cache; beds are loaded, in one query, only for the rest.
+    """
+    fragments = {}
+    stale = []
+    for block in blocks:
+        for room in block.rooms:
+            card = fragment_cache.get(FRAGMENTS, 'room_card', room.id, room.version)
+            options = fragment_cache.get(FRAGMENTS, 'vacant_options', room.id, room.version)
+            if card is None or options is None:
+                stale.append((block, room))
+            else:
+                fragments[room.id] = (card, options)
+    beds = load_room_beds(db_session, [room.id for _, room in stale])
+    for block, room in stale:
+        fragments[room.id] = (
+            fragment_cache.render(FRAGMENTS, 'room_card', room.id, room.version, room, beds[room.id]),
+            fragment_cache.render(FRAGMENTS, 'vacant_options', room.id, room.version, block, room, beds[room.id]),
+        )
+    return fragments
 
 
 @app.route('/delete_room/<int:room_id>', methods=['POST'])
@@ -229,85 +545,88 @@ def delete_room(room_id):
     if occupied_beds > 0:
         flash(f'Cannot delete room "{room_to_delete.name}". It still has {occupied_beds} occupied bed(s).', 'error')
     else:
+        block_id = room_to_delete.block_id
+        bed_total = len(room_to_delete.beds)
+        occupancy_cache.track(db_session)
+        record_bed_events(db_session, [bed_removed(bed.id) for bed in room_to_delete.beds])
         # SQLAlchemy cascade='all, delete-orphan' handles deletion of associated beds
         db_session.delete(room_to_delete)
-        db_session.commit()
+        occupancy_cache.commit(db_session, dict(block_id=block_id, rooms=-1, beds=-bed_total))
+        free_beds.drop_room(room_id)
         flash(f'Room "{room_to_delete.name}" and all its beds have been deleted successfully.')
     
     return redirect(url_for('build'))
 
 @app.route('/profile')
+@replica_reads()
+@cached_view()
 def profile():
     """Displays whole statistics of the hostel (rooms occupancy block-wise)."""
-    db_session = get_db_session()
-    
-    # 1. Global Statistics
-    total_beds = db_session.query(Bed).count()
-    occupied_beds = db_session.query(Bed).filter(Bed.is_occupied == True).count()
-    unoccupied_beds = total_beds - occupied_beds
-    
-    # Calculate global occupancy percentage
-    global_occupancy_percent = (occupied_beds / total_beds * 100) if total_beds > 0 else 0
-    
-    # Other counts
-    total_persons = db_session.query(Person).filter(Person.leaving_date == None).count()
-    total_workers = db_session.query(Worker).count()
-    total_rooms = db_session.query(Room).count()
-
-    # 2. Block-wise Statistics
-    blocks = db_session.query(Block).all()
-    block_stats = []
-    
-    for block in blocks:
-        block_rooms = db_session.query(Room).filter(Room.block_id == block.id).all()
-        
-        block_total_beds = sum(room.bed_count for room in block_rooms)
-        
-        # Query occupied beds only for this block's rooms
-        block_occupied_beds = db_session.query(Bed).join(Room).filter(
-            Room.block_id == block.id,
-            Bed.is_occupied == True
-        ).count()
-        
-        block_occupancy_percent = (block_occupied_beds / block_total_beds * 100) if block_total_beds > 0 else 0
-
-        block_stats.append({
-            'name': block.name,
-            'total_rooms': len(block_rooms),
-            'total_beds': block_total_beds,
-            'occupied_beds': block_occupied_beds,
-            'unoccupied_beds': block_total_beds - block_occupied_beds,
-            'occupancy_percent': round(block_occupancy_percent, 2)
-        })
-
-    # NOTE: You'll need a 'profile.html' template to display this data
-    return render_template(
-        'profile.html', 
-        global_stats={
-            'total_beds': total_beds,
-            'occupied_beds': occupied_beds,
-            'unoccupied_beds': unoccupied_beds,
-            'occupancy_percent': round(global_occupancy_percent, 2),
-            'total_persons': total_persons,
-            'total_workers': total_workers,
-            'total_rooms': total_rooms
-        },
-        block_stats=block_stats
-    )
+    # The counters are moved by this worker's own writes, so the grouped
+    # query that refreshes them must see those writes: it runs on the primary
+    db_session = get_db_session(primary=True)
+
+    # Served from the in-process counters; one grouped query when they are stale
+    global_stats, block_stats = occupancy_cache.snapshot(db_session)
+
+    return render_template('profile.html', global_stats=global_stats, block_stats=block_stats)
+
+@app.route('/profile/all')
+def profile_all_properties():
+    """Displays the statistics of every property together, gathered from their databases in parallel."""
+    def property_counts(property_id):
+        state = properties[property_id]
+        db_session = state.sessions()
+        try:
+            return state.occupancy_cache.counts(db_session)
+        finally:
+            db_session.close()
+
+    counts, failed = shards.map(property_counts)
+    for property_id in failed:
+        flash(f'Property "{property_id}" could not be reached and is left out of the totals.', 'error')
+    totals, blocks, per_property = merge_occupancy(counts)
+    global_stats, block_stats = format_occupancy(totals, blocks)
+    property_stats = [dict(format_occupancy(property_totals, {})[0], name=property_id)
+                      for property_id, property_totals in per_property.items()]
+    return render_template('profile.html', global_stats=global_stats, block_stats=block_stats,
+                           property_stats=property_stats)
+
+@app.route('/profile/trends')
+@replica_reads()
+@cached_view()
+def occupancy_trends():
+    """API endpoint with weekly or monthly occupancy of the hostel or one block, from the rollups."""
+    period = request.args.get('period', 'month')
+    block_id = request.args.get('block', HOSTEL, type=int)
+    limit = min(request.args.get('limit', 12, type=int), 104)
+    try:
+        points = trend(get_db_session(), period=period, block_id=block_id, limit=limit)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    return jsonify({'period': period, 'block': block_id, 'points': points})
 
 @app.route('/accommodate')
+@replica_reads()
+@cached_view()
 def accommodate():
     """Renders the accommodate page with filtering options."""
     db_session = get_db_session()
     
-    blocks = db_session.query(Block).all()
-    rooms = db_session.query(Room).all()
-    beds = db_session.query(Bed).all()
-    
+    blocks, rooms = filter_options(db_session)
+    query = bed_table_query(db_session)
+
+    if wants_stream():
+        beds = query.order_by(Bed.id).yield_per(STREAM_BATCH_SIZE)
+        return app.response_class(stream_template('accommodate.html', blocks=blocks, rooms=rooms, beds=beds))
+
+    page = keyset_page(query, Bed.id, page_cursor(), app.config['PAGE_SIZE'])
     # Correctly reference the template filename
-    return render_template('accommodate.html', blocks=blocks, rooms=rooms, beds=beds)
+    return render_template('accommodate.html', blocks=blocks, rooms=rooms, beds=page.items, next_cursor=page.next_cursor)
 
 @app.route('/accommodate/filter', methods=['POST'])
+@replica_reads(methods=('POST',))
+@cached_view(methods=('POST',))
 def filter_accommodate():
     """API endpoint to filter beds."""
     db_session = get_db_session()
@@ -316,45 +635,98 @@ def filter_accommodate():
     room_id = request.form.get('room_filter')
     occupied_status = request.form.get('occupied_status')
     
-    query = db_session.query(Bed).join(Room).join(Block).outerjoin(Person)
-    
-    if block_id:
-        query = query.filter(Block.id == block_id)
-    if room_id:
-        query = query.filter(Room.id == room_id)
-    if occupied_status == 'filled':
-        query = query.filter(Bed.is_occupied== True)
-    elif occupied_status == 'empty':
-        query = query.filter(Bed.is_occupied== False)
-    
-    filtered_beds = query.all()
+    query = bed_table_query(db_session, block_id, room_id, occupied_status)
+
+    if wants_stream():
+        beds = query.order_by(Bed.id).yield_per(STREAM_BATCH_SIZE)
+        return app.response_class(stream_template('_bed_table.html', beds=beds))
+
+    page = keyset_page(query, Bed.id, page_cursor(), app.config['PAGE_SIZE'])
 
-    return render_template('_bed_table.html', beds=filtered_beds) # Using a partial template
+    return render_template('_bed_table.html', beds=page.items, next_cursor=page.next_cursor) # Using a partial template
+
+@app.route('/accommodate/beds')
+@replica_reads()
+@cached_view()
+def bed_snapshot_json():
+    """JSON snapshot of every bed, versioned so the live stream can continue from it."""
+    return jsonify(bed_snapshot(get_db_session()))
+
+@app.route('/accommodate/events')
+def bed_events():
+    """Server-Sent Events stream of bed changes after ?after= (or the Last-Event-ID header)."""
+    after = request.headers.get('Last-Event-ID', type=int)
+    if after is None:
+        after = page_cursor()
+    response = app.response_class(bed_feed.stream(after), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Keep nginx-style proxies from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 @app.route('/payments', methods=['GET', 'POST'])
+@replica_reads(methods=('GET', 'POST'))
 def payments():
-    """Handles monthly payment tracking."""
+    """Handles monthly payment tracking for one year (?year=, default this year)."""
     db_session = get_db_session()
-    blocks = db_session.query(Block).all()
     
-    if request.method == 'POST':
-        person_name_search = request.form.get('person_name')
-        room_name_search = request.form.get('room_name')
-        
-        query = db_session.query(Person).join(Bed).join(Room).join(Block).outerjoin(Payment)
-        
-        if person_name_search:
-            query = query.filter(Person.name.like(f'%{person_name_search}%'))
-        if room_name_search:
-            query = query.filter(Room.name.like(f'%{room_name_search}%'))
-        
-        persons = query.all()
-        # Correctly reference the template filename
-        return render_template('payments.html', blocks=blocks, persons=persons, searched=True)
-        
-    persons = db_session.query(Person).join(Bed).join(Room).join(Block).all()
+    # Search terms come from the form on POST and from the pager links on GET
+    person_name_search = request.values.get('person_name')
+    room_name_search = request.values.get('room_name')
+    year = request.values.get('year', date.today().year, type=int)
+    year = min(max(year, LEDGER_YEARS[0]), LEDGER_YEARS[-1])
+    searched = request.method == 'POST' or bool(person_name_search or room_name_search)
+    filters = {key: value for key, value in (('person_name', person_name_search), ('room_name', room_name_search)) if value}
+    filters['year'] = year
+    dues_panel = payment_dues_panel(db_session, year)
+
+    if wants_stream():
+        persons = stream_payment_matrix(db_session, year, person_name=person_name_search, room_name=room_name_search)
+        return app.response_class(stream_template('payments.html', persons=persons, months=MONTHS, searched=searched,
+                                                  year=year, dues_panel=dues_panel, filters=filters))
+
+    page = load_payment_matrix(db_session, year, person_name=person_name_search, room_name=room_name_search,
+                               after=page_cursor(), limit=app.config['PAGE_SIZE'])
     # Correctly reference the template filename
-    return render_template('payments.html', blocks=blocks, persons=persons)
+    return render_template('payments.html', persons=page.items, months=MONTHS, searched=searched,
+                           next_cursor=page.next_cursor, filters=filters, year=year, dues_panel=dues_panel)
+
+def payment_dues_panel(db_session, year):
+    """
+    The months owed per block in year, up to this month, drawn from one
+    scan of the ledger and kept in the fragment cache until the data
+    version moves, so paging through /payments does not repeat the scan.
+    """
+    today = date.today()
+    version = data_version.current()
+    markup = fragment_cache.get(FRAGMENTS, 'dues_panel', (year, today), version)
+    if markup is not None:
+        return markup
+    dues = {}
+    for row in outstanding_dues(db_session, date(year, 1, 1), min(date(year, 12, 1), today)):
+        cells = dues.setdefault(row['block'] or 'No bed (departed)', [None] * len(MONTHS))
+        cells[int(row['month'][5:]) - 1] = row
+    markup = Markup(get_template_attribute(FRAGMENTS, 'dues_panel')(year, dues, MONTHS))
+    # As with cached pages, a lagging replica's figures are not kept under the new version
+    if not (g.get('db_replica') and data_version.age() < app.config['REPLICA_MAX_LAG']):
+        fragment_cache.put(FRAGMENTS, 'dues_panel', (year, today), version, markup)
+    return markup
+
+@app.route('/payments/dues')
+@replica_reads()
+@cached_view()
+def payment_dues():
+    """API endpoint with the months owed and EB outstanding per block and month, from=YYYY-MM to=YYYY-MM (&block=)."""
+    today = date.today()
+    try:
+        first = parse_month(request.args.get('from', f'{today.year}-01'))[0]
+        last = parse_month(request.args.get('to', f'{today:%Y-%m}'))[0]
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    if (last.year - first.year) * 12 + last.month - first.month >= 120:
+        return jsonify({'status': 'error', 'message': 'At most 120 months at a time.'}), 400
+    rows = outstanding_dues(get_db_session(), first, last, block_id=request.args.get('block', type=int))
+    return jsonify({'from': f'{first:%Y-%m}', 'to': f'{last:%Y-%m}', 'dues': rows})
 
 @app.route('/update_payment/<int:person_id>/<string:month>', methods=['POST'])
 def update_payment(person_id, month):
@@ -365,22 +737,62 @@ def update_payment(person_id, month):
     data = request.get_json()
     status = data.get('status')
     eb_amount = data.get('eb_amount')
+    year = data.get('year')
 
-    # Convert empty string to None if needed
-    if eb_amount == '':
-        eb_amount = None
-
-    payment = db_session.query(Payment).filter_by(person_id=person_id, month=month).first()
-    if not payment:
-        payment = Payment(person_id=person_id, month=month)
-        db_session.add(payment)
-    
-    payment.status = status
-    payment.eb_amount = eb_amount
+    try:
+        # Upsert on (person_id, year), so two clicks can never create duplicate rows
+        upsert_payments(db_session, [{'person_id': person_id, 'year': year, 'month': month, 'status': status,
+                                      'eb_amount': eb_amount}])
+    except PaymentUpdateError as e:
+        db_session.rollback()
+        return jsonify({'status': 'error', 'message': str(e)}), 400
     db_session.commit()
     return jsonify({'status': 'OK'})
 
+@app.route('/update_payments', methods=['POST'])
+def update_payments():
+    """API endpoint to apply a batch of payment updates in one transaction."""
+    db_session = get_db_session()
+
+    # Either a bare list of updates or {"updates": [...]}
+    data = request.get_json(silent=True)
+    updates = data.get('updates') if isinstance(data, dict) else data
+    if not isinstance(updates, list):
+        return jsonify({'status': 'error', 'message': 'Expected a list of payment updates.'}), 400
+    if len(updates) > app.config['PAYMENT_BATCH_LIMIT']:
+        return jsonify({'status': 'error', 'message': f"At most {app.config['PAYMENT_BATCH_LIMIT']} updates per batch."}), 400
+
+    try:
+        updated = upsert_payments(db_session, updates)
+    except PaymentUpdateError as e:
+        db_session.rollback()
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    db_session.commit()
+    return jsonify({'status': 'OK', 'updated': updated})
+
+@app.route('/payments/eb_bills', methods=['POST'])
+def split_eb_bills():
+    """API endpoint that records rooms' bills for a month and splits them across their residents by days stayed."""
+    db_session = get_db_session()
+
+    # {"month": "YYYY-MM", "readings": [{"room_id": ..., "amount": ...}, ...]}
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'status': 'error', 'message': 'Expected a month and its meter readings.'}), 400
+    try:
+        start = parse_month(data.get('month'))[0]
+        save_readings(db_session, start.year, start.month, data.get('readings'))
+    except ValueError as e:
+        db_session.rollback()
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    result = split_bills(db_session, start.year, start.month)
+    db_session.commit()
+    return jsonify({'status': 'OK', 'month': f'{start:%Y-%m}', 'rooms': result.rooms, 'residents': result.residents,
+                    'amount': result.amount, 'unbilled_rooms': result.unbilled_rooms})
+
 @app.route('/staff', methods=['GET', 'POST'])
+@replica_reads()
+@cached_view()
 def staff():
     """Handles staff management."""
     db_session = get_db_session()
@@ -390,8 +802,9 @@ def staff():
         mobile = request.form.get('mobile')
         gender = request.form.get('gender')
         new_worker = Worker(name=name, department=department, mobile=mobile, gender=gender)
+        occupancy_cache.track(db_session)
         db_session.add(new_worker)
-        db_session.commit()
+        occupancy_cache.commit(db_session, dict(workers=1))
         flash(f'Staff member "{name}" added successfully!')
         return redirect(url_for('staff'))
     
@@ -400,31 +813,45 @@ def staff():
     return render_template('staff.html', workers=workers)
 
 @app.route('/guests', methods=['GET', 'POST'])
+@replica_reads(methods=('GET', 'POST'))
+@cached_view(methods=('GET', 'POST'))
 def guests():
     """Handles guest information (including those who have left)."""
     db_session = get_db_session()
     
-    if request.method == 'POST':
-        block_filter = request.form.get('block_filter')
-        room_filter = request.form.get('room_filter')
-        month_filter = request.form.get('month_filter')
-        
-        query = db_session.query(Person).join(Bed).join(Room).join(Block)
-        
-        if block_filter:
-            query = query.filter(Block.name == block_filter)
-        if room_filter:
-            query = query.filter(Room.name == room_filter)
-        if month_filter:
-            query = query.filter(Person.leaving_date.like(f'%-{month_filter}-%'))
-
-        guests = query.all()
-        # Correctly reference the template filename
-        return render_template('guests.html', guests=guests, blocks=db_session.query(Block).all(), rooms=db_session.query(Room).all())
-
-    guests = db_session.query(Person).join(Bed).join(Room).join(Block).all()
+    # Filters come from the form on POST and from the pager links on GET
+    block_filter = request.values.get('block_filter')
+    room_filter = request.values.get('room_filter')
+    month_filter = request.values.get('month_filter')
+    # Departed guests past the retention window live in the archive tables,
+    # which are only searched when asked to
+    include_archived = request.values.get('include_archived') == '1'
+    filters = {key: value for key, value in (('block_filter', block_filter), ('room_filter', room_filter),
+                                              ('month_filter', month_filter),
+                                              ('include_archived', '1' if include_archived else None)) if value}
+
+    try:
+        query = guests_query(db_session, block_name=block_filter, room_name=room_filter, month=month_filter)
+    except ValueError:
+        flash('Invalid leaving month. Use YYYY-MM, or MM for that month in any year.', 'error')
+        filters.pop('month_filter', None)
+        query = guests_query(db_session, block_name=block_filter, room_name=room_filter)
+    blocks, rooms = filter_options(db_session)
+
+    if wants_stream():
+        guests = query.order_by(Person.id).yield_per(STREAM_BATCH_SIZE)
+        return app.response_class(stream_template('guests.html', guests=guests, blocks=blocks, rooms=rooms, filters=filters))
+
+    page = keyset_page(query, Person.id, page_cursor(), app.config['PAGE_SIZE'])
+    archived = archived_payments = None
+    if include_archived:
+        archived = keyset_page(archived_guests_query(db_session, month=filters.get('month_filter')), ArchivedPerson.id,
+                               request.values.get('archived_after', type=int), app.config['PAGE_SIZE'])
+        archived_payments = archived_payment_totals(db_session, [guest.id for guest in archived.items])
     # Correctly reference the template filename
-    return render_template('guests.html', guests=guests, blocks=db_session.query(Block).all(), rooms=db_session.query(Room).all())
+    return render_template('guests.html', guests=page.items, blocks=blocks, rooms=rooms,
+                           next_cursor=page.next_cursor, filters=filters,
+                           archived=archived, archived_payments=archived_payments)
 
 @app.route('/person/<int:person_id>/leave', methods=['POST'])
 def mark_person_left(person_id):
@@ -432,16 +859,223 @@ def mark_person_left(person_id):
     db_session = get_db_session()
     person = db_session.query(Person).filter_by(id=person_id).first()
     if person:
+        occupancy_cache.track(db_session)
+        change = dict(persons=-1 if person.leaving_date is None else 0)
         person.leaving_date = datetime.now().date()
         bed = db_session.query(Bed).filter_by(person_id=person.id).first()
         if bed:
+            change.update(block_id=bed.room.block_id, occupied=-1 if bed.is_occupied else 0)
             bed.is_occupied = False 
             bed.person_id = None
-        db_session.commit()
+            record_bed_events(db_session, [bed_state(bed.id, False)])
+        occupancy_cache.commit(db_session, change)
+        if bed:
+            free_beds.release(bed.id, bed.room_id, change['block_id'])
         flash(f'Person "{person.name}" has been marked as left.')
     # Redirect to the 'guests' function, not a filename
     return redirect(url_for('guests'))
 
+@app.route('/reports', methods=['GET', 'POST'])
+def reports():
+    """Starts background report exports and lists the recent ones."""
+    if request.method == 'POST':
+        try:
+            job = report_jobs.start(request.form.get('kind'), request.form.get('month'), request.form.get('format', 'csv'))
+            flash(f'{job["title"]} report for {job["month"]} started.')
+        except ValueError as e:
+            flash(str(e), 'error')
+        return redirect(url_for('reports'))
+
+    return render_template('reports.html', jobs=report_jobs.recent(), kinds=REPORT_KINDS, formats=report_formats(),
+                           default_month=datetime.now().strftime('%Y-%m'))
+
+@app.route('/reports/<job_id>')
+def report_status(job_id):
+    """API endpoint with the status and progress of a report job."""
+    job = report_jobs.status(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': 'Unknown report.'}), 404
+    job['progress'] = round(job['rows'] / job['total'], 3) if job['total'] else 0
+    if job['status'] == 'done':
+        job['download'] = url_for('report_download', job_id=job_id)
+    return jsonify(job)
+
+@app.route('/reports/<job_id>/download')
+def report_download(job_id):
+    """Downloads a finished report."""
+    path = report_jobs.output_path(job_id)
+    if path is None:
+        flash('That report is not ready or has expired.', 'error')
+        return redirect(url_for('reports'))
+    return send_file(path, as_attachment=True, download_name=report_jobs.status(job_id)['filename'])
+
+@app.route('/metrics')
+def metrics():
+    """Request, SQL and render metrics of this worker in Prometheus format."""
+    token = app.config['METRICS_TOKEN']
+    if 'logged_in' not in session and not (token and request.headers.get('Authorization') == f'Bearer {token}'):
+        return 'Unauthorized', 401
+    return app.response_class(instrumentation.render_metrics(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/import', methods=['GET', 'POST'])
+def bulk_import():
+    """Imports blocks, rooms, beds and residents from an uploaded CSV file."""
+    result = None
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash('Please choose a CSV file to import.', 'error')
+            return redirect(url_for('bulk_import'))
+        stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+        db_session = get_db_session()
+        result = import_csv(db_session, stream)
+        if result.ok:
+            # Too many beds for deltas: live pages reload their snapshot.
+            # One commit, so the rows and the event land together
+            record_bed_events(db_session, [RELOAD])
+            db_session.commit()
+            # The import writes through Core inserts, which the caches cannot follow
+            occupancy_cache.invalidate()
+            free_beds.invalidate()
+    return render_template('import.html', result=result, columns=IMPORT_COLUMNS)
+
+@app.cli.command('import-csv')
+@property_option
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+def import_csv_command(path):
+    """Imports blocks, rooms, beds and residents from the CSV file at PATH."""
+    db_session = current_property().sessions()
+    try:
+        with open(path, encoding='utf-8-sig', newline='') as stream:
+            result = import_csv(db_session, stream)
+        if result.ok:
+            # Tells the running workers' live pages to reload; the commit
+            # also retires their cached pages (see DATA_VERSION_FILE)
+            record_bed_events(db_session, [RELOAD])
+            db_session.commit()
+    finally:
+        db_session.close()
+    if not result.ok:
+        for error in result.errors:
+            click.echo(error, err=True)
+        raise SystemExit(1)
+    click.echo(result.summary())
+
+@app.cli.command('provision-block')
+@property_option
+@click.argument('name')
+@click.option('--floors', type=int, required=True)
+@click.option('--rooms-per-floor', type=int, required=True)
+@click.option('--beds-per-room', type=int, required=True)
+@click.option('--room-pattern', default=DEFAULT_ROOM_PATTERN, show_default=True,
+              help='Room names, from {block}, {floor} and {room}.')
+def provision_block_command(name, floors, rooms_per_floor, beds_per_room, room_pattern):
+    """Creates block NAME with all its rooms and beds from a floors x rooms x beds template."""
+    db_session = current_property().sessions()
+    try:
+        result = provision_block(db_session, name, floors, rooms_per_floor, beds_per_room, room_pattern)
+        # Tells the running workers' live pages to reload; the commit
+        # also retires their cached pages (see DATA_VERSION_FILE)
+        record_bed_events(db_session, [RELOAD])
+        db_session.commit()
+    except ProvisioningError as e:
+        click.echo(str(e), err=True)
+        raise SystemExit(1)
+    finally:
+        db_session.close()
+    click.echo(f'Block "{name}" provisioned with {result.rooms} rooms and {result.beds} beds in {result.seconds:.2f}s.')
+
+def _parse_day(ctx, param, value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+    except ValueError:
+        raise click.BadParameter('use YYYY-MM-DD')
+
+@app.cli.command('snapshot-occupancy')
+@property_option
+@click.option('--date', 'day', callback=_parse_day, help='Day to record (default: today), YYYY-MM-DD.')
+def snapshot_occupancy_command(day):
+    """Records today's per-room occupancy and refreshes the trend rollups (run daily)."""
+    db_session = current_property().sessions()
+    try:
+        rooms = capture_snapshot(db_session, day)
+        db_session.commit()
+    finally:
+        db_session.close()
+    click.echo(f'Recorded occupancy of {rooms} rooms.')
+
+@app.cli.command('backfill-occupancy')
+@property_option
+@click.option('--since', callback=_parse_day, help='First day (default: the earliest joining date).')
+@click.option('--until', callback=_parse_day, help='Last day (default: yesterday).')
+def backfill_occupancy_command(since, until):
+    """Fills in daily occupancy history from residents' joining and leaving dates."""
+    db_session = current_property().sessions()
+    try:
+        days = backfill(db_session, since, until)
+        db_session.commit()
+    finally:
+        db_session.close()
+    click.echo(f'Back-filled {days} days.')
+
+@app.cli.command('archive-departed')
+@property_option
+@click.option('--retention-days', type=int, help='Keep residents who left more recently than this (default: ARCHIVE_RETENTION_DAYS).')
+def archive_departed_command(retention_days):
+    """Moves long-departed residents and their payments into the archive tables (run periodically)."""
+    if retention_days is None:
+        retention_days = app.config['ARCHIVE_RETENTION_DAYS']
+    db_session = current_property().sessions()
+    try:
+        persons, payments = archive_departed(db_session, retention_days)
+    finally:
+        db_session.close()
+    click.echo(f'Archived {persons} residents and {payments} payment records.')
+
+@app.cli.command('migrate-payments')
+@property_option
+def migrate_payments_command():
+    """Moves the month-name payments (payments, archived_payments) into the year-aware ledger."""
+    db_session = current_property().sessions()
+    try:
+        migrated = migrate_payments(db_session)
+    finally:
+        db_session.close()
+    click.echo(f'Migrated {migrated} payments into the ledger.')
+
+@app.cli.command('split-eb')
+@property_option
+@click.argument('month')
+def split_eb_command(month):
+    """Splits the stored meter readings of MONTH (YYYY-MM) across the rooms' residents again."""
+    try:
+        start = parse_month(month)[0]
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='MONTH')
+    db_session = current_property().sessions()
+    try:
+        result = split_bills(db_session, start.year, start.month)
+        db_session.commit()
+    finally:
+        db_session.close()
+    click.echo(f'Split {result.amount} across {result.residents} residents of {result.rooms} rooms '
+               f'in {result.seconds:.2f}s.')
+    if result.unbilled_rooms:
+        click.echo(f'No resident stayed in room(s) {", ".join(map(str, result.unbilled_rooms))}; '
+                   f'their bills were not split.', err=True)
+
+@app.cli.command('check-query-plans')
+@click.option('--url', default='sqlite://', help='Scratch database to build, seed and EXPLAIN against.')
+def check_query_plans_command(url):
+    """Fails if any hot route query falls back to a full table scan."""
+    plans, problems = check_query_plans(url)
+    for name, lines in plans.items():
+        click.echo(f'{"FULL SCAN" if name in problems else "ok":>9}  {name}')
+        for line in lines:
+            click.echo(f'           {line}')
+    if problems:
+        raise SystemExit(1)
+
 if __name__ == '__main__':
     # Set the secret key for sessions and flash messages
     app.secret_key = Config.SECRET_KEY
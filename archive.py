@@ -0,0 +1,65 @@
+from datetime import date, datetime, timedelta
+from sqlalchemy import select, insert, delete, exists, literal, and_
+from database import Bed, Person, Payment, PaymentLedger, ArchivedPerson, ArchivedPayment, ArchivedPaymentLedger
+from queries import EB_COLUMNS
+
+# Residents moved per transaction
+ARCHIVE_BATCH_SIZE = 1000
+
+
+def archive_departed(db_session, retention_days, batch_size=ARCHIVE_BATCH_SIZE, today=None):
+    """
+    Moves residents who left more than retention_days ago, with their
+    ledger years and any month-name payments not yet migrated, into the
+    archived_* tables.
+
+    Each batch is copied with INSERT ... SELECT and deleted in its own
+    transaction, so locks stay short and an interrupted run simply resumes.
+    Archived rows get new ids (persons ids are reused); their payments are
+    re-pointed at the archived resident by (person_id, archived_at).
+    Residents still referenced by a bed are left alone. Returns
+    (residents, payment records) archived, a ledger year counting as one.
+    """
+    cutoff = (today or date.today()) - timedelta(days=retention_days)
+    departed = (
+        select(Person.id)
+        .where(Person.leaving_date != None, Person.leaving_date < cutoff)
+        .where(~exists().where(Bed.person_id == Person.id))
+        .order_by(Person.id)
+        .limit(batch_size)
+    )
+    persons = payments = 0
+    while True:
+        ids = db_session.scalars(departed).all()
+        if not ids:
+            return persons, payments
+        archived_at = literal(datetime.now(), ArchivedPerson.archived_at.type)
+        db_session.execute(insert(ArchivedPerson).from_select(
+            ['person_id', 'name', 'aadhar', 'joining_date', 'leaving_date', 'room_id', 'archived_at'],
+            select(Person.id, Person.name, Person.aadhar, Person.joining_date, Person.leaving_date, Person.room_id,
+                   archived_at)
+            .where(Person.id.in_(ids)),
+        ))
+
+        def archived(person_id):
+            # This batch's copy of the resident
+            return and_(ArchivedPerson.person_id == person_id, ArchivedPerson.archived_at == archived_at)
+        copied = db_session.execute(insert(ArchivedPayment).from_select(
+            ['person_id', 'month', 'status', 'eb_amount'],
+            select(ArchivedPerson.id, Payment.month, Payment.status, Payment.eb_amount)
+            .join(ArchivedPerson, archived(Payment.person_id))
+            .where(Payment.person_id.in_(ids)),
+        ))
+        ledger_columns = ['year', 'paid_mask', *EB_COLUMNS]
+        copied_years = db_session.execute(insert(ArchivedPaymentLedger).from_select(
+            ['person_id', *ledger_columns],
+            select(ArchivedPerson.id, *[getattr(PaymentLedger, column) for column in ledger_columns])
+            .join(ArchivedPerson, archived(PaymentLedger.person_id))
+            .where(PaymentLedger.person_id.in_(ids)),
+        ))
+        db_session.execute(delete(PaymentLedger).where(PaymentLedger.person_id.in_(ids)))
+        db_session.execute(delete(Payment).where(Payment.person_id.in_(ids)))
+        db_session.execute(delete(Person).where(Person.id.in_(ids)))
+        db_session.commit()
+        persons += len(ids)
+        payments += max(copied.rowcount, 0) + max(copied_years.rowcount, 0)
@@ -0,0 +1,464 @@
+"""
+Benchmarks for the hostel app. Each subcommand prints a JSON report.
+
+    python benchmarks.py startup --runs 5
+    python benchmarks.py seed --database-url sqlite:///demo.db --size medium
+    python benchmarks.py routes --sizes small,medium --output routes.json
+    python benchmarks.py routes --baseline routes.json   # exits 1 on a regression
+    python benchmarks.py provision --floors 10 --rooms-per-floor 250 --beds-per-room 4
+    python benchmarks.py eb-split --blocks 10 --rooms 300 --beds 4
+"""
+import argparse
+import contextlib
+import json
+import math
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def _time_python(code, env, runs):
+    """Wall-clock seconds of `python -c code` in a fresh interpreter, once per run."""
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], cwd=HERE, env=env, check=True,
+                       stdout=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def _summary(timings):
+    return {
+        'runs': len(timings),
+        'median_ms': round(statistics.median(timings) * 1000, 1),
+        'min_ms': round(min(timings) * 1000, 1),
+        'max_ms': round(max(timings) * 1000, 1),
+    }
+
+
+def bench_startup(args):
+    """
+    Compares a worker boot (importing the app) with the old boot, which also
+    ran create_all() and the admin check at import time.
+    """
+    env = dict(os.environ)
+    scratch = None
+    if not args.database_url:
+        scratch = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+        scratch.close()
+        env['DATABASE_URL'] = f'sqlite:///{scratch.name}'
+    else:
+        env['DATABASE_URL'] = args.database_url
+    try:
+        # The schema must exist for the app to serve requests either way
+        subprocess.run([sys.executable, '-c', 'from database import init_db; init_db()'],
+                       cwd=HERE, env=env, check=True, stdout=subprocess.DEVNULL)
+        worker_boot = _time_python('import app', env, args.runs)
+        legacy_boot = _time_python('import app; from database import init_db; init_db()', env, args.runs)
+    finally:
+        if scratch:
+            os.unlink(scratch.name)
+
+    report = {
+        'benchmark': 'startup',
+        'worker_boot': _summary(worker_boot),
+        'boot_with_ddl': _summary(legacy_boot),
+    }
+    report['saved_ms_per_worker'] = round(
+        report['boot_with_ddl']['median_ms'] - report['worker_boot']['median_ms'], 1
+    )
+    return report
+
+
+def _use_database(url, workdir):
+    """Points the app modules (imported after this) at url, with a private data version file."""
+    os.environ['DATABASE_URL'] = url
+    os.environ['DATA_VERSION_FILE'] = os.path.join(workdir, 'data-version')
+
+
+def _size_counts(args):
+    if args.size:
+        from seed_data import SIZES
+        return SIZES[args.size]
+    return args.blocks, args.rooms, args.beds
+
+
+def bench_seed(args):
+    """Creates the schema at --database-url and adds a synthetic hostel to it."""
+    _use_database(args.database_url, tempfile.gettempdir())
+    import database
+    from seed_data import generate_hostel
+    with contextlib.redirect_stdout(sys.stderr):
+        database.init_db()
+    blocks, rooms, beds = _size_counts(args)
+    started = time.perf_counter()
+    counts = generate_hostel(database.engine, blocks, rooms, beds, occupancy=args.occupancy,
+                             departed_ratio=args.departed_ratio, workers=args.workers, seed=args.seed)
+    return {'benchmark': 'seed', 'rows': counts, 'seconds': round(time.perf_counter() - started, 2)}
+
+
+def _provision_one_by_one(db_session, block_name, floors, rooms_per_floor, beds_per_room):
+    """The add_room form's way, repeated for every room: one ORM object per bed, flushed per room."""
+    from database import Block, Room, Bed
+    from provisioning import room_names
+    block = Block(name=block_name)
+    db_session.add(block)
+    db_session.flush()
+    for name in room_names(block_name, floors, rooms_per_floor):
+        room = Room(name=name, bed_count=beds_per_room, block_id=block.id)
+        db_session.add(room)
+        for number in range(1, beds_per_room + 1):
+            db_session.add(Bed(bed_number=number, room=room))
+        db_session.flush()
+
+
+def bench_provision(args):
+    """
+    Times creating one block of floors x rooms x beds with provision_block
+    and with per-bed ORM inserts, each committed on an empty database.
+    """
+    workdir = tempfile.mkdtemp(prefix='hostel-bench-')
+    url = args.database_url or f'sqlite:///{os.path.join(workdir, "provision.db")}'
+    _use_database(url, workdir)
+    try:
+        import database
+        from provisioning import provision_block
+        from sqlalchemy.orm import sessionmaker
+        session_factory = sessionmaker(bind=database.engine)
+
+        def run(label, create):
+            timings = []
+            for run_number in range(args.runs):
+                database.Base.metadata.drop_all(database.engine)
+                database.Base.metadata.create_all(database.engine)
+                db_session = session_factory()
+                try:
+                    started = time.perf_counter()
+                    create(db_session, f'{label} {run_number}', args.floors, args.rooms_per_floor, args.beds_per_room)
+                    db_session.commit()
+                    timings.append(time.perf_counter() - started)
+                finally:
+                    db_session.close()
+            return _summary(timings)
+
+        report = {
+            'benchmark': 'provision',
+            'database': database.engine.dialect.name,
+            'beds': args.floors * args.rooms_per_floor * args.beds_per_room,
+            'bulk': run('Bulk', provision_block),
+        }
+        if not args.skip_orm:
+            report['orm_per_bed'] = run('ORM', _provision_one_by_one)
+            report['speedup'] = round(report['orm_per_bed']['median_ms'] / max(report['bulk']['median_ms'], 0.1), 1)
+        return report
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _split_per_person(db_session, year, month):
+    """The same split done resident by resident in Python, each share written through the ORM."""
+    from sqlalchemy import select, func, or_
+    from database import Bed, Person, PaymentLedger, MeterReading
+    from queries import EB_COLUMNS, _month_range
+    start, end = _month_range(year, month)
+    column = EB_COLUMNS[month - 1]
+    readings = dict(db_session.execute(
+        select(MeterReading.room_id, MeterReading.amount).where(MeterReading.year == year, MeterReading.month == month)
+    ).all())
+    stays = {}
+    for room_id, person_id, joined, left in db_session.execute(
+        select(func.coalesce(Person.room_id, Bed.room_id), Person.id, Person.joining_date, Person.leaving_date)
+        .select_from(Person)
+        .outerjoin(Bed, Bed.person_id == Person.id)
+        .where(Person.joining_date < end, or_(Person.leaving_date == None, Person.leaving_date >= start))
+    ):
+        if room_id in readings:
+            days = max(min(left or end, end) - max(joined, start), timedelta(0)).days
+            stays.setdefault(room_id, []).append((person_id, days))
+    for room_id, residents in stays.items():
+        total = sum(days for _, days in residents)
+        for person_id, days in residents:
+            share = readings[room_id] * days // total if total else 0
+            entry = db_session.query(PaymentLedger).filter_by(person_id=person_id, year=year).first()
+            if not entry:
+                entry = PaymentLedger(person_id=person_id, year=year, paid_mask=0)
+                db_session.add(entry)
+            setattr(entry, column, share)
+
+
+def bench_eb_split(args):
+    """
+    Times splitting one month's bill of every room across its residents
+    with split_bills (NumPy, one bulk upsert) and resident by resident.
+    """
+    workdir = tempfile.mkdtemp(prefix='hostel-bench-')
+    url = args.database_url or f'sqlite:///{os.path.join(workdir, "billing.db")}'
+    _use_database(url, workdir)
+    try:
+        import random
+        import database
+        from billing import split_bills
+        from seed_data import generate_hostel
+        from sqlalchemy import select, func, insert
+        from sqlalchemy.orm import sessionmaker
+        with contextlib.redirect_stdout(sys.stderr):
+            database.Base.metadata.drop_all(database.engine)
+            database.init_db()
+        generate_hostel(database.engine, args.blocks, args.rooms, args.beds, occupancy=args.occupancy,
+                        departed_ratio=0, workers=0, seed=args.seed)
+        today = date.today()
+        year, month = (today.year, today.month - 1) if today.month > 1 else (today.year - 1, 12)
+        rng = random.Random(args.seed)
+        session_factory = sessionmaker(bind=database.engine)
+        with database.engine.begin() as connection:
+            room_ids = connection.scalars(select(database.Room.id)).all()
+            connection.execute(insert(database.MeterReading), [
+                {'room_id': room_id, 'year': year, 'month': month, 'amount': rng.randrange(200, 3000)}
+                for room_id in room_ids
+            ])
+            residents = connection.scalar(select(func.count(database.Bed.person_id)))
+
+        def run(split):
+            timings = []
+            for _ in range(args.runs):
+                db_session = session_factory()
+                try:
+                    started = time.perf_counter()
+                    split(db_session, year, month)
+                    db_session.commit()
+                    timings.append(time.perf_counter() - started)
+                finally:
+                    db_session.close()
+            return _summary(timings)
+
+        report = {
+            'benchmark': 'eb-split',
+            'database': database.engine.dialect.name,
+            'rooms': len(room_ids),
+            'residents': residents,
+            'vectorised': run(split_bills),
+        }
+        if not args.skip_loop:
+            report['per_person'] = run(_split_per_person)
+            report['speedup'] = round(report['per_person']['median_ms'] / max(report['vectorised']['median_ms'], 0.1), 1)
+        return report
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _route_cases():
+    """(name, method, path, form data for iteration n) for every route under test."""
+    month = f'{date.today():%m}'
+    return [
+        ('profile', 'GET', '/profile', None),
+        ('build', 'GET', '/build', None),
+        ('build: add person', 'POST', '/build', lambda n: {
+            'action': 'add_person', 'person_name': f'Bench {n}', 'aadhar': str(7000000000 + n),
+            'joining_date': '2024-01-01',
+        }),
+        ('accommodate', 'GET', '/accommodate', None),
+        ('accommodate: bed snapshot', 'GET', '/accommodate/beds', None),
+        ('filter_accommodate', 'POST', '/accommodate/filter', lambda n: {'block_filter': '1', 'occupied_status': 'empty'}),
+        ('payments', 'GET', '/payments', None),
+        ('payments: room search', 'POST', '/payments', lambda n: {'room_name': '1-1'}),
+        ('guests', 'GET', '/guests', None),
+        ('guests: leaving month', 'GET', f'/guests?month_filter={month}', None),
+        ('staff', 'GET', '/staff', None),
+    ]
+
+
+def _percentile(sorted_values, percent):
+    index = max(0, math.ceil(percent / 100 * len(sorted_values)) - 1)
+    return round(sorted_values[index] * 1000, 2)
+
+
+def _measure_route(appmod, client, counter, case, iterations, cold):
+    """
+    Runs one route iterations times (after a warm-up request) and returns its
+    latency percentiles, SQL statements per request and the peak Python
+    memory of a separate, traced request.
+    """
+    name, method, path, data = case
+    n = 0
+
+    def request():
+        nonlocal n
+        n += 1
+        if cold:
+            # Measure the render path, not the page and counter caches
+            appmod.page_cache.clear()
+            appmod.occupancy_cache.invalidate()
+            appmod.free_beds.invalidate()
+        counter[0] = 0
+        started = time.perf_counter()
+        response = client.open(path, method=method, data=data(n) if data else None)
+        response.get_data()
+        return response.status_code, time.perf_counter() - started, counter[0]
+
+    request()
+    timings, statements, statuses = [], [], set()
+    for _ in range(iterations):
+        status, seconds, count = request()
+        timings.append(seconds)
+        statements.append(count)
+        statuses.add(status)
+
+    tracemalloc.start()
+    try:
+        request()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    timings.sort()
+    return {
+        'method': method,
+        'path': path,
+        'status': sorted(statuses),
+        'p50_ms': _percentile(timings, 50),
+        'p95_ms': _percentile(timings, 95),
+        'p99_ms': _percentile(timings, 99),
+        'max_ms': round(timings[-1] * 1000, 2),
+        'statements': max(statements),
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def _regressions(report, baseline, tolerance, floor_ms):
+    """Routes whose p95 or statement count got worse than in the baseline report."""
+    found = []
+    for size, result in report['sizes'].items():
+        before = baseline.get('sizes', {}).get(size, {}).get('routes', {})
+        for name, now in result['routes'].items():
+            then = before.get(name)
+            if not then:
+                continue
+            if now['p95_ms'] > then['p95_ms'] * (1 + tolerance) and now['p95_ms'] - then['p95_ms'] > floor_ms:
+                found.append(f'{size} {name}: p95 {then["p95_ms"]} ms -> {now["p95_ms"]} ms')
+            if now['statements'] > then['statements']:
+                found.append(f'{size} {name}: {then["statements"]} -> {now["statements"]} SQL statements')
+    return found
+
+
+def bench_routes(args):
+    """
+    Seeds a database at each size and drives every route through the Flask
+    test client. Uses a scratch SQLite file unless --database-url is given;
+    that database is emptied before each size.
+    """
+    workdir = tempfile.mkdtemp(prefix='hostel-bench-')
+    try:
+        _use_database(args.database_url or f'sqlite:///{os.path.join(workdir, "bench.db")}', workdir)
+        from sqlalchemy import event
+        import database
+        import app as appmod
+        from seed_data import SIZES, generate_hostel
+
+        counter = [0]
+        event.listen(database.engine, 'before_cursor_execute', lambda *a: counter.__setitem__(0, counter[0] + 1))
+        appmod.app.config['TESTING'] = True
+
+        report = {'benchmark': 'routes', 'dialect': database.engine.dialect.name,
+                  'iterations': args.iterations, 'cold': not args.warm, 'sizes': {}}
+        for size in args.sizes.split(','):
+            with contextlib.redirect_stdout(sys.stderr):
+                database.Base.metadata.drop_all(database.engine)
+                database.init_db()
+            rows = generate_hostel(database.engine, *SIZES[size])
+            appmod.page_cache.clear()
+            appmod.occupancy_cache.invalidate()
+            appmod.free_beds.invalidate()
+
+            client = appmod.app.test_client()
+            with client.session_transaction() as session:
+                session['logged_in'] = True
+            routes = {}
+            for case in _route_cases():
+                routes[case[0]] = _measure_route(appmod, client, counter, case, args.iterations, cold=not args.warm)
+            report['sizes'][size] = {'rows': rows, 'routes': routes}
+        database.engine.dispose()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            report['regressions'] = _regressions(report, json.load(f), args.tolerance, args.floor_ms)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    startup = commands.add_parser('startup', help='Worker boot time with and without import-time DDL.')
+    startup.add_argument('--runs', type=int, default=5)
+    startup.add_argument('--database-url', help='Database to boot against (default: a scratch SQLite file).')
+    startup.set_defaults(run=bench_startup)
+
+    seed = commands.add_parser('seed', help='Create the schema and add a synthetic hostel to a database.')
+    seed.add_argument('--database-url', required=True)
+    seed.add_argument('--size', choices=['small', 'medium', 'large'],
+                      help='Named size; otherwise --blocks/--rooms/--beds.')
+    seed.add_argument('--blocks', type=int, default=5)
+    seed.add_argument('--rooms', type=int, default=10, help='Rooms per block.')
+    seed.add_argument('--beds', type=int, default=4, help='Beds per room.')
+    seed.add_argument('--occupancy', type=float, default=0.7, help='Share of beds with a current resident.')
+    seed.add_argument('--departed-ratio', type=float, default=0.5, help='Former residents per current one.')
+    seed.add_argument('--workers', type=int, default=20)
+    seed.add_argument('--seed', type=int, default=7)
+    seed.set_defaults(run=bench_seed)
+
+    routes = commands.add_parser('routes', help='Latency, SQL statements and memory of every route at several sizes.')
+    routes.add_argument('--sizes', default='small,medium', help='Comma-separated: small, medium, large.')
+    routes.add_argument('--iterations', type=int, default=20)
+    routes.add_argument('--warm', action='store_true', help='Let the page and counter caches serve repeat requests.')
+    routes.add_argument('--database-url', help='Database to benchmark against; it is emptied first (default: scratch SQLite).')
+    routes.add_argument('--output', help='Also write the report to this file.')
+    routes.add_argument('--baseline', help='Earlier report to compare against; exit 1 on a regression.')
+    routes.add_argument('--tolerance', type=float, default=0.25, help='Allowed p95 slowdown as a fraction.')
+    routes.add_argument('--floor-ms', type=float, default=2.0, help='Ignore p95 slowdowns smaller than this.')
+    routes.set_defaults(run=bench_routes)
+
+    provision = commands.add_parser('provision', help='Time bulk block provisioning against per-bed ORM inserts.')
+    provision.add_argument('--floors', type=int, default=10)
+    provision.add_argument('--rooms-per-floor', type=int, default=250)
+    provision.add_argument('--beds-per-room', type=int, default=4)
+    provision.add_argument('--runs', type=int, default=5)
+    provision.add_argument('--skip-orm', action='store_true', help='Only time provision_block.')
+    provision.add_argument('--database-url', help='Database to benchmark against; it is emptied first (default: scratch SQLite).')
+    provision.set_defaults(run=bench_provision)
+
+    eb_split = commands.add_parser('eb-split', help='Time the NumPy EB bill split against a per-resident loop.')
+    eb_split.add_argument('--blocks', type=int, default=10)
+    eb_split.add_argument('--rooms', type=int, default=300, help='Rooms per block.')
+    eb_split.add_argument('--beds', type=int, default=4, help='Beds per room.')
+    eb_split.add_argument('--occupancy', type=float, default=0.9, help='Share of beds with a current resident.')
+    eb_split.add_argument('--seed', type=int, default=7)
+    eb_split.add_argument('--runs', type=int, default=5)
+    eb_split.add_argument('--skip-loop', action='store_true', help='Only time split_bills.')
+    eb_split.add_argument('--database-url', help='Database to benchmark against; it is emptied first (default: scratch SQLite).')
+    eb_split.set_defaults(run=bench_eb_split)
+
+    args = parser.parse_args(argv)
+    report = args.run(args)
+    print(json.dumps(report, indent=2))
+    if getattr(args, 'output', None):
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if report.get('regressions'):
+        for line in report['regressions']:
+            print(f'REGRESSION {line}', file=sys.stderr)
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+import time
+from collections import namedtuple
+import numpy as np
+from sqlalchemy import select, delete, insert, func, or_
+from database import Room, Bed, Person, MeterReading
+from ledger import upsert_eb_amounts
+from queries import _month_range
+
+BillSplit = namedtuple('BillSplit', ['rooms', 'residents', 'amount', 'unbilled_rooms', 'seconds'])
+
+
+class BillingError(ValueError):
+    """Raised when a month's meter readings are malformed; nothing is written."""
+
+
+def save_readings(db_session, year, month, readings):
+    """
+    Stores rooms' bills for the month from [{room_id, amount}, ...],
+    replacing any earlier reading of those rooms for it; the caller commits.
+    """
+    if not isinstance(readings, list) or not readings:
+        raise BillingError('Expected a list of meter readings.')
+    amounts = {}
+    for index, reading in enumerate(readings):
+        try:
+            room_id, amount = int(reading['room_id']), int(reading['amount'])
+        except (TypeError, KeyError, ValueError):
+            raise BillingError(f'Reading {index} needs an integer room_id and amount.')
+        if amount < 0:
+            raise BillingError(f'Reading {index} has a negative amount.')
+        amounts[room_id] = amount
+    known = set(db_session.scalars(select(Room.id).where(Room.id.in_(list(amounts)))))
+    unknown = sorted(set(amounts) - known)
+    if unknown:
+        raise BillingError(f'Unknown room id(s): {", ".join(map(str, unknown))}.')
+
+    db_session.execute(delete(MeterReading).where(MeterReading.year == year, MeterReading.month == month,
+                                                  MeterReading.room_id.in_(list(amounts))))
+    db_session.execute(insert(MeterReading), [{'room_id': room_id, 'year': year, 'month': month, 'amount': amount}
+                                              for room_id, amount in amounts.items()])
+    return len(amounts)
+
+
+def split_shares(room_ids, amounts, stay_rooms, days):
+    """
+    Splits each room's bill across its residents in proportion to their
+    days, in whole rupees.
+
+    room_ids (sorted) and amounts describe the rooms; stay_rooms and days
+    the residents. Everything is done on whole arrays: days per room with
+    bincount, exact shares, then the rupees lost by rounding down go one
+    each to the residents with the largest fractions, so every room's
+    shares add up to its bill. Returns (shares, billed) per resident,
+    billed being False in rooms nobody stayed in.
+    """
+    room_index = np.searchsorted(room_ids, stay_rooms)
+    room_days = np.bincount(room_index, weights=days, minlength=len(room_ids))
+    resident_room_days = room_days[room_index]
+    billed = resident_room_days > 0
+    exact = np.where(billed, amounts[room_index] * days / np.where(billed, resident_room_days, 1), 0.0)
+    shares = np.floor(exact).astype(np.int64)
+
+    leftover = amounts - np.bincount(room_index, weights=shares, minlength=len(room_ids)).astype(np.int64)
+    leftover[room_days == 0] = 0
+    # By room, biggest fraction first; a resident's rank within its room
+    # decides whether it gets one of the room's leftover rupees
+    order = np.lexsort((shares - exact, room_index))
+    grouped = room_index[order]
+    rank = np.arange(len(order)) - np.searchsorted(grouped, grouped)
+    shares[order] += (rank < leftover[grouped]).astype(np.int64)
+    return shares, billed
+
+
+def split_bills(db_session, year, month):
+    """
+    Splits the month's meter readings across each room's residents, pro
+    rata by the days of the month they stayed (joining day included,
+    leaving day not), and writes every share into the ledger's EB column
+    for the month with one bulk upsert. Residents are matched to rooms
+    through the room recorded for their stay, which is kept when they
+    leave, so one who left during the month pays for the days they were
+    there; residents placed before rooms were recorded fall back to their
+    current bed. Archived residents are not billed. Returns a BillSplit;
+    the caller commits.
+    """
+    started = time.perf_counter()
+    start, end = _month_range(year, month)
+    readings = db_session.execute(
+        select(MeterReading.room_id, MeterReading.amount)
+        .where(MeterReading.year == year, MeterReading.month == month)
+        .order_by(MeterReading.room_id)
+    ).all()
+    if not readings:
+        return BillSplit(0, 0, 0, [], time.perf_counter() - started)
+    room_ids = np.array([room_id for room_id, _ in readings], dtype=np.int64)
+    amounts = np.array([amount for _, amount in readings], dtype=np.int64)
+
+    stay_room = func.coalesce(Person.room_id, Bed.room_id)
+    stays = db_session.execute(
+        select(stay_room, Person.id, Person.joining_date, func.coalesce(Person.leaving_date, end))
+        .select_from(Person)
+        .outerjoin(Bed, Bed.person_id == Person.id)
+        .where(stay_room.in_(select(MeterReading.room_id)
+                             .where(MeterReading.year == year, MeterReading.month == month)))
+        .where(Person.joining_date < end, or_(Person.leaving_date == None, Person.leaving_date >= start))
+    ).all()
+    if stays:
+        stay_rooms, person_ids, joined, left = (np.array(column) for column in zip(*stays))
+        stay_rooms = stay_rooms.astype(np.int64)
+        joined = joined.astype('datetime64[D]')
+        left = left.astype('datetime64[D]')
+    else:
+        stay_rooms = person_ids = np.zeros(0, dtype=np.int64)
+        joined = left = np.zeros(0, dtype='datetime64[D]')
+
+    first, last = np.datetime64(start, 'D'), np.datetime64(end, 'D')
+    days = (np.minimum(left, last) - np.maximum(joined, first)).astype(np.int64).clip(min=0)
+    shares, billed = split_shares(room_ids, amounts, stay_rooms, days)
+
+    upsert_eb_amounts(db_session, year, month - 1, person_ids[billed].tolist(), shares[billed].tolist())
+    unbilled = np.setdiff1d(room_ids, stay_rooms[billed]).tolist()
+    return BillSplit(len(room_ids) - len(unbilled), int(billed.sum()), int(shares[billed].sum()), unbilled,
+                     time.perf_counter() - started)
@@ -0,0 +1,251 @@
+import csv
+import io
+import time
+from datetime import datetime
+from sqlalchemy import select, insert
+from database import Block, Room, Bed, Person
+
+# Expected header of an import file. One row per resident; a room with no
+# residents (or with spare beds) can also be listed with the person columns
+# left blank. All rows of a room must be consecutive, and bed_count only
+# needs to be given on the room's first row.
+IMPORT_COLUMNS = ['block', 'room', 'bed_count', 'name', 'mobile', 'joining_date']
+
+# Beds written per batch of multi-row INSERTs (or per COPY on PostgreSQL)
+BATCH_SIZE = 1000
+
+# Stop collecting validation errors after this many; the import is rejected anyway
+MAX_ERRORS = 50
+
+
+class ImportResult:
+    """Summary of a bulk import: what was written, how fast, and what was rejected."""
+
+    def __init__(self):
+        self.rows = 0
+        self.blocks = 0
+        self.rooms = 0
+        self.beds = 0
+        self.persons = 0
+        self.seconds = 0.0
+        self.errors = []
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    @property
+    def rows_per_second(self):
+        return round(self.rows / self.seconds) if self.seconds > 0 else 0
+
+    def summary(self):
+        return (f'{self.rows} rows imported in {self.seconds:.2f}s ({self.rows_per_second} rows/sec): '
+                f'{self.blocks} blocks, {self.rooms} rooms, {self.beds} beds, {self.persons} residents.')
+
+
+class _PendingRoom:
+    """A room read from the file, waiting to be written with its residents."""
+
+    def __init__(self, block_name, name, bed_count, line):
+        self.block_name = block_name
+        self.name = name
+        self.bed_count = bed_count
+        self.line = line
+        self.residents = []
+
+
+def _copy_beds(connection, rows):
+    """Streams bed rows into PostgreSQL with COPY ... FROM STDIN."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([row['room_id'], row['bed_number'], 't' if row['is_occupied'] else 'f',
+                         row['person_id'] if row['person_id'] is not None else ''])
+    buffer.seek(0)
+    cursor = connection.connection.driver_connection.cursor()
+    try:
+        cursor.copy_expert(
+            'COPY beds (room_id, bed_number, is_occupied, person_id) FROM STDIN WITH (FORMAT csv)', buffer
+        )
+    finally:
+        cursor.close()
+
+
+class _Importer:
+    """Validates rows as they stream in and writes them in batches on one connection."""
+
+    def __init__(self, db_session, result):
+        self.connection = db_session.connection()
+        self.result = result
+        self.use_copy = self.connection.dialect.name == 'postgresql' and self.connection.dialect.driver == 'psycopg2'
+        self.block_ids = {name: block_id for block_id, name in self.connection.execute(select(Block.id, Block.name))}
+        self.seen_rooms = set()
+        self.seen_mobiles = set()
+        self.batch = []
+        self.batch_beds = 0
+
+    def error(self, line, message):
+        if len(self.result.errors) < MAX_ERRORS:
+            self.result.errors.append(f'Line {line}: {message}')
+
+    def add_room(self, room):
+        key = (room.block_name, room.name)
+        if key in self.seen_rooms:
+            self.error(room.line, f'rows for room "{room.name}" in block "{room.block_name}" are not consecutive.')
+            return
+        self.seen_rooms.add(key)
+        self.batch.append(room)
+        self.batch_beds += room.bed_count
+        if self.batch_beds >= BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        """Writes the pending batch unless a validation error has already doomed the import."""
+        batch, self.batch, self.batch_beds = self.batch, [], 0
+        if not batch or self.result.errors:
+            return
+        conn = self.connection
+
+        # Residents that are already on file would violate the unique constraint
+        mobile_lines = {resident['aadhar']: line for room in batch for resident, line in room.residents}
+        if mobile_lines:
+            for (mobile,) in conn.execute(select(Person.aadhar).where(Person.aadhar.in_(list(mobile_lines)))):
+                self.error(mobile_lines[mobile], f'a resident with mobile number {mobile} already exists.')
+        room_lines = {(room.block_name, room.name): room.line for room in batch}
+        existing_rooms = conn.execute(
+            select(Block.name, Room.name)
+            .join(Room, Room.block_id == Block.id)
+            .where(Room.name.in_({room.name for room in batch}))
+        ).all()
+        for key in existing_rooms:
+            if tuple(key) in room_lines:
+                self.error(room_lines[tuple(key)], f'room "{key[1]}" already exists in block "{key[0]}".')
+        if self.result.errors:
+            return
+
+        for room in batch:
+            if room.block_name not in self.block_ids:
+                self.block_ids[room.block_name] = conn.execute(
+                    insert(Block).values(name=room.block_name).returning(Block.id)
+                ).scalar_one()
+                self.result.blocks += 1
+
+        # Plain executemany keeps the driver on its batched path; the generated
+        # ids are then read back in one query through keys the batch made unique
+        # (a room's name within its block, a resident's mobile number).
+        conn.execute(
+            insert(Room),
+            [{'name': room.name, 'bed_count': room.bed_count, 'block_id': self.block_ids[room.block_name]}
+             for room in batch],
+        )
+        room_ids = {
+            (block_id, name): room_id
+            for room_id, block_id, name in conn.execute(
+                select(Room.id, Room.block_id, Room.name).where(Room.name.in_({room.name for room in batch}))
+            )
+        }
+
+        person_rows = [dict(resident, room_id=room_ids[(self.block_ids[room.block_name], room.name)])
+                       for room in batch for resident, _ in room.residents]
+        person_ids = {}
+        if person_rows:
+            conn.execute(insert(Person), person_rows)
+            person_ids = dict(conn.execute(
+                select(Person.aadhar, Person.id).where(Person.aadhar.in_([row['aadhar'] for row in person_rows]))
+            ).all())
+
+        bed_rows = []
+        for room in batch:
+            room_id = room_ids[(self.block_ids[room.block_name], room.name)]
+            for bed_number in range(1, room.bed_count + 1):
+                person_id = None
+                if bed_number <= len(room.residents):
+                    person_id = person_ids[room.residents[bed_number - 1][0]['aadhar']]
+                bed_rows.append({'room_id': room_id, 'bed_number': bed_number,
+                                 'is_occupied': person_id is not None, 'person_id': person_id})
+        if self.use_copy:
+            _copy_beds(conn, bed_rows)
+        else:
+            conn.execute(insert(Bed), bed_rows)
+
+        self.result.rooms += len(batch)
+        self.result.beds += len(bed_rows)
+        self.result.persons += len(person_rows)
+
+
+def import_csv(db_session, stream):
+    """
+    Imports blocks, rooms, beds and residents from a CSV text stream.
+
+    Rows are validated as they are read and written in batches of about
+    BATCH_SIZE beds: residents and rooms with batched executemany INSERTs,
+    beds with COPY on PostgreSQL (psycopg2) and executemany elsewhere. Blocks
+    that do not exist yet are created. Everything happens in the session's
+    transaction: it is rolled back when any row is invalid, and otherwise
+    left for the caller to commit, together with whatever else the import
+    goes with.
+    """
+    result = ImportResult()
+    started = time.perf_counter()
+    reader = csv.reader(stream)
+
+    header = [column.strip().lower() for column in next(reader, [])]
+    if header != IMPORT_COLUMNS:
+        result.errors.append(f'Expected the header "{",".join(IMPORT_COLUMNS)}".')
+        return result
+
+    importer = _Importer(db_session, result)
+    room = None
+    for line, row in enumerate(reader, start=2):
+        if not any(cell.strip() for cell in row):
+            continue
+        if len(row) != len(IMPORT_COLUMNS):
+            importer.error(line, f'expected {len(IMPORT_COLUMNS)} columns, found {len(row)}.')
+            continue
+        block_name, room_name, bed_count, name, mobile, joining_date = (cell.strip() for cell in row)
+        result.rows += 1
+
+        if not block_name or not room_name:
+            importer.error(line, 'block and room are required.')
+            continue
+        if room is None or (room.block_name, room.name) != (block_name, room_name):
+            if room is not None:
+                importer.add_room(room)
+            try:
+                room = _PendingRoom(block_name, room_name, int(bed_count), line)
+            except ValueError:
+                importer.error(line, f'bed_count "{bed_count}" is not a number.')
+                room = None
+                continue
+            if room.bed_count < 1:
+                importer.error(line, 'bed_count must be at least 1.')
+        elif bed_count and bed_count != str(room.bed_count):
+            importer.error(line, f'bed_count {bed_count} disagrees with {room.bed_count} given on line {room.line}.')
+
+        if not (name or mobile or joining_date):
+            continue
+        if not (name and mobile and joining_date):
+            importer.error(line, 'name, mobile and joining_date must all be given for a resident.')
+            continue
+        try:
+            joined = datetime.strptime(joining_date, '%Y-%m-%d').date()
+        except ValueError:
+            importer.error(line, f'joining_date "{joining_date}" is not in YYYY-MM-DD format.')
+            continue
+        if mobile in importer.seen_mobiles:
+            importer.error(line, f'mobile number {mobile} appears more than once.')
+            continue
+        importer.seen_mobiles.add(mobile)
+        if len(room.residents) >= room.bed_count:
+            importer.error(line, f'room "{room_name}" has more residents than its {room.bed_count} beds.')
+            continue
+        room.residents.append(({'name': name, 'aadhar': mobile, 'joining_date': joined}, line))
+
+    if room is not None:
+        importer.add_room(room)
+    importer.flush()
+
+    if result.errors:
+        db_session.rollback()
+    result.seconds = time.perf_counter() - started
+    return result
@@ -1,20 +1,34 @@
-import os
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, Date, ForeignKey
+from sqlalchemy import create_engine, inspect, func, select, update, delete, text, Column, Integer, String, Boolean, Date, DateTime, Text, ForeignKey, Index
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import sessionmaker, relationship, declarative_base
+from config import Config
 
 # The base for our SQLAlchemy models
 Base = declarative_base()
 
-# The database URL for PostgreSQL will be provided by an environment variable.
-# For local development, we fall back to SQLite.
-database_url = os.environ.get('DATABASE_URL', 'sqlite:///database.db')
+def make_engine(url=None, config=Config):
+    """
+    Creates an engine with the pool settings from config.
+    The app, the CLI commands and the scripts all share the one engine
+    created below, so each process holds a single connection pool.
+    """
+    url = make_url(url or config.SQLALCHEMY_DATABASE_URI)
+    options = {'pool_pre_ping': config.DB_POOL_PRE_PING}
+    # SQLite (file or memory) does not use a sized QueuePool worth tuning
+    if url.get_backend_name() != 'sqlite':
+        options.update(
+            pool_size=config.DB_POOL_SIZE,
+            max_overflow=config.DB_MAX_OVERFLOW,
+            pool_timeout=config.DB_POOL_TIMEOUT,
+            pool_recycle=config.DB_POOL_RECYCLE,
+        )
+    return create_engine(url, **options)
 
-# For SQLAlchemy, we modify the database URL if it's the one provided by Heroku,
-# which uses a slightly different format.
-if database_url.startswith("postgres://"):
-    database_url = database_url.replace("postgres://", "postgresql://", 1)
+engine = make_engine()
 
-engine = create_engine(database_url)
+# Read replicas, if configured; app.py routes the read-only views to them
+replica_engines = [make_engine(url) for url in Config.DATABASE_REPLICA_URLS]
 
 class Admin(Base):
     """Admin user for the application."""
@@ -26,34 +40,58 @@ class Admin(Base):
 class Block(Base):
     """Represents a block in the hostel."""
     __tablename__ = 'blocks'
+    __table_args__ = (
+        Index('ix_blocks_name', 'name'),
+    )
     id = Column(Integer, primary_key=True)
     name = Column(String(50), nullable=False)
-    rooms = relationship('Room', back_populates='block', cascade='all, delete-orphan')
+    rooms = relationship('Room', back_populates='block', cascade='all, delete-orphan', order_by='Room.id')
 
 class Room(Base):
     """Represents a room within a block."""
     __tablename__ = 'rooms'
+    __table_args__ = (
+        Index('ix_rooms_block_id', 'block_id'),
+        Index('ix_rooms_name', 'name'),
+    )
     id = Column(Integer, primary_key=True)
     name = Column(String(50), nullable=False)
     bed_count = Column(Integer, default=0)
+    # Moved whenever a bed of the room changes, to the id of the bed event
+    # that recorded it (see live.record_bed_events); rendered room and bed
+    # fragments are cached per version
+    version = Column(Integer, nullable=False, default=0, server_default='0')
     block_id = Column(Integer, ForeignKey('blocks.id'))
     block = relationship('Block', back_populates='rooms')
-    beds = relationship('Bed', back_populates='room', cascade='all, delete-orphan')
+    beds = relationship('Bed', back_populates='room', cascade='all, delete-orphan', order_by='Bed.bed_number')
 
 class Person(Base):
     """Represents a person staying in a bed."""
     __tablename__ = 'persons'
+    __table_args__ = (
+        Index('ix_persons_leaving_date', 'leaving_date'),
+    )
     id = Column(Integer, primary_key=True)
     name = Column(String(100), nullable=False)
     aadhar = Column(String(16), nullable=False, unique=True)
     joining_date = Column(Date, nullable=False)
     leaving_date = Column(Date, nullable=True)
+    # The room of the resident's stay, set when a bed is assigned and kept
+    # after they leave, so a month's bills reach residents who left during
+    # it. Not a foreign key: it outlives a deleted room, like a meter reading
+    room_id = Column(Integer, nullable=True)
     payments = relationship('Payment', back_populates='person', cascade='all, delete-orphan')
+    ledger = relationship('PaymentLedger', back_populates='person', cascade='all, delete-orphan')
     bed = relationship('Bed', back_populates='person', uselist=False)
 
 class Bed(Base):
     """Represents a single bed within a room."""
     __tablename__ = 'beds'
+    __table_args__ = (
+        # Occupancy checks, the Filled/Empty filters within a room and the
+        # vacant beds of a room in id order (the id rides along in the index)
+        Index('ix_beds_room_occupied', 'room_id', 'is_occupied'),
+    )
     id = Column(Integer, primary_key=True)
     bed_number = Column(Integer, nullable=False)
     is_occupied = Column(Boolean, default=False)
@@ -63,8 +101,16 @@ class Bed(Base):
     person = relationship('Person', back_populates='bed', uselist=False)
 
 class Payment(Base):
-    """Represents a monthly payment for a person."""
+    """
+    A monthly payment for a person, keyed by month name only. Superseded by
+    PaymentLedger; left for `flask migrate-payments` to carry over.
+    """
     __tablename__ = 'payments'
+    __table_args__ = (
+        # One row per person and month; the target of the payment upserts
+        Index('uq_payments_person_month', 'person_id', 'month', unique=True),
+        Index('ix_payments_month_status', 'month', 'status'),
+    )
     id = Column(Integer, primary_key=True)
     person_id = Column(Integer, ForeignKey('persons.id'))
     month = Column(String(20), nullable=False)
@@ -72,6 +118,38 @@ class Payment(Base):
     eb_amount = Column(Integer, default=0)
     person = relationship('Person', back_populates='payments')
 
+class PaymentLedger(Base):
+    """
+    One person's payments for one calendar year.
+
+    Bit i of paid_mask (1 << i) is set when month i (0 = January) is paid;
+    eb_jan ... eb_dec hold that month's EB amount (0 when none was given).
+    Dues are worked out in SQL with a bitwise AND on paid_mask.
+    """
+    __tablename__ = 'payment_ledger'
+    __table_args__ = (
+        # One row per person and year; the target of the payment upserts
+        Index('uq_payment_ledger_person_year', 'person_id', 'year', unique=True),
+        Index('ix_payment_ledger_year', 'year'),
+    )
+    id = Column(Integer, primary_key=True)
+    person_id = Column(Integer, ForeignKey('persons.id'), nullable=False)
+    year = Column(Integer, nullable=False)
+    paid_mask = Column(Integer, nullable=False, default=0)
+    eb_jan = Column(Integer, nullable=False, default=0)
+    eb_feb = Column(Integer, nullable=False, default=0)
+    eb_mar = Column(Integer, nullable=False, default=0)
+    eb_apr = Column(Integer, nullable=False, default=0)
+    eb_may = Column(Integer, nullable=False, default=0)
+    eb_jun = Column(Integer, nullable=False, default=0)
+    eb_jul = Column(Integer, nullable=False, default=0)
+    eb_aug = Column(Integer, nullable=False, default=0)
+    eb_sep = Column(Integer, nullable=False, default=0)
+    eb_oct = Column(Integer, nullable=False, default=0)
+    eb_nov = Column(Integer, nullable=False, default=0)
+    eb_dec = Column(Integer, nullable=False, default=0)
+    person = relationship('Person', back_populates='ledger')
+
 class Worker(Base):
     """Represents a staff member."""
     __tablename__ = 'workers'
@@ -81,14 +159,211 @@ class Worker(Base):
     mobile = Column(String(15), nullable=False)
     gender = Column(String(10), nullable=False)
 
-def create_tables():
+class ArchivedPerson(Base):
+    """
+    A departed resident moved out of persons by the archiver (see archive.py).
+    Archived rows get ids of their own: persons ids are reused once freed.
+    """
+    __tablename__ = 'archived_persons'
+    __table_args__ = (
+        Index('ix_archived_persons_leaving_date', 'leaving_date'),
+    )
+    id = Column(Integer, primary_key=True)
+    person_id = Column(Integer, nullable=True)  # the id the resident had in persons
+    name = Column(String(100), nullable=False)
+    aadhar = Column(String(16), nullable=False)  # not unique: a guest can come back
+    joining_date = Column(Date, nullable=False)
+    leaving_date = Column(Date, nullable=False)
+    room_id = Column(Integer, nullable=True)
+    archived_at = Column(DateTime, nullable=False)
+
+class ArchivedPayment(Base):
+    """A month-name payment of an archived resident, from before the ledger."""
+    __tablename__ = 'archived_payments'
+    __table_args__ = (
+        Index('ix_archived_payments_person_id', 'person_id'),
+    )
+    id = Column(Integer, primary_key=True)
+    person_id = Column(Integer, nullable=False)  # an archived_persons id
+    month = Column(String(20), nullable=False)
+    status = Column(String(20))
+    eb_amount = Column(Integer)
+
+class ArchivedPaymentLedger(Base):
+    """A PaymentLedger year of an archived resident, with the same columns."""
+    __tablename__ = 'archived_payment_ledger'
+    __table_args__ = (
+        Index('ix_archived_payment_ledger_person_id', 'person_id'),
+    )
+    id = Column(Integer, primary_key=True)
+    person_id = Column(Integer, nullable=False)  # an archived_persons id
+    year = Column(Integer, nullable=False)
+    paid_mask = Column(Integer, nullable=False, default=0)
+    eb_jan = Column(Integer, nullable=False, default=0)
+    eb_feb = Column(Integer, nullable=False, default=0)
+    eb_mar = Column(Integer, nullable=False, default=0)
+    eb_apr = Column(Integer, nullable=False, default=0)
+    eb_may = Column(Integer, nullable=False, default=0)
+    eb_jun = Column(Integer, nullable=False, default=0)
+    eb_jul = Column(Integer, nullable=False, default=0)
+    eb_aug = Column(Integer, nullable=False, default=0)
+    eb_sep = Column(Integer, nullable=False, default=0)
+    eb_oct = Column(Integer, nullable=False, default=0)
+    eb_nov = Column(Integer, nullable=False, default=0)
+    eb_dec = Column(Integer, nullable=False, default=0)
+
+class MeterReading(Base):
+    """A room's electricity bill for one month, split across its residents (see billing.py)."""
+    __tablename__ = 'meter_readings'
+    __table_args__ = (
+        Index('uq_meter_readings_room_month', 'room_id', 'year', 'month', unique=True),
+    )
+    id = Column(Integer, primary_key=True)
+    # No foreign key, like the occupancy history: old bills outlive deleted rooms
+    room_id = Column(Integer, nullable=False)
+    year = Column(Integer, nullable=False)
+    month = Column(Integer, nullable=False)  # 1 = January
+    amount = Column(Integer, nullable=False)  # rupees
+
+class ChangeCounter(Base):
+    """A single row counting the commits that changed hostel data, for every host to read (see page_cache.py)."""
+    __tablename__ = 'change_counter'
+    id = Column(Integer, primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+
+class BedEvent(Base):
+    """A change to a bed, pushed live to the accommodate page (see live.py)."""
+    __tablename__ = 'bed_events'
+    id = Column(Integer, primary_key=True)
+    payload = Column(Text, nullable=False)  # JSON delta
+
+class OccupancyDaily(Base):
+    """Beds and occupied beds of one room on one day (see trends.py)."""
+    __tablename__ = 'occupancy_daily'
+    __table_args__ = (
+        Index('uq_occupancy_daily_day_room', 'day', 'room_id', unique=True),
+        Index('ix_occupancy_daily_block_day', 'block_id', 'day'),
+    )
+    id = Column(Integer, primary_key=True)
+    day = Column(Date, nullable=False)
+    # No foreign keys: the history outlives deleted rooms. Back-filled stays
+    # whose room is unknown are kept on a row with no room or block.
+    block_id = Column(Integer, nullable=True)
+    room_id = Column(Integer, nullable=True)
+    beds = Column(Integer, nullable=False, default=0)
+    occupied = Column(Integer, nullable=False, default=0)
+
+class OccupancyRollup(Base):
+    """Weekly or monthly occupancy totals of a block (block_id 0: the whole hostel)."""
+    __tablename__ = 'occupancy_rollups'
+    __table_args__ = (
+        Index('uq_occupancy_rollups_period', 'period', 'block_id', 'period_start', unique=True),
+    )
+    id = Column(Integer, primary_key=True)
+    period = Column(String(10), nullable=False)  # 'week' or 'month'
+    period_start = Column(Date, nullable=False)
+    block_id = Column(Integer, nullable=False)
+    days = Column(Integer, nullable=False)           # days with a snapshot
+    bed_days = Column(Integer, nullable=False)
+    occupied_days = Column(Integer, nullable=False)
+    peak_occupied = Column(Integer, nullable=False)
+
+def create_tables(bind=None):
     """
     Creates all tables defined in the models.
     This function should be run once to set up the database.
     """
+    bind = bind or engine
     print("Creating database tables...")
-    Base.metadata.create_all(engine)
+    Base.metadata.create_all(bind)
+    ensure_columns(bind)
+    ensure_indexes(bind)
+    with bind.begin() as connection:
+        _adopt_archived_ids(connection)
+        if connection.scalar(select(func.count()).select_from(ChangeCounter)) == 0:
+            connection.execute(ChangeCounter.__table__.insert().values(id=1, value=0))
     print("Database tables created successfully!")
 
+def create_default_admin(bind=None):
+    """Creates the admin user from the config if there is none yet."""
+    session = sessionmaker(bind=bind or engine)()
+    try:
+        if session.query(Admin).count() == 0:
+            # NOTE: In a production app, use password hashing (e.g., werkzeug.security)
+            session.add(Admin(username=Config.ADMIN_USERNAME, password=Config.ADMIN_PASSWORD))
+            try:
+                session.commit()
+                print("Default admin user created.")
+            except IntegrityError:
+                session.rollback()
+                print("Admin user already existed (IntegrityError handled).")
+    finally:
+        session.close()
+
+def init_db(bind=None):
+    """
+    One-off setup: tables, indexes and the default admin.
+    Run it on deploy (flask --app app init-db), not in every worker.
+    """
+    create_tables(bind)
+    create_default_admin(bind)
+
+def _dedupe_payments(connection):
+    """Keeps only the newest Payment row per (person_id, month) so the unique index can be built."""
+    newest = select(func.max(Payment.id)).group_by(Payment.person_id, Payment.month)
+    connection.execute(delete(Payment).where(Payment.id.not_in(newest)))
+
+def _adopt_archived_ids(connection):
+    """
+    Archive tables used to keep the persons, payments and ledger ids they
+    were copied from. Those ids become the rows' own: the resident's old id
+    is recorded in person_id (so archived payments still point at their
+    resident), and on PostgreSQL the id sequences move past them.
+    """
+    adopted = connection.execute(
+        update(ArchivedPerson).where(ArchivedPerson.person_id == None).values(person_id=ArchivedPerson.id)
+    ).rowcount
+    if adopted and connection.dialect.name == 'postgresql':
+        for table in ('archived_persons', 'archived_payments', 'archived_payment_ledger'):
+            connection.execute(text(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                                    f"COALESCE(MAX(id), 1), MAX(id) IS NOT NULL) FROM {table}"))
+
+def ensure_columns(bind):
+    """
+    Adds any declared column that is missing from an existing table.
+    Like indexes, create_all() only builds columns together with new tables;
+    a column added later must be nullable or have a server default.
+    """
+    inspector = inspect(bind)
+    with bind.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(bind.dialect)}'
+                if column.server_default is not None:
+                    ddl += f' DEFAULT {column.server_default.arg}'
+                if not column.nullable:
+                    ddl += ' NOT NULL'
+                connection.execute(text(ddl))
+
+def ensure_indexes(bind):
+    """
+    Creates any declared index that is missing from an existing table.
+    create_all() only builds indexes together with new tables, so databases
+    created before an index was declared need this to pick it up.
+    """
+    inspector = inspect(bind)
+    with bind.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            existing = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name in existing:
+                    continue
+                if index.name == 'uq_payments_person_month':
+                    _dedupe_payments(connection)
+                index.create(connection)
+
 if __name__ == "__main__":
-    create_tables()
+    init_db()
@@ -0,0 +1,49 @@
+import threading
+from collections import OrderedDict
+from flask import get_template_attribute
+from markupsafe import Markup
+
+
+class FragmentCache:
+    """
+    Rendered HTML fragments of one worker, each stored with the version of
+    the data it was drawn from.
+
+    Fragments are Jinja macros, keyed by (template, macro, key), where key
+    names the thing drawn (a room id, a bed id). A lookup only hits when the
+    caller's current version matches the stored one, so a fragment is
+    redrawn once its room's version has moved, whichever worker bumped it.
+    The least recently used fragments are dropped past max_entries.
+    """
+
+    def __init__(self, max_entries=20000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # (template, macro, key) -> (version, markup)
+
+    def get(self, template, macro, key, version):
+        with self._lock:
+            entry = self._entries.get((template, macro, key))
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end((template, macro, key))
+            return entry[1]
+
+    def put(self, template, macro, key, version, markup):
+        with self._lock:
+            self._entries[(template, macro, key)] = (version, markup)
+            self._entries.move_to_end((template, macro, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def render(self, template, macro, key, version, *args):
+        """The cached fragment, or macro(*args) from template rendered and cached now."""
+        markup = self.get(template, macro, key, version)
+        if markup is None:
+            markup = Markup(get_template_attribute(template, macro)(*args))
+            self.put(template, macro, key, version, markup)
+        return markup
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,39 @@
+import os
+
+# An async worker class holds the many idle /accommodate/events streams
+# cheaply; set GUNICORN_WORKER_CLASS=sync to go back to plain workers.
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gevent')
+worker_connections = int(os.environ.get('WORKER_CONNECTIONS', 1000))
+
+if worker_class == 'gevent':
+    # Patch before the app is preloaded below, so the locks and threads it
+    # creates at import are cooperative, and let psycopg2 yield while it
+    # waits on the database.
+    from gevent import monkey
+    monkey.patch_all()
+    from psycogreen.gevent import patch_psycopg
+    patch_psycopg()
+
+# Import the app once in the master and fork the workers from it, so the
+# code (and the templates Flask has loaded) is shared copy-on-write and
+# workers boot without re-importing anything.
+preload_app = True
+
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+
+
+def on_starting(server):
+    """Starts the shared request metrics afresh; Prometheus reads it as a counter reset."""
+    import shutil
+    from config import Config
+    if Config.METRICS_DIR:
+        shutil.rmtree(Config.METRICS_DIR, ignore_errors=True)
+
+
+def post_fork(server, worker):
+    """Gives each worker its own connection pool instead of the master's sockets."""
+    from database import engine, replica_engines
+    # close=False leaves the parent's connections alone; the child just
+    # forgets them and opens its own on first use.
+    for pooled in [engine, *replica_engines]:
+        pooled.dispose(close=False)
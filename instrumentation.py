@@ -0,0 +1,329 @@
+import heapq
+import json
+import os
+import threading
+import time
+import uuid
+from flask import g, request, has_request_context, before_render_template, template_rendered
+from sqlalchemy import event
+
+# Histogram buckets: seconds for timings, statements for query counts
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250)
+
+# Slowest statements kept per request for the slow-query log
+SLOWEST_KEPT = 3
+
+# Seconds between two writes of a worker's figures to METRICS_DIR
+FLUSH_INTERVAL = 1.0
+
+
+class RequestStats:
+    """What one request spent on SQL and template rendering."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.template_queries = 0  # issued while a template rendered: lazy loads
+        self.render_seconds = 0.0
+        self.render_started = []
+        self.statements = {}       # statement -> [count, seconds]
+        self.slowest = []          # min-heap of (seconds, statement)
+        self.status = None
+
+    def record_query(self, statement, seconds):
+        self.queries += 1
+        self.db_seconds += seconds
+        if self.render_started:
+            self.template_queries += 1
+        totals = self.statements.setdefault(statement, [0, 0.0])
+        totals[0] += 1
+        totals[1] += seconds
+        if len(self.slowest) < SLOWEST_KEPT:
+            heapq.heappush(self.slowest, (seconds, statement))
+        elif seconds > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, (seconds, statement))
+
+    def server_timing(self):
+        total = time.perf_counter() - self.started
+        return (f'db;dur={self.db_seconds * 1000:.1f};desc="{self.queries} queries, '
+                f'{self.template_queries} from templates", '
+                f'render;dur={self.render_seconds * 1000:.1f}, '
+                f'total;dur={total * 1000:.1f}')
+
+
+class Histogram:
+    """A Prometheus histogram with one label (the endpoint)."""
+
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series = {}  # label -> [bucket counts..., sum, count]
+
+    def observe(self, label, value):
+        series = self._series.get(label)
+        if series is None:
+            series = self._series[label] = [0] * len(self.buckets) + [0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self, all_series=None):
+        """Exposition lines for all_series ({label: series}), this histogram's own by default."""
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        for label, series in sorted((self._series if all_series is None else all_series).items()):
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{{endpoint="{label}",le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{endpoint="{label}",le="+Inf"}} {series[-1]}')
+            lines.append(f'{self.name}_sum{{endpoint="{label}"}} {series[-2]:.6f}')
+            lines.append(f'{self.name}_count{{endpoint="{label}"}} {series[-1]}')
+        return lines
+
+
+class Instrumentation:
+    """
+    Per-request SQL and template timing for a Flask app.
+
+    Engine events time every statement run while a request is active;
+    Flask's template signals time rendering and tell which statements were
+    lazy loads fired from inside a template. Each response carries the
+    totals in a Server-Timing header, and every finished request is added
+    to per-endpoint histograms served in Prometheus text format.
+
+    Each worker counts in memory and, with METRICS_DIR set, writes its
+    figures to a file of its own there at most every FLUSH_INTERVAL
+    seconds. /metrics adds up the files of every worker on the host, so
+    whichever worker a scrape reaches it sees one series that only grows;
+    the files of workers that have exited are kept for that reason, and
+    the directory is emptied when gunicorn starts (a counter reset, which
+    Prometheus expects after a restart). Without METRICS_DIR the figures
+    are those of the worker that answered.
+
+    With SLOW_QUERY_LOG on, statements slower than SLOW_QUERY_MS and any
+    statement run more than N_PLUS_ONE_THRESHOLD times in one request
+    (an N+1 pattern) are logged as warnings; N+1 requests are counted in
+    the metrics either way.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.request_seconds = Histogram('hostel_request_duration_seconds', 'Time to serve a request.', TIME_BUCKETS)
+        self.db_seconds = Histogram('hostel_request_db_seconds', 'Time spent in SQL per request.', TIME_BUCKETS)
+        self.render_seconds = Histogram('hostel_request_render_seconds', 'Time spent rendering templates per request.',
+                                        TIME_BUCKETS)
+        self.queries = Histogram('hostel_request_queries', 'SQL statements per request.', QUERY_BUCKETS)
+        self.responses = {}     # (endpoint, status) -> count
+        self.n_plus_one = {}    # endpoint -> requests with an N+1 pattern
+        self.app = None
+        self.directory = None
+        self._flush_lock = threading.Lock()
+        self._flushed = 0.0
+        self._flush_timer = None
+        self._file = None
+        self._file_pid = None
+
+    def init_app(self, app, engine):
+        self.app = app
+        app.config.setdefault('SLOW_QUERY_LOG', False)
+        app.config.setdefault('SLOW_QUERY_MS', 100)
+        app.config.setdefault('N_PLUS_ONE_THRESHOLD', 10)
+        app.config.setdefault('METRICS_DIR', None)
+        self.directory = app.config['METRICS_DIR']
+        app.before_request(self._start_request)
+        app.after_request(self._add_server_timing)
+        app.teardown_request(self._finish_request)
+        before_render_template.connect(self._render_started, app)
+        template_rendered.connect(self._render_finished, app)
+        self.instrument_engine(engine)
+
+    def instrument_engine(self, engine):
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        event.listen(engine, 'handle_error', self._handle_error)
+
+    @staticmethod
+    def _current():
+        # Statements run outside a request (CLI commands, the live-feed
+        # thread) are not attributed to anything
+        return g.get('request_stats') if has_request_context() else None
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info['query_started'].pop()
+        stats = self._current()
+        if stats is not None:
+            stats.record_query(statement, time.perf_counter() - started)
+
+    def _handle_error(self, context):
+        # A statement that raised never reaches after_cursor_execute; drop
+        # its start time so the next statement on the connection is timed
+        # from its own
+        if context.connection is None:
+            return
+        query_started = context.connection.info.get('query_started')
+        if query_started:
+            started = query_started.pop()
+            stats = self._current()
+            if stats is not None and context.statement:
+                stats.record_query(context.statement, time.perf_counter() - started)
+
+    def _render_started(self, sender, template, context, **extra):
+        stats = self._current()
+        if stats is not None:
+            stats.render_started.append(time.perf_counter())
+
+    def _render_finished(self, sender, template, context, **extra):
+        stats = self._current()
+        if stats is not None and stats.render_started:
+            started = stats.render_started.pop()
+            if not stats.render_started:
+                stats.render_seconds += time.perf_counter() - started
+
+    def _start_request(self):
+        g.request_stats = RequestStats()
+
+    def _add_server_timing(self, response):
+        stats = self._current()
+        if stats is not None:
+            stats.status = response.status_code
+            # Streamed bodies render after the headers are sent, so a header
+            # would leave out most of their work; their totals only reach
+            # the metrics
+            if not response.is_streamed:
+                response.headers['Server-Timing'] = stats.server_timing()
+        return response
+
+    def _finish_request(self, error):
+        stats = g.pop('request_stats', None)
+        if stats is None:
+            return
+        endpoint = request.endpoint or 'unmatched'
+        total = time.perf_counter() - stats.started
+        status = stats.status or (500 if error else 200)
+        repeated = [(statement, count, seconds) for statement, (count, seconds) in stats.statements.items()
+                    if count > self.app.config['N_PLUS_ONE_THRESHOLD']]
+        with self._lock:
+            self.request_seconds.observe(endpoint, total)
+            self.db_seconds.observe(endpoint, stats.db_seconds)
+            self.render_seconds.observe(endpoint, stats.render_seconds)
+            self.queries.observe(endpoint, stats.queries)
+            self.responses[(endpoint, status)] = self.responses.get((endpoint, status), 0) + 1
+            if repeated:
+                self.n_plus_one[endpoint] = self.n_plus_one.get(endpoint, 0) + 1
+        self._flush()
+        if self.app.config['SLOW_QUERY_LOG']:
+            self._log_slow(endpoint, stats, repeated)
+
+    def _log_slow(self, endpoint, stats, repeated):
+        logger = self.app.logger
+        threshold = self.app.config['SLOW_QUERY_MS'] / 1000
+        for statement, count, seconds in repeated:
+            logger.warning('N+1 in %s: statement ran %d times (%.1f ms total): %s',
+                           endpoint, count, seconds * 1000, _one_line(statement))
+        for seconds, statement in sorted(stats.slowest, reverse=True):
+            if seconds >= threshold:
+                logger.warning('Slow query in %s (%.1f ms): %s', endpoint, seconds * 1000, _one_line(statement))
+
+    def _histograms(self):
+        return (self.request_seconds, self.db_seconds, self.render_seconds, self.queries)
+
+    def _snapshot(self):
+        """This worker's figures as plain JSON-ready data."""
+        with self._lock:
+            return {
+                'histograms': {histogram.name: {label: list(series) for label, series in histogram._series.items()}
+                               for histogram in self._histograms()},
+                'responses': [[endpoint, status, count] for (endpoint, status), count in self.responses.items()],
+                'n_plus_one': dict(self.n_plus_one),
+            }
+
+    def _worker_file(self):
+        # A new name in every process (and for every instance), so a worker
+        # that is given a dead worker's pid never overwrites its totals
+        if self._file is None or self._file_pid != os.getpid():
+            os.makedirs(self.directory, exist_ok=True)
+            self._file = os.path.join(self.directory, f'worker-{os.getpid()}-{uuid.uuid4().hex[:8]}.json')
+            self._file_pid = os.getpid()
+        return self._file
+
+    def _flush(self, force=False):
+        """
+        Writes this worker's figures to METRICS_DIR, at most every
+        FLUSH_INTERVAL seconds unless forced. A request inside the interval
+        schedules the write for its end, so a worker that goes idle still
+        reports its last requests.
+        """
+        if not self.directory:
+            return
+        # One writer at a time, so an older snapshot never replaces a newer one
+        with self._flush_lock:
+            now = time.monotonic()
+            if not force and now - self._flushed < FLUSH_INTERVAL:
+                if self._flush_timer is None:
+                    self._flush_timer = threading.Timer(FLUSH_INTERVAL - (now - self._flushed), self._flush,
+                                                        kwargs={'force': True})
+                    self._flush_timer.daemon = True
+                    self._flush_timer.start()
+                return
+            self._flushed = now
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            path = self._worker_file()
+            with open(path + '.tmp', 'w') as f:
+                json.dump(self._snapshot(), f)
+            os.replace(path + '.tmp', path)
+
+    def _collect(self):
+        """The figures of every worker on the host added up, or this worker's without METRICS_DIR."""
+        if not self.directory:
+            return [self._snapshot()]
+        self._flush(force=True)
+        snapshots = []
+        for name in os.listdir(self.directory):
+            if name.startswith('worker-') and name.endswith('.json'):
+                try:
+                    with open(os.path.join(self.directory, name)) as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+        return snapshots
+
+    def render_metrics(self):
+        """The collected metrics in the Prometheus text exposition format."""
+        histograms, responses, n_plus_one = {}, {}, {}
+        for snapshot in self._collect():
+            for name, all_series in snapshot['histograms'].items():
+                merged = histograms.setdefault(name, {})
+                for label, series in all_series.items():
+                    total = merged.setdefault(label, [0] * len(series))
+                    merged[label] = [a + b for a, b in zip(total, series)]
+            for endpoint, status, count in snapshot['responses']:
+                responses[(endpoint, status)] = responses.get((endpoint, status), 0) + count
+            for endpoint, count in snapshot['n_plus_one'].items():
+                n_plus_one[endpoint] = n_plus_one.get(endpoint, 0) + count
+
+        lines = []
+        for histogram in self._histograms():
+            lines.extend(histogram.render(histograms.get(histogram.name, {})))
+        lines.append('# HELP hostel_responses_total Responses served, by endpoint and status.')
+        lines.append('# TYPE hostel_responses_total counter')
+        for (endpoint, status), count in sorted(responses.items()):
+            lines.append(f'hostel_responses_total{{endpoint="{endpoint}",status="{status}"}} {count}')
+        lines.append('# HELP hostel_n_plus_one_requests_total Requests that repeated one statement '
+                     'more than N_PLUS_ONE_THRESHOLD times.')
+        lines.append('# TYPE hostel_n_plus_one_requests_total counter')
+        for endpoint, count in sorted(n_plus_one.items()):
+            lines.append(f'hostel_n_plus_one_requests_total{{endpoint="{endpoint}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _one_line(statement, limit=300):
+    statement = ' '.join(statement.split())
+    return statement if len(statement) <= limit else statement[:limit] + '...'
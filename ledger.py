@@ -0,0 +1,220 @@
+from datetime import date
+from sqlalchemy import select, insert, delete
+from sqlalchemy.dialects import postgresql, sqlite
+from database import Person, Payment, PaymentLedger, ArchivedPerson, ArchivedPayment, ArchivedPaymentLedger
+from queries import MONTH_INDEX, EB_COLUMNS, FULL_YEAR_MASK, month_bit
+
+PAYMENT_STATUSES = ('pending', 'done')
+
+# Rows per INSERT ... ON CONFLICT statement, well under SQLite's bound-parameter limit
+UPSERT_CHUNK_SIZE = 500
+
+# Residents whose month-name payments are moved per transaction by migrate_payments
+MIGRATE_BATCH_SIZE = 1000
+
+_UPSERT_DIALECTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+
+class PaymentUpdateError(ValueError):
+    """Raised when a batch of payment updates is malformed; nothing is written."""
+
+
+def _normalize_update(index, update):
+    """Validates one {person_id, year, month, status, eb_amount} update and returns it as a row."""
+    if not isinstance(update, dict):
+        raise PaymentUpdateError(f'Update {index} is not an object.')
+    try:
+        person_id = int(update.get('person_id'))
+    except (TypeError, ValueError):
+        raise PaymentUpdateError(f'Update {index} has an invalid person_id.')
+    year = update.get('year')
+    if year in (None, ''):
+        year = date.today().year
+    try:
+        year = date(int(year), 1, 1).year
+    except (TypeError, ValueError):
+        raise PaymentUpdateError(f'Update {index} has an invalid year.')
+    month = update.get('month')
+    if month not in MONTH_INDEX:
+        raise PaymentUpdateError(f'Update {index} has an unknown month "{month}".')
+    status = update.get('status') or 'pending'
+    if status not in PAYMENT_STATUSES:
+        raise PaymentUpdateError(f'Update {index} has an unknown status "{status}".')
+    eb_amount = update.get('eb_amount')
+    if eb_amount == '':
+        eb_amount = None
+    if eb_amount is not None:
+        try:
+            eb_amount = int(eb_amount)
+        except (TypeError, ValueError):
+            raise PaymentUpdateError(f'Update {index} has an invalid eb_amount.')
+    return {'person_id': person_id, 'year': year, 'month': month, 'status': status, 'eb_amount': eb_amount}
+
+
+def upsert_payments(db_session, updates):
+    """
+    Applies a batch of payment cell updates to the ledger in the session's transaction.
+
+    Each (person_id, year, month) cell keeps the last update given for it,
+    and the cells of one person and year are folded into one ledger change.
+    Changes are written with INSERT ... ON CONFLICT (person_id, year) DO
+    UPDATE, backed by the uq_payment_ledger_person_year index; the update
+    only clears and sets the bits of the months it touches, in SQL, so
+    concurrent edits of different months of the same year both survive.
+    Returns the number of cells written; the caller commits.
+    """
+    cells = {}
+    for index, update in enumerate(updates):
+        row = _normalize_update(index, update)
+        cells[(row['person_id'], row['year'], row['month'])] = row
+    if not cells:
+        return 0
+
+    person_ids = {person_id for person_id, _, _ in cells}
+    known = set(db_session.scalars(select(Person.id).where(Person.id.in_(person_ids))))
+    unknown = sorted(person_ids - known)
+    if unknown:
+        raise PaymentUpdateError(f'Unknown person id(s): {", ".join(map(str, unknown))}.')
+
+    # (person_id, year) -> [months touched, months paid, {EB column: amount}]
+    changes = {}
+    for (person_id, year, month), row in cells.items():
+        index = MONTH_INDEX[month]
+        change = changes.setdefault((person_id, year), [0, 0, {}])
+        change[0] |= month_bit(index)
+        if row['status'] == 'done':
+            change[1] |= month_bit(index)
+        change[2][EB_COLUMNS[index]] = row['eb_amount'] or 0
+
+    insert_for_dialect = _UPSERT_DIALECTS.get(db_session.get_bind().dialect.name)
+    if insert_for_dialect is None:
+        # No native upsert: fall back to a lookup per ledger year
+        for (person_id, year), (touched, paid, eb_amounts) in changes.items():
+            entry = db_session.query(PaymentLedger).filter_by(person_id=person_id, year=year).first()
+            if not entry:
+                entry = PaymentLedger(person_id=person_id, year=year, paid_mask=0)
+                db_session.add(entry)
+            entry.paid_mask = (entry.paid_mask & ~touched) | paid
+            for column, amount in eb_amounts.items():
+                setattr(entry, column, amount)
+        return len(cells)
+
+    # One statement per set of touched months, so every row of it sets the same columns
+    groups = {}
+    for (person_id, year), (touched, paid, eb_amounts) in changes.items():
+        groups.setdefault(touched, []).append({'person_id': person_id, 'year': year, 'paid_mask': paid, **eb_amounts})
+    for touched, rows in groups.items():
+        for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+            stmt = insert_for_dialect(PaymentLedger).values(rows[start:start + UPSERT_CHUNK_SIZE])
+            set_ = {column: stmt.excluded[column] for column in rows[0] if column in EB_COLUMNS}
+            set_['paid_mask'] = (PaymentLedger.paid_mask.bitwise_and(FULL_YEAR_MASK & ~touched)
+                                 .bitwise_or(stmt.excluded.paid_mask))
+            stmt = stmt.on_conflict_do_update(index_elements=[PaymentLedger.person_id, PaymentLedger.year], set_=set_)
+            db_session.execute(stmt)
+    return len(cells)
+
+
+def upsert_eb_amounts(db_session, year, month_index, person_ids, amounts):
+    """
+    Sets one month's EB amount for many residents at once, leaving their
+    paid bits and other months alone: a single executemany INSERT ... ON
+    CONFLICT (person_id, year) DO UPDATE of that month's column. Returns
+    the number of residents written; the caller commits.
+    """
+    column = EB_COLUMNS[month_index]
+    rows = [{'person_id': person_id, 'year': year, column: amount} for person_id, amount in zip(person_ids, amounts)]
+    if not rows:
+        return 0
+    insert_for_dialect = _UPSERT_DIALECTS.get(db_session.get_bind().dialect.name)
+    if insert_for_dialect is None:
+        # No native upsert: fall back to a lookup per ledger year
+        for row in rows:
+            entry = db_session.query(PaymentLedger).filter_by(person_id=row['person_id'], year=year).first()
+            if not entry:
+                entry = PaymentLedger(person_id=row['person_id'], year=year, paid_mask=0)
+                db_session.add(entry)
+            setattr(entry, column, row[column])
+        return len(rows)
+    stmt = insert_for_dialect(PaymentLedger)
+    stmt = stmt.on_conflict_do_update(index_elements=[PaymentLedger.person_id, PaymentLedger.year],
+                                      set_={column: stmt.excluded[column]})
+    db_session.execute(stmt, rows)
+    return len(rows)
+
+
+def legacy_payment_year(month_index, joining_date, leaving_date, today):
+    """
+    The year a month-name payment most likely belongs to: the last time
+    that month came round before the resident left (or today), but never
+    a month before they joined. A resident who joined in November and paid
+    "Mar" paid for the March after joining, even if it is still to come.
+    """
+    last = min(leaving_date or today, today)
+    year = last.year if month_index < last.month else last.year - 1
+    first = joining_date.year if month_index >= joining_date.month - 1 else joining_date.year + 1
+    return max(year, first)
+
+
+def migrate_payments(db_session, today=None, batch_size=MIGRATE_BATCH_SIZE):
+    """
+    Moves the month-name payments into the year-aware ledger: Payment rows
+    into PaymentLedger and archived ones into ArchivedPaymentLedger.
+
+    Each payment is given the year from legacy_payment_year and folded
+    into its resident's ledger year; months already paid in the ledger stay
+    paid and EB amounts already recorded there are kept. Residents are
+    moved batch_size at a time, one transaction each, so an interrupted run
+    simply resumes. Returns the number of payments migrated.
+    """
+    today = today or date.today()
+    return (_migrate_payments(db_session, Payment, PaymentLedger, Person, today, batch_size)
+            + _migrate_payments(db_session, ArchivedPayment, ArchivedPaymentLedger, ArchivedPerson, today, batch_size))
+
+
+def _migrate_payments(db_session, legacy, ledger, people, today, batch_size):
+    migrated = 0
+    after = None
+    while True:
+        stmt = select(legacy.person_id).where(legacy.person_id != None).distinct().order_by(legacy.person_id)
+        if after is not None:
+            stmt = stmt.where(legacy.person_id > after)
+        person_ids = db_session.scalars(stmt.limit(batch_size)).all()
+        if not person_ids:
+            return migrated
+        after = person_ids[-1]
+
+        # Payments of unknown residents are left where they are
+        stays = {person_id: (joined, left) for person_id, joined, left in db_session.execute(
+            select(people.id, people.joining_date, people.leaving_date).where(people.id.in_(person_ids))
+        )}
+        entries = {
+            (entry.person_id, entry.year): {column: getattr(entry, column)
+                                            for column in ('person_id', 'year', 'paid_mask', *EB_COLUMNS)}
+            for entry in db_session.scalars(select(ledger).where(ledger.person_id.in_(stays)))
+        }
+        payments = db_session.execute(
+            select(legacy.person_id, legacy.month, legacy.status, legacy.eb_amount)
+            .where(legacy.person_id.in_(stays))
+            .order_by(legacy.id)
+        ).all()
+        for person_id, month, status, eb_amount in payments:
+            index = MONTH_INDEX.get(month)
+            if index is None:
+                continue
+            year = legacy_payment_year(index, *stays[person_id], today)
+            entry = entries.setdefault((person_id, year), {'person_id': person_id, 'year': year, 'paid_mask': 0,
+                                                           **dict.fromkeys(EB_COLUMNS, 0)})
+            if status == 'done':
+                entry['paid_mask'] |= month_bit(index)
+            if eb_amount and not entry[EB_COLUMNS[index]]:
+                entry[EB_COLUMNS[index]] = eb_amount
+
+        db_session.execute(delete(ledger).where(ledger.person_id.in_(stays)))
+        if entries:
+            db_session.execute(insert(ledger), list(entries.values()))
+        db_session.execute(delete(legacy).where(legacy.person_id.in_(stays)))
+        db_session.commit()
+        migrated += len(payments)
@@ -0,0 +1,258 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from sqlalchemy import select, func, insert, update, delete
+from database import Block, Room, Bed, Person, BedEvent
+
+log = logging.getLogger(__name__)
+
+# Column order of the rows in a bed snapshot
+SNAPSHOT_COLUMNS = ['bed', 'number', 'room', 'room_name', 'block', 'block_name', 'occupied', 'person']
+
+# Sent when so much changed at once (a bulk import) that the client should
+# fetch a fresh snapshot instead of applying deltas
+RELOAD = {'reload': True}
+
+
+def bed_state(bed_id, occupied, person=None):
+    """Delta for a bed that was filled or emptied."""
+    return {'bed': bed_id, 'occupied': bool(occupied), 'person': person}
+
+
+def bed_added(bed_id, number, room_id, room_name, block_id, block_name):
+    """Delta for a new (vacant) bed, carrying everything the client shows for it."""
+    return {'bed': bed_id, 'number': number, 'room': room_id, 'room_name': room_name,
+            'block': block_id, 'block_name': block_name, 'occupied': False, 'person': None}
+
+
+def bed_removed(bed_id):
+    """Delta for a bed deleted with its room."""
+    return {'bed': bed_id, 'removed': True}
+
+
+def record_bed_events(db_session, deltas):
+    """
+    Queues deltas in the caller's transaction; they are pushed once it
+    commits. Every room a delta touches (all rooms for RELOAD) gets a new
+    version in the same transaction, which retires the rendered fragments
+    of those rooms in every worker.
+
+    The new version is the id of the newest bed event. Event ids only ever
+    grow, so no two states of any rooms share a version: a room that is
+    given the id of a deleted one (SQLite reuses them) never matches the
+    fragments drawn for the old room.
+    """
+    if not deltas:
+        return
+    db_session.execute(
+        insert(BedEvent), [{'payload': json.dumps(delta, separators=(',', ':'))} for delta in deltas]
+    )
+    bump = (update(Room).values(version=select(func.max(BedEvent.id)).scalar_subquery())
+            .execution_options(synchronize_session=False))
+    if any(delta.get('reload') for delta in deltas):
+        db_session.execute(bump)
+        return
+    bed_ids = [delta['bed'] for delta in deltas if not delta.get('removed')]
+    if bed_ids:
+        db_session.execute(bump.where(Room.id.in_(select(Bed.room_id).where(Bed.id.in_(bed_ids)))))
+
+
+def latest_event_id(db_session):
+    return db_session.scalar(select(func.coalesce(func.max(BedEvent.id), 0)))
+
+
+def bed_snapshot(db_session):
+    """
+    Every bed as a compact row (see SNAPSHOT_COLUMNS), with the id of the
+    last bed event as its version. The version is read first, so the rows
+    are at least that new; replaying a delta the rows already reflect is
+    harmless because deltas carry state, not increments.
+    """
+    version = latest_event_id(db_session)
+    rows = db_session.execute(
+        select(Bed.id, Bed.bed_number, Room.id, Room.name, Block.id, Block.name, Bed.is_occupied, Person.name)
+        .join(Room, Bed.room_id == Room.id)
+        .join(Block, Room.block_id == Block.id)
+        .outerjoin(Person, Bed.person_id == Person.id)
+        .order_by(Bed.id)
+    )
+    return {'version': version, 'columns': SNAPSHOT_COLUMNS,
+            'beds': [[bed_id, number, room_id, room, block_id, block, bool(occupied), person]
+                     for bed_id, number, room_id, room, block_id, block, occupied, person in rows]}
+
+
+def _sse(event_id, data, event=None):
+    lines = []
+    if event:
+        lines.append(f'event: {event}')
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'data: {data}')
+    return '\n'.join(lines) + '\n\n'
+
+
+class BedEventFeed:
+    """
+    Fans bed events out to the Server-Sent Event streams of one process.
+
+    A single background thread (a greenlet under the gevent worker) waits
+    for the shared data version to move and only then reads the new
+    bed_events rows, so idle connections cost no queries: each one just
+    waits on a condition for the poller to wake it. The version file is
+    shared by the workers of one host only, so the poller also reads the
+    table every db_poll_interval seconds (when set) to pick up events
+    written through other hosts. Because ids from
+    concurrent transactions can commit out of order, the poller rereads a
+    short window behind the newest id it has seen and skips ids it already
+    delivered.
+    """
+
+    def __init__(self, session_factory, data_version, poll_interval=1.0, db_poll_interval=5.0, heartbeat=15,
+                 buffer_size=1000, retention=10000, lookback=100):
+        self.session_factory = session_factory
+        self.data_version = data_version
+        self.poll_interval = poll_interval
+        self.db_poll_interval = db_poll_interval
+        self.heartbeat = heartbeat
+        self.retention = retention
+        self.lookback = lookback
+        self._cond = threading.Condition()
+        self._events = deque(maxlen=buffer_size)  # (seq, event id, payload)
+        self._seq = 0
+        self._head = None
+        self._delivered = set()
+        self._thread = None
+        self._thread_pid = None
+
+    def _ensure_started(self):
+        # Started lazily in the worker that serves the stream, never in the
+        # gunicorn master that preloaded the app
+        with self._cond:
+            if self._thread is not None and self._thread_pid == os.getpid() and self._thread.is_alive():
+                return
+            db_session = self.session_factory()
+            try:
+                self._head = latest_event_id(db_session)
+                # Events already in the reread window predate every stream
+                self._delivered = set(db_session.scalars(
+                    select(BedEvent.id).where(BedEvent.id > self._head - self.lookback)
+                ))
+            finally:
+                db_session.close()
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._run, args=(self._stop,), name='bed-event-feed', daemon=True)
+            self._thread_pid = os.getpid()
+            self._thread.start()
+
+    def close(self):
+        """Stops the poller; a later stream starts it again."""
+        with self._cond:
+            if self._thread is not None:
+                self._stop.set()
+                self._thread = None
+
+    def _run(self, stop):
+        seen_version = None
+        polled_at = time.monotonic()
+        polls = 0
+        while not stop.wait(self.poll_interval):
+            version = self.data_version.current()
+            due = self.db_poll_interval and time.monotonic() - polled_at >= self.db_poll_interval
+            if version == seen_version and not due:
+                continue
+            seen_version = version
+            polled_at = time.monotonic()
+            try:
+                self._poll()
+                polls += 1
+                if polls % 100 == 0:
+                    self._prune()
+            except Exception:
+                log.exception('Reading bed events failed')
+
+    def _poll(self):
+        db_session = self.session_factory()
+        try:
+            rows = db_session.execute(
+                select(BedEvent.id, BedEvent.payload)
+                .where(BedEvent.id > self._head - self.lookback)
+                .order_by(BedEvent.id)
+            ).all()
+        finally:
+            db_session.close()
+        fresh = [(event_id, payload) for event_id, payload in rows if event_id not in self._delivered]
+        if not fresh:
+            return
+        with self._cond:
+            for event_id, payload in fresh:
+                self._seq += 1
+                self._events.append((self._seq, event_id, payload))
+                self._delivered.add(event_id)
+                self._head = max(self._head, event_id)
+            self._delivered = {event_id for event_id in self._delivered if event_id > self._head - self.lookback}
+            self._cond.notify_all()
+
+    def _prune(self):
+        """Drops events older than the newest retention rows."""
+        db_session = self.session_factory()
+        try:
+            # On the raw connection, so housekeeping does not bump the data version
+            db_session.connection().execute(delete(BedEvent).where(BedEvent.id <= self._head - self.retention))
+            db_session.commit()
+        finally:
+            db_session.close()
+
+    def _backlog(self, after):
+        """Events after a client's last seen id, or None when it is too far behind to catch up."""
+        db_session = self.session_factory()
+        try:
+            latest = latest_event_id(db_session)
+            if after > latest or latest - after > self.retention:
+                return None
+            return db_session.execute(
+                select(BedEvent.id, BedEvent.payload).where(BedEvent.id > after).order_by(BedEvent.id)
+            ).all()
+        finally:
+            db_session.close()
+
+    def stream(self, after=None):
+        """
+        Yields Server-Sent Events: the events after the client's last seen id
+        (from a snapshot version or Last-Event-ID), then new ones as they
+        arrive, with a comment line every heartbeat seconds to keep proxies
+        from closing the idle connection. A "reset" event tells the client
+        to fetch a new snapshot.
+        """
+        self._ensure_started()
+        with self._cond:
+            seq = self._seq
+        yield 'retry: 3000\n\n'
+        replayed = set()
+        if after is not None:
+            backlog = self._backlog(after)
+            if backlog is None:
+                yield _sse(None, '{}', event='reset')
+            elif backlog:
+                replayed = {event_id for event_id, _ in backlog}
+                yield ''.join(_sse(event_id, payload) for event_id, payload in backlog)
+
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._seq > seq, timeout=self.heartbeat)
+                if self._seq == seq:
+                    pending = None
+                elif self._events and self._events[0][0] > seq + 1:
+                    pending = 'reset'  # this client fell out of the buffer
+                else:
+                    pending = [(event_id, payload) for s, event_id, payload in self._events
+                               if s > seq and event_id not in replayed]
+                seq = self._seq
+            if pending is None:
+                yield ': keepalive\n\n'
+            elif pending == 'reset':
+                yield _sse(None, '{}', event='reset')
+            elif pending:
+                yield ''.join(_sse(event_id, payload) for event_id, payload in pending)
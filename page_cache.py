@@ -0,0 +1,268 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import event, select, update
+from database import ChangeCounter
+
+try:
+    import fcntl
+except ImportError:  # Windows: the version file is written without a lock
+    fcntl = None
+
+# Fixed-width so a bump overwrites the whole value in one write
+_VERSION_WIDTH = 20
+
+
+class DataVersion:
+    """
+    A counter that changes whenever hostel data is committed.
+
+    Pages cached under one version are never served under another, so a
+    bump is all it takes to retire every cached page. With a path the
+    counter lives in a small file shared by all gunicorn workers on the
+    host (bumps are serialised with flock); without one it is per process.
+
+    Listeners registered with on_foreign_change() are called when the
+    version moved because of a write made by another process, so other
+    in-process caches can drop what they hold.
+
+    The file only reaches the workers of one host. With check_interval,
+    every commit that writes also counts itself in the database's
+    change_counter row, and the version is moved whenever that count has
+    grown since it was last read, at most check_interval seconds ago; so a
+    write made through another host retires this host's pages within that
+    time. The count last acted on is kept in the file beside the version,
+    so the first worker to notice a change moves the version for all.
+    """
+
+    def __init__(self, path=None, check_interval=None):
+        self.path = path
+        self.check_interval = check_interval
+        self._session_factory = None
+        self._checked = 0.0
+        self._check_lock = threading.Lock()
+        self._counted = None
+        self._lock = threading.Lock()
+        self._fd = None
+        self._fd_pid = None
+        self._value = 0
+        self._changed = time.time()
+        self._seen = None
+        self._listeners = []
+
+    def on_foreign_change(self, callback):
+        self._listeners.append(callback)
+
+    def watch(self, session_factory):
+        """Bumps the version after every commit of a session that wrote something."""
+        event.listen(session_factory, 'after_flush', self._mark_changed)
+        event.listen(session_factory, 'do_orm_execute', self._mark_dml)
+        event.listen(session_factory, 'after_commit', self._after_commit)
+        event.listen(session_factory, 'after_rollback', self._after_rollback)
+        if self.check_interval:
+            self._session_factory = session_factory
+            # The flush inside commit() runs after before_commit, hence both
+            event.listen(session_factory, 'before_commit', self._count_change)
+            event.listen(session_factory, 'after_flush_postexec', self._count_change)
+
+    def _mark_changed(self, session, flush_context):
+        session.info['data_changed'] = True
+
+    def _mark_dml(self, orm_execute_state):
+        # Core/ORM-enabled INSERT, UPDATE and DELETE statements skip the flush
+        if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+            orm_execute_state.session.info['data_changed'] = True
+
+    def _count_change(self, session, flush_context=None):
+        # Once per transaction that wrote
+        if session.info.get('data_changed') and not session.info.get('change_counted'):
+            session.info['change_counted'] = True
+            # On the connection, so the count is not itself a change to flag
+            session.connection().execute(
+                update(ChangeCounter).where(ChangeCounter.id == 1).values(value=ChangeCounter.value + 1)
+            )
+
+    def _after_commit(self, session):
+        session.info.pop('change_counted', None)
+        if session.info.pop('data_changed', False):
+            self.bump()
+
+    def _after_rollback(self, session):
+        session.info.pop('change_counted', None)
+        session.info.pop('data_changed', None)
+
+    def _file(self):
+        # One descriptor per process: flock locks belong to the open file, so
+        # a descriptor inherited across fork would not exclude the parent.
+        if self._fd is None or self._fd_pid != os.getpid():
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            if os.fstat(fd).st_size < _VERSION_WIDTH:
+                # A new (or wiped) file starts from the clock, so it never
+                # reissues a version an old page was cached under.
+                self._write(fd, int(time.time() * 1000))
+            self._fd, self._fd_pid = fd, os.getpid()
+        return self._fd
+
+    @staticmethod
+    def _write(fd, value, offset=0):
+        os.pwrite(fd, str(value).rjust(_VERSION_WIDTH).encode(), offset)
+
+    @staticmethod
+    def _read(fd, offset=0):
+        try:
+            return int(os.pread(fd, _VERSION_WIDTH, offset))
+        except ValueError:
+            return 0
+
+    def _notice(self, value):
+        """Records value as seen, calling the listeners if it came from elsewhere."""
+        foreign = self._seen is not None and value != self._seen
+        self._seen = value
+        if foreign:
+            for callback in self._listeners:
+                callback()
+
+    def _check_database(self):
+        """Moves the version if the database counted changes this host has not acted on yet."""
+        if not self._session_factory or time.monotonic() - self._checked < self.check_interval:
+            return
+        # One check at a time; requests arriving meanwhile use the version as it is
+        if not self._check_lock.acquire(blocking=False):
+            return
+        try:
+            self._checked = time.monotonic()
+            db_session = self._session_factory()
+            try:
+                counted = db_session.scalar(select(ChangeCounter.value).where(ChangeCounter.id == 1))
+            finally:
+                db_session.close()
+            if counted is not None:
+                self._advance(counted)
+        finally:
+            self._check_lock.release()
+
+    def _advance(self, counted):
+        with self._lock:
+            if not self.path:
+                moved = self._counted is not None and counted != self._counted
+                self._counted = counted
+                if not moved:
+                    return
+                self._value += 1
+                self._changed = time.time()
+                self._seen = self._value
+            else:
+                fd = self._file()
+                if fcntl:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                try:
+                    if self._read(fd, _VERSION_WIDTH) == counted:
+                        return
+                    self._write(fd, counted, _VERSION_WIDTH)
+                    value = self._read(fd) + 1
+                    self._write(fd, value)
+                finally:
+                    if fcntl:
+                        fcntl.flock(fd, fcntl.LOCK_UN)
+                self._seen = value
+        for callback in self._listeners:
+            callback()
+
+    def current(self):
+        """Returns the current version."""
+        self._check_database()
+        with self._lock:
+            value = self._read(self._file()) if self.path else self._value
+            self._notice(value)
+            return value
+
+    def age(self):
+        """Seconds since the version last moved, in any worker on the host."""
+        with self._lock:
+            changed = os.fstat(self._file()).st_mtime if self.path else self._changed
+        return max(time.time() - changed, 0.0)
+
+    def bump(self):
+        """Moves to a new version and returns it."""
+        with self._lock:
+            if not self.path:
+                self._value += 1
+                self._changed = time.time()
+                self._seen = self._value
+                return self._value
+            fd = self._file()
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                value = self._read(fd)
+                self._notice(value)
+                value += 1
+                self._write(fd, value)
+            finally:
+                if fcntl:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+            self._seen = value
+            return value
+
+
+class CachedPage:
+    """A rendered response body with the headers needed to replay it."""
+
+    __slots__ = ('body', 'mimetype', 'etag')
+
+    def __init__(self, body, mimetype, etag):
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = etag
+
+
+class PageCache:
+    """
+    A bounded LRU of rendered pages and fragments.
+
+    Keys are (route, filter arguments, data version); entries for older
+    versions are never looked up again and fall off the end as new ones
+    come in.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(route, args, version):
+        return (route, tuple(sorted(args)), version)
+
+    @staticmethod
+    def etag_for(key):
+        """A validator derived from the key alone, so it is known before rendering."""
+        return hashlib.sha1(repr(key).encode()).hexdigest()[:20]
+
+    def get(self, key):
+        with self._lock:
+            page = self._entries.get(key)
+            if page is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return page
+
+    def put(self, key, page):
+        with self._lock:
+            self._entries[key] = page
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
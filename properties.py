@@ -0,0 +1,133 @@
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy.orm import Session, sessionmaker
+from database import make_engine
+
+logger = logging.getLogger(__name__)
+
+# Property ids end up in file names (data version, report directory)
+_PROPERTY_ID = re.compile(r'[a-z0-9][a-z0-9_-]{0,31}')
+
+
+def _in_use(engine):
+    checkedout = getattr(engine.pool, 'checkedout', None)
+    return bool(checkedout and checkedout())
+
+
+class PropertyShards:
+    """
+    The shard map: each property (hostel) keeps its blocks, rooms, beds,
+    residents and payments in a database of its own.
+
+    The default property is served by the shared engine from database.py.
+    The others get an engine, and so a connection pool, the first time a
+    request or command needs them; a pool left unused for idle_timeout
+    seconds, with no connection checked out, is disposed and simply
+    recreated on the next use, so a worker only holds connections to the
+    hostels it is actually serving.
+    """
+
+    def __init__(self, urls, default, default_engine, idle_timeout=600, max_workers=4, on_create=None):
+        for property_id in [default, *urls]:
+            if not _PROPERTY_ID.fullmatch(property_id):
+                raise ValueError(f'Invalid property id "{property_id}": use lowercase letters, digits, "-" and "_".')
+        self.urls = dict(urls)
+        self.urls.pop(default, None)
+        self.default = default
+        self.default_engine = default_engine
+        self.idle_timeout = idle_timeout
+        self.max_workers = max_workers
+        self.on_create = on_create
+        self._lock = threading.Lock()
+        self._engines = {}  # property id -> [engine, last used]
+        self._executor = None
+        self._executor_pid = None
+
+    def __contains__(self, property_id):
+        return property_id == self.default or property_id in self.urls
+
+    def ids(self):
+        """The default property first, then the others by id."""
+        return [self.default, *sorted(self.urls)]
+
+    def engine(self, property_id):
+        """The property's engine, creating its pool if it has none; raises KeyError for an unknown id."""
+        if property_id == self.default:
+            return self.default_engine
+        now = time.monotonic()
+        with self._lock:
+            entry = self._engines.get(property_id)
+            if entry is None:
+                engine = make_engine(self.urls[property_id])
+                if self.on_create:
+                    self.on_create(engine)
+                entry = self._engines[property_id] = [engine, now]
+            entry[1] = now
+            # A long report or streamed page can hold a connection well
+            # past idle_timeout; its pool is kept until that is returned
+            idle = [other for other, (engine, used) in self._engines.items()
+                    if now - used > self.idle_timeout and not _in_use(engine)]
+            evicted = [self._engines.pop(other)[0] for other in idle]
+        for engine in evicted:
+            engine.dispose()
+        return entry[0]
+
+    def sessionmaker(self, property_id):
+        """
+        A session factory for the property. Its sessions look the engine up
+        each time they connect, so they follow a pool that was evicted and
+        recreated.
+        """
+        shards = self
+
+        class PropertySession(Session):
+            def get_bind(self, mapper=None, **kw):
+                return shards.engine(property_id)
+
+        return sessionmaker(class_=PropertySession, info={'property': property_id})
+
+    def _pool(self):
+        # Created on first use in each worker, never inherited across fork
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='property')
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def map(self, fn, property_ids=None):
+        """
+        Runs fn(property_id) for every property at once on a thread pool.
+        Returns ({property id: result}, [property ids that failed]); a
+        property whose database is down is logged and left out rather than
+        failing the others.
+        """
+        property_ids = self.ids() if property_ids is None else list(property_ids)
+        futures = {property_id: self._pool().submit(fn, property_id) for property_id in property_ids}
+        results, failed = {}, []
+        for property_id, future in futures.items():
+            try:
+                results[property_id] = future.result()
+            except Exception:
+                logger.exception('Querying property %s failed', property_id)
+                failed.append(property_id)
+        return results, failed
+
+
+class PerProperty:
+    """One instance of an in-process cache or service per property, made by factory(property_id) on first use."""
+
+    def __init__(self, factory):
+        self.factory = factory
+        self._lock = threading.Lock()
+        self._items = {}
+
+    def __getitem__(self, property_id):
+        with self._lock:
+            item = self._items.get(property_id)
+            if item is None:
+                item = self._items[property_id] = self.factory(property_id)
+            return item
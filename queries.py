@@ -0,0 +1,316 @@
+import re
+from collections import namedtuple
+from datetime import date
+from sqlalchemy import select, func, and_, or_, case, false, literal, union_all
+from sqlalchemy.orm import selectinload, contains_eager
+from database import (Block, Room, Bed, Person, PaymentLedger, ArchivedPerson, ArchivedPayment,
+                      ArchivedPaymentLedger)
+
+# Month columns of the payments grid, in display order
+MONTHS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+MONTH_INDEX = {month: index for index, month in enumerate(MONTHS)}
+
+# PaymentLedger column holding each month's EB amount, in MONTHS order
+EB_COLUMNS = [f'eb_{month.lower()}' for month in MONTHS]
+
+# A paid_mask with every month of the year paid
+FULL_YEAR_MASK = (1 << len(MONTHS)) - 1
+
+# Years the payments grid shows; ?year= outside them is clamped
+LEDGER_YEARS = range(1900, 2201)
+
+# One person's row of the payments grid; cells[i] is the PaymentCell for MONTHS[i]
+PaymentRow = namedtuple('PaymentRow', ['id', 'name', 'block_name', 'room_name', 'cells'])
+PaymentCell = namedtuple('PaymentCell', ['status', 'eb_amount'])
+
+# One page of a keyset-paginated listing; next_cursor is None on the last page
+Page = namedtuple('Page', ['items', 'next_cursor'])
+
+# Rows fetched per round trip when a listing is streamed instead of paged
+STREAM_BATCH_SIZE = 500
+
+
+def keyset_page(query, key_column, after=None, limit=100):
+    """
+    Fetches the page of an ORM query that follows the cursor `after`.
+
+    key_column must be unique and stable (a primary key), so WHERE key > after
+    ORDER BY key LIMIT n can walk an index instead of counting past offsets.
+    One extra row is fetched to find out whether another page exists.
+    """
+    if after is not None:
+        query = query.filter(key_column > after)
+    items = query.order_by(key_column).limit(limit + 1).all()
+    next_cursor = getattr(items[limit - 1], key_column.key) if len(items) > limit else None
+    return Page(items[:limit], next_cursor)
+
+
+def load_block_rooms(db_session):
+    """
+    Loads the blocks and their rooms (with each room's version) but not
+    the beds: two queries, however large the hostel.
+    """
+    return db_session.query(Block).options(selectinload(Block.rooms)).order_by(Block.id).all()
+
+
+def load_room_beds(db_session, room_ids):
+    """{room id: [bed, ...]} with each bed's person loaded, for room_ids only, in one query."""
+    beds = {room_id: [] for room_id in room_ids}
+    if beds:
+        query = (
+            db_session.query(Bed)
+            .outerjoin(Bed.person)
+            .options(contains_eager(Bed.person))
+            .filter(Bed.room_id.in_(list(beds)))
+            .order_by(Bed.room_id, Bed.bed_number)
+        )
+        for bed in query:
+            beds[bed.room_id].append(bed)
+    return beds
+
+
+def month_bit(index):
+    """The paid_mask bit of MONTHS[index]."""
+    return 1 << index
+
+
+def _payment_rows(rows):
+    """Unpacks (person, paid_mask, eb amounts...) rows into PaymentRows."""
+    for person_id, name, block_name, room_name, paid_mask, *eb_amounts in rows:
+        paid_mask = paid_mask or 0
+        cells = [PaymentCell('done' if paid_mask & month_bit(index) else 'pending', eb_amount or None)
+                 for index, eb_amount in enumerate(eb_amounts)]
+        yield PaymentRow(person_id, name, block_name, room_name, cells)
+
+
+def _payment_matrix_stmt(year, person_name=None, room_name=None, after=None, limit=None):
+    """
+    Selects residents (optionally one keyset page of them) left-joined to
+    their ledger row for year, so each row already holds the whole year.
+    """
+    stmt = (
+        select(Person.id, Person.name, Block.name, Room.name, PaymentLedger.paid_mask,
+               *[getattr(PaymentLedger, column) for column in EB_COLUMNS])
+        .join(Bed, Bed.person_id == Person.id)
+        .join(Room, Bed.room_id == Room.id)
+        .join(Block, Room.block_id == Block.id)
+        .outerjoin(PaymentLedger, and_(PaymentLedger.person_id == Person.id, PaymentLedger.year == year))
+        .order_by(Person.id)
+    )
+    if person_name:
+        stmt = stmt.where(Person.name.like(f'%{person_name}%'))
+    if room_name:
+        stmt = stmt.where(Room.name.like(f'%{room_name}%'))
+    if after is not None:
+        stmt = stmt.where(Person.id > after)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return stmt
+
+
+def load_payment_matrix(db_session, year, person_name=None, room_name=None, after=None, limit=100):
+    """
+    Builds one keyset page of the person x month payments grid for year with a single query.
+
+    Residents are joined to their bed, room and block and left-joined to
+    their ledger row, whose paid_mask and EB columns become the cells, so
+    the template can look up any month by index.
+    """
+    stmt = _payment_matrix_stmt(year, person_name, room_name, after, limit + 1)
+    rows = list(_payment_rows(db_session.execute(stmt)))
+    next_cursor = rows[limit - 1].id if len(rows) > limit else None
+    return Page(rows[:limit], next_cursor)
+
+
+def stream_payment_matrix(db_session, year, person_name=None, room_name=None):
+    """Yields every PaymentRow for year, fetching STREAM_BATCH_SIZE rows per round trip."""
+    stmt = _payment_matrix_stmt(year, person_name, room_name)
+    result = db_session.execute(stmt, execution_options={'yield_per': STREAM_BATCH_SIZE})
+    return _payment_rows(result)
+
+
+def outstanding_dues(db_session, first, last, block_id=None):
+    """
+    Unpaid months from the month of first to the month of last, for every
+    resident who stayed at least a day of them, totalled per block and
+    month in a single query.
+
+    The months are a UNION ALL of literal rows, joined to the residents
+    present in each and left-joined to their ledger year; a month is owed
+    when its bit is clear in paid_mask. Departed residents no longer have a
+    bed, so their dues are grouped under block None. Returns one dict per
+    block and month (oldest first), with the residents owing and the EB
+    amounts recorded against them.
+    """
+    months = []
+    month = date(first.year, first.month, 1)
+    while month <= last:
+        start, end = _month_range(month.year, month.month)
+        months.append(select(literal(month.year).label('year'), literal(month.month - 1).label('month'),
+                             literal(month_bit(month.month - 1)).label('bit'),
+                             literal(start).label('start'), literal(end).label('end')))
+        month = end
+    if not months:
+        return []
+    months = union_all(*months).subquery('months') if len(months) > 1 else months[0].subquery('months')
+
+    eb_amount = case({index: getattr(PaymentLedger, column) for index, column in enumerate(EB_COLUMNS)},
+                     value=months.c.month, else_=0)
+    stmt = (
+        select(Block.id, Block.name, months.c.year, months.c.month,
+               func.count(Person.id), func.coalesce(func.sum(eb_amount), 0))
+        .select_from(months)
+        .join(Person, and_(Person.joining_date < months.c.end,
+                           or_(Person.leaving_date == None, Person.leaving_date >= months.c.start)))
+        .outerjoin(PaymentLedger, and_(PaymentLedger.person_id == Person.id, PaymentLedger.year == months.c.year))
+        .outerjoin(Bed, Bed.person_id == Person.id)
+        .outerjoin(Room, Bed.room_id == Room.id)
+        .outerjoin(Block, Room.block_id == Block.id)
+        .where(func.coalesce(PaymentLedger.paid_mask, 0).bitwise_and(months.c.bit) == 0)
+        .group_by(Block.id, Block.name, months.c.year, months.c.month)
+        .order_by(Block.id, months.c.year, months.c.month)
+    )
+    if block_id is not None:
+        stmt = stmt.where(Block.id == block_id)
+    return [
+        {'block_id': block, 'block': name, 'month': f'{year:04d}-{index + 1:02d}',
+         'residents': residents, 'eb_amount': int(eb)}
+        for block, name, year, index, residents, eb in db_session.execute(stmt)
+    ]
+
+
+def bed_table_query(db_session, block_id=None, room_id=None, occupied_status=None):
+    """Beds with their room, block and occupant joined in, filtered like /accommodate."""
+    query = (
+        db_session.query(Bed)
+        .join(Bed.room)
+        .join(Room.block)
+        .outerjoin(Bed.person)
+        .options(contains_eager(Bed.room).contains_eager(Room.block), contains_eager(Bed.person))
+    )
+    if block_id:
+        query = query.filter(Block.id == block_id)
+    if room_id:
+        query = query.filter(Room.id == room_id)
+    if occupied_status == 'filled':
+        query = query.filter(Bed.is_occupied == True)
+    elif occupied_status == 'empty':
+        query = query.filter(Bed.is_occupied == False)
+    return query
+
+
+def _month_range(year, month):
+    """[first day of the month, first day of the next month) for a half-open date range."""
+    start = date(year, month, 1)
+    end = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+    return start, end
+
+
+def leaving_month_condition(db_session, month_filter, column=Person.leaving_date):
+    """
+    Turns a leaving-month filter on column into index-friendly date ranges.
+
+    'YYYY-MM' selects that month; a bare 'MM' selects the month in every year
+    between the first and last recorded departure (both found through the
+    leaving_date index). Raises ValueError for anything else.
+    """
+    value = month_filter.strip()
+    if re.fullmatch(r'\d{4}-\d{1,2}', value):
+        year, month = (int(part) for part in value.split('-'))
+        years = [year]
+    elif re.fullmatch(r'\d{1,2}', value):
+        month = int(value)
+        first, last = db_session.query(func.min(column), func.max(column)).one()
+        years = range(first.year, last.year + 1) if first else []
+    else:
+        raise ValueError(f'Invalid month "{month_filter}".')
+    if not 1 <= month <= 12:
+        raise ValueError(f'Invalid month "{month_filter}".')
+
+    ranges = []
+    for year in years:
+        start, end = _month_range(year, month)
+        ranges.append(and_(column >= start, column < end))
+    return or_(*ranges) if ranges else false()
+
+
+def guests_query(db_session, block_name=None, room_name=None, month=None):
+    """
+    Residents with their bed, room and block joined in, filtered like /guests.
+    Unless a block or room is given, the bed is outer-joined, so residents
+    who have left (and no longer have one) are listed too and found by the
+    leaving-month filter. Raises ValueError when month is not a valid
+    leaving-month filter.
+    """
+    query = db_session.query(Person)
+    if block_name or room_name:
+        query = query.join(Person.bed).join(Bed.room).join(Room.block)
+    else:
+        query = query.outerjoin(Person.bed).outerjoin(Bed.room).outerjoin(Room.block)
+    query = query.options(contains_eager(Person.bed).contains_eager(Bed.room).contains_eager(Room.block))
+    if block_name:
+        query = query.filter(Block.name == block_name)
+    if room_name:
+        query = query.filter(Room.name == room_name)
+    if month:
+        query = query.filter(leaving_month_condition(db_session, month))
+    return query
+
+
+def archived_guests_query(db_session, month=None):
+    """
+    Archived residents for the "include archived" mode of /guests. They no
+    longer have a bed, so only the leaving-month filter applies.
+    """
+    query = db_session.query(ArchivedPerson)
+    if month:
+        query = query.filter(leaving_month_condition(db_session, month, ArchivedPerson.leaving_date))
+    return query
+
+
+def stay_mask(year, joining_date, leaving_date=None):
+    """The paid_mask bits of the months of year in which a resident stayed at least one day."""
+    if joining_date.year > year or (leaving_date and leaving_date.year < year):
+        return 0
+    first = joining_date.month - 1 if joining_date.year == year else 0
+    last = leaving_date.month - 1 if leaving_date and leaving_date.year == year else len(MONTHS) - 1
+    return (1 << last + 1) - (1 << first)
+
+
+def archived_payment_totals(db_session, person_ids):
+    """
+    {person id: {'done': months, 'pending': months}} for archived residents.
+    Ledger years count the paid and unpaid months of the stay; month-name
+    payments archived before the ledger existed are counted by status.
+    """
+    totals = {}
+    if not person_ids:
+        return totals
+    rows = db_session.execute(
+        select(ArchivedPayment.person_id, ArchivedPayment.status, func.count(ArchivedPayment.id))
+        .where(ArchivedPayment.person_id.in_(person_ids))
+        .group_by(ArchivedPayment.person_id, ArchivedPayment.status)
+    )
+    for person_id, status, count in rows:
+        counts = totals.setdefault(person_id, {})
+        counts[status or 'pending'] = counts.get(status or 'pending', 0) + count
+    rows = db_session.execute(
+        select(ArchivedPaymentLedger.person_id, ArchivedPaymentLedger.year, ArchivedPaymentLedger.paid_mask,
+               ArchivedPerson.joining_date, ArchivedPerson.leaving_date)
+        .join(ArchivedPerson, ArchivedPerson.id == ArchivedPaymentLedger.person_id)
+        .where(ArchivedPaymentLedger.person_id.in_(person_ids))
+    )
+    for person_id, year, paid_mask, joining_date, leaving_date in rows:
+        stayed = stay_mask(year, joining_date, leaving_date)
+        paid = bin(paid_mask & stayed).count('1')
+        counts = totals.setdefault(person_id, {})
+        counts['done'] = counts.get('done', 0) + paid
+        counts['pending'] = counts.get('pending', 0) + bin(stayed).count('1') - paid
+    return totals
+
+
+def filter_options(db_session):
+    """Block and room (id, name) rows for the filter dropdowns, without loading full objects."""
+    blocks = db_session.query(Block.id, Block.name).order_by(Block.id).all()
+    rooms = db_session.query(Room.id, Room.name).order_by(Room.id).all()
+    return blocks, rooms
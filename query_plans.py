@@ -0,0 +1,115 @@
+import re
+from datetime import date
+from sqlalchemy import create_engine, select, func
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.sql.expression import ClauseElement, Executable
+from database import Base, Block, Room, Bed, Person, PaymentLedger
+from queries import bed_table_query, guests_query, _payment_matrix_stmt
+from seed_data import generate_hostel
+
+
+class Explain(Executable, ClauseElement):
+    """EXPLAIN (QUERY PLAN) wrapper that compiles the inner statement with its parameters."""
+
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain, 'sqlite')
+def _explain_sqlite(element, compiler, **kw):
+    return 'EXPLAIN QUERY PLAN ' + compiler.process(element.statement, **kw)
+
+
+@compiles(Explain)
+def _explain_default(element, compiler, **kw):
+    return 'EXPLAIN ' + compiler.process(element.statement, **kw)
+
+
+# A plan line that reads a whole table: SQLite's "SCAN beds" (but not
+# "SCAN beds USING INDEX ...") and PostgreSQL's "Seq Scan on beds".
+_FULL_SCAN = {
+    'sqlite': re.compile(r'^SCAN (\w+)(?! USING (?:COVERING )?INDEX)(?! USING INTEGER PRIMARY KEY)'),
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+}
+
+
+def route_queries(db_session):
+    """
+    The filtered queries behind the hot routes, with representative arguments.
+
+    Unfiltered listings (the first page of /guests, the /profile aggregate)
+    read every row by design and are not listed; their later pages are,
+    since a keyset cursor must be served by the primary key.
+    """
+    room_id = db_session.scalar(select(func.min(Room.id)))
+    block_id = db_session.scalar(select(func.min(Block.id)))
+    person_id = db_session.scalar(select(func.min(Person.id)).where(Person.leaving_date == None))
+    after = person_id
+
+    return {
+        'delete_room: occupied beds in room': (
+            db_session.query(Bed).filter(Bed.room_id == room_id, Bed.is_occupied == True)
+        ),
+        'build: vacant beds in room': (
+            db_session.query(Bed.id).filter(Bed.room_id == room_id, Bed.is_occupied == False).order_by(Bed.id)
+        ),
+        'mark_person_left: bed of person': db_session.query(Bed).filter_by(person_id=person_id),
+        'filter_accommodate: block, empty, next page': (
+            bed_table_query(db_session, block_id=block_id, occupied_status='empty')
+            .filter(Bed.id > 1).order_by(Bed.id).limit(101)
+        ),
+        'filter_accommodate: room': bed_table_query(db_session, room_id=room_id).order_by(Bed.id).limit(101),
+        'guests: next page': guests_query(db_session).filter(Person.id > after).order_by(Person.id).limit(101),
+        'guests: room filter': guests_query(db_session, room_name='1-1').order_by(Person.id).limit(101),
+        'guests: leaving month': guests_query(db_session, month='2024-03').order_by(Person.id).limit(101),
+        'payments: next page': _payment_matrix_stmt(date.today().year, after=after, limit=101),
+        'update_payment: ledger lookup': db_session.query(PaymentLedger).filter_by(person_id=person_id,
+                                                                                   year=date.today().year),
+    }
+
+
+def explain(db_session, statement):
+    """Returns the plan lines the database reports for statement."""
+    if hasattr(statement, 'statement'):
+        statement = statement.statement
+    rows = db_session.execute(Explain(statement)).all()
+    # SQLite returns (id, parent, notused, detail); PostgreSQL one text column
+    return [row[-1] for row in rows]
+
+
+def find_full_scans(db_session):
+    """Returns {query name: [plan lines that scan a whole table]} for every route query."""
+    pattern = _FULL_SCAN.get(db_session.get_bind().dialect.name, _FULL_SCAN['postgresql'])
+    problems = {}
+    for name, statement in route_queries(db_session).items():
+        scans = []
+        for line in explain(db_session, statement):
+            match = pattern.search(line.strip())
+            # Scans of LIMITed subqueries (SQLite's "SCAN anon_1") are not table scans
+            if match and match.group(1) in Base.metadata.tables:
+                scans.append(line)
+        if scans:
+            problems[name] = scans
+    return problems
+
+
+def check_query_plans(url='sqlite://'):
+    """
+    Builds the schema in a scratch database, seeds it, runs ANALYZE and
+    EXPLAINs every route query. Returns (plans, problems).
+    """
+    engine = create_engine(url)
+    Base.metadata.create_all(engine)
+    generate_hostel(engine, blocks=20, rooms_per_block=10, beds_per_room=4, occupancy=0.6, departed_ratio=0.4)
+    db_session = sessionmaker(bind=engine)()
+    try:
+        with engine.begin() as connection:
+            connection.exec_driver_sql('ANALYZE')
+        plans = {name: explain(db_session, statement) for name, statement in route_queries(db_session).items()}
+        return plans, find_full_scans(db_session)
+    finally:
+        db_session.close()
+        engine.dispose()
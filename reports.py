@@ -0,0 +1,357 @@
+import csv
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from sqlalchemy import select, func, and_, or_
+from database import Block, Room, Bed, Person, PaymentLedger, ArchivedPerson
+from queries import EB_COLUMNS, _month_range, month_bit
+
+try:
+    import openpyxl
+except ImportError:  # XLSX export is only offered when openpyxl is installed
+    openpyxl = None
+
+try:
+    from gevent import monkey as gevent_monkey
+    from gevent.threadpool import ThreadPoolExecutor as NativeThreadPoolExecutor
+except ImportError:  # not running under the gevent worker
+    gevent_monkey = None
+
+REPORT_KINDS = {
+    'occupancy': 'Occupancy',
+    'dues': 'Dues',
+    'movement': 'Guest movement',
+}
+
+# Rows fetched per round trip from the server-side cursor
+FETCH_SIZE = 1000
+
+# Rows written between two progress updates of a job
+PROGRESS_EVERY = 1000
+
+_JOB_ID = re.compile(r'[0-9a-f]{32}')
+
+# Job states that a worker process is still responsible for
+_UNFINISHED = ('queued', 'running')
+
+
+def report_formats():
+    return ('csv', 'xlsx') if openpyxl else ('csv',)
+
+
+def _executor_class():
+    # With threading monkey-patched (the gevent worker) a plain
+    # ThreadPoolExecutor runs jobs as greenlets, and writing a large report
+    # is CPU-bound: it would stall every request of the worker, live
+    # streams included. gevent's executor always uses native threads.
+    if gevent_monkey and gevent_monkey.is_module_patched('threading'):
+        return NativeThreadPoolExecutor
+    return ThreadPoolExecutor
+
+
+def _process_alive(pid):
+    if os.name == 'nt':  # os.kill would terminate it; assume it is alive
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def parse_month(value):
+    """'YYYY-MM' -> [first day, first day of the next month); raises ValueError."""
+    match = re.fullmatch(r'(\d{4})-(\d{1,2})', (value or '').strip())
+    if not match or not 1 <= int(match.group(2)) <= 12:
+        raise ValueError(f'Invalid month "{value}". Use YYYY-MM.')
+    return _month_range(int(match.group(1)), int(match.group(2)))
+
+
+def _stream(db_session, stmt):
+    # yield_per makes the driver use a server-side cursor where it can, so
+    # only FETCH_SIZE rows are held in memory at a time
+    return db_session.execute(stmt.execution_options(yield_per=FETCH_SIZE))
+
+
+def _present_during(start, end):
+    """Residents who stayed at least one day of [start, end)."""
+    return and_(Person.joining_date < end, or_(Person.leaving_date == None, Person.leaving_date >= start))
+
+
+def _stay_room():
+    # The room of the resident's stay, which outlives their bed; residents
+    # added before it was recorded fall back to their current bed's room
+    return func.coalesce(Person.room_id, Bed.room_id)
+
+
+def _occupancy(db_session, start, end):
+    """Every bed with its resident, as it stands when the report runs."""
+    columns = ['Block', 'Room', 'Bed', 'Status', 'Resident', 'Mobile', 'Joined']
+    total = db_session.scalar(select(func.count(Bed.id)))
+
+    def rows():
+        stmt = (
+            select(Block.name, Room.name, Bed.bed_number, Bed.is_occupied, Person.name, Person.aadhar,
+                   Person.joining_date)
+            .join(Room, Bed.room_id == Room.id)
+            .join(Block, Room.block_id == Block.id)
+            .outerjoin(Person, Bed.person_id == Person.id)
+            .order_by(Block.id, Room.id, Bed.bed_number)
+        )
+        for block, room, number, occupied, name, mobile, joined in _stream(db_session, stmt):
+            yield block, room, number, 'Filled' if occupied else 'Empty', name or '', mobile or '', joined or ''
+    return columns, total, rows()
+
+
+def _dues(db_session, start, end):
+    """Residents present during the month whose ledger bit for it is clear."""
+    columns = ['Resident', 'Mobile', 'Block', 'Room', 'Status', 'EB Amount']
+    index = start.month - 1
+    unpaid = and_(_present_during(start, end),
+                  func.coalesce(PaymentLedger.paid_mask, 0).bitwise_and(month_bit(index)) == 0)
+
+    def base(*entities):
+        return (
+            select(*entities)
+            .select_from(Person)
+            .outerjoin(PaymentLedger, and_(PaymentLedger.person_id == Person.id, PaymentLedger.year == start.year))
+            .where(unpaid)
+        )
+    total = db_session.scalar(base(func.count(Person.id)))
+
+    def rows():
+        stmt = (
+            base(Person.name, Person.aadhar, Block.name, Room.name, getattr(PaymentLedger, EB_COLUMNS[index]))
+            .outerjoin(Bed, Bed.person_id == Person.id)
+            .outerjoin(Room, Room.id == _stay_room())
+            .outerjoin(Block, Room.block_id == Block.id)
+            .order_by(Person.id)
+        )
+        for name, mobile, block, room, eb_amount in _stream(db_session, stmt):
+            yield name, mobile, block or '', room or '', 'pending', eb_amount or 0
+    return columns, total, rows()
+
+
+def _movement(db_session, start, end):
+    """Check-ins and check-outs during the month, in date order per kind, archived residents last."""
+    columns = ['Event', 'Date', 'Resident', 'Mobile', 'Block', 'Room']
+    joined = and_(Person.joining_date >= start, Person.joining_date < end)
+    left = and_(Person.leaving_date >= start, Person.leaving_date < end)
+    archived_joined = and_(ArchivedPerson.joining_date >= start, ArchivedPerson.joining_date < end)
+    archived_left = and_(ArchivedPerson.leaving_date >= start, ArchivedPerson.leaving_date < end)
+    total = sum(db_session.scalar(select(func.count()).select_from(model).where(condition))
+                for model, condition in ((Person, joined), (Person, left),
+                                         (ArchivedPerson, archived_joined), (ArchivedPerson, archived_left)))
+
+    def rows():
+        for event, date_column, condition in (('Joined', Person.joining_date, joined),
+                                              ('Left', Person.leaving_date, left)):
+            stmt = (
+                select(date_column, Person.name, Person.aadhar, Block.name, Room.name)
+                .select_from(Person)
+                .outerjoin(Bed, Bed.person_id == Person.id)
+                .outerjoin(Room, Room.id == _stay_room())
+                .outerjoin(Block, Room.block_id == Block.id)
+                .where(condition)
+                .order_by(date_column, Person.id)
+            )
+            for day, name, mobile, block, room in _stream(db_session, stmt):
+                yield event, day, name, mobile, block or '', room or ''
+        for event, date_column, condition in (('Joined', ArchivedPerson.joining_date, archived_joined),
+                                              ('Left', ArchivedPerson.leaving_date, archived_left)):
+            stmt = (
+                select(date_column, ArchivedPerson.name, ArchivedPerson.aadhar, Block.name, Room.name)
+                .select_from(ArchivedPerson)
+                .outerjoin(Room, Room.id == ArchivedPerson.room_id)
+                .outerjoin(Block, Room.block_id == Block.id)
+                .where(condition)
+                .order_by(date_column, ArchivedPerson.id)
+            )
+            for day, name, mobile, block, room in _stream(db_session, stmt):
+                yield event, day, name, mobile, block or '', room or ''
+    return columns, total, rows()
+
+
+_REPORTS = {
+    'occupancy': _occupancy,
+    'dues': _dues,
+    'movement': _movement,
+}
+
+
+class _CsvWriter:
+    def __init__(self, path, title):
+        self._file = open(path, 'w', newline='', encoding='utf-8')
+        self._writer = csv.writer(self._file)
+
+    def write(self, row):
+        self._writer.writerow(row)
+
+    def close(self):
+        self._file.close()
+
+
+class _XlsxWriter:
+    """openpyxl in write-only mode, which spools rows to disk as they are appended."""
+
+    def __init__(self, path, title):
+        self._path = path
+        self._workbook = openpyxl.Workbook(write_only=True)
+        self._sheet = self._workbook.create_sheet(title=title[:31])
+
+    def write(self, row):
+        self._sheet.append(list(row))
+
+    def close(self):
+        self._workbook.save(self._path)
+
+
+_WRITERS = {
+    'csv': _CsvWriter,
+    'xlsx': _XlsxWriter,
+}
+
+
+class ReportJobs:
+    """
+    Runs report exports on a thread pool, outside the request cycle.
+
+    Each job keeps its status in a small JSON file next to its output in
+    directory, so any gunicorn worker on the host can report progress or
+    serve the download, whichever worker started it. A job also records
+    the worker running it: one still queued or running after that worker
+    has gone (restarted, killed) is marked failed when its status is read.
+    Files older than retention seconds are removed when a new job is
+    started.
+    """
+
+    def __init__(self, session_factory, directory, max_workers=2, retention=86400):
+        self.session_factory = session_factory
+        self.directory = directory
+        self.max_workers = max_workers
+        self.retention = retention
+        self._lock = threading.Lock()
+        self._executor = None
+        self._executor_pid = None
+
+    def _pool(self):
+        # Created on first use in each worker, never inherited across fork
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = _executor_class()(max_workers=self.max_workers, thread_name_prefix='report')
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _status_path(self, job_id):
+        return os.path.join(self.directory, f'{job_id}.json')
+
+    def _save(self, job):
+        path = self._status_path(job['id'])
+        with open(path + '.tmp', 'w') as f:
+            json.dump(job, f)
+        os.replace(path + '.tmp', path)
+
+    def start(self, kind, month, fmt):
+        """Queues a report and returns its job status; raises ValueError for bad arguments."""
+        if kind not in _REPORTS:
+            raise ValueError(f'Unknown report "{kind}".')
+        if fmt not in report_formats():
+            raise ValueError(f'Unsupported format "{fmt}".')
+        start, end = parse_month(month)
+        os.makedirs(self.directory, exist_ok=True)
+        self._cleanup()
+
+        job_id = uuid.uuid4().hex
+        job = {
+            'id': job_id,
+            'kind': kind,
+            'title': REPORT_KINDS[kind],
+            'month': f'{start:%Y-%m}',
+            'format': fmt,
+            'status': 'queued',
+            'pid': os.getpid(),
+            'rows': 0,
+            'total': None,
+            'error': None,
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'finished': None,
+            'filename': f'{kind}-{start:%Y-%m}.{fmt}',
+        }
+        self._save(job)
+        self._pool().submit(self._run, job, start, end)
+        return job
+
+    def _run(self, job, start, end):
+        output = os.path.join(self.directory, f'{job["id"]}.{job["format"]}')
+        db_session = self.session_factory()
+        try:
+            columns, job['total'], rows = _REPORTS[job['kind']](db_session, start, end)
+            job['status'] = 'running'
+            self._save(job)
+            writer = _WRITERS[job['format']](output, job['title'])
+            try:
+                writer.write(columns)
+                for row in rows:
+                    writer.write(row)
+                    job['rows'] += 1
+                    if job['rows'] % PROGRESS_EVERY == 0:
+                        self._save(job)
+            finally:
+                writer.close()
+            job['status'] = 'done'
+        except Exception as e:
+            job['status'] = 'failed'
+            job['error'] = str(e)
+        finally:
+            db_session.close()
+        job['finished'] = datetime.now().isoformat(timespec='seconds')
+        self._save(job)
+
+    def status(self, job_id):
+        """The job's status dict, or None for an unknown id."""
+        if not _JOB_ID.fullmatch(job_id):
+            return None
+        try:
+            with open(self._status_path(job_id)) as f:
+                job = json.load(f)
+        except (OSError, ValueError):
+            return None
+        pid = job.get('pid')
+        if job['status'] in _UNFINISHED and (pid is None or not _process_alive(pid)):
+            job['status'] = 'failed'
+            job['error'] = 'The worker running this report stopped before it finished; please start it again.'
+            job['finished'] = datetime.now().isoformat(timespec='seconds')
+            self._save(job)
+        return job
+
+    def output_path(self, job_id):
+        """The finished report's file, or None while it is not ready."""
+        job = self.status(job_id)
+        if not job or job['status'] != 'done':
+            return None
+        return os.path.join(self.directory, f'{job_id}.{job["format"]}')
+
+    def recent(self, limit=20):
+        """The newest jobs first."""
+        if not os.path.isdir(self.directory):
+            return []
+        jobs = [self.status(name[:-5]) for name in os.listdir(self.directory) if name.endswith('.json')]
+        jobs = [job for job in jobs if job]
+        return sorted(jobs, key=lambda job: job['created'], reverse=True)[:limit]
+
+    def _cleanup(self):
+        cutoff = time.time() - self.retention
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
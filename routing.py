@@ -0,0 +1,111 @@
+import itertools
+import logging
+import threading
+import time
+from sqlalchemy import event, text
+from sqlalchemy.exc import SQLAlchemyError
+
+logger = logging.getLogger(__name__)
+
+# How far behind the primary a Postgres standby has replayed, in seconds;
+# 0 once it has replayed everything it received (so an idle primary does
+# not make a caught-up standby look stale) and NULL on a server that is
+# not a standby
+_PG_REPLICA_LAG = text(
+    'SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+    'ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END'
+)
+
+
+class Replica:
+    """A read replica's engine and what the router last learnt about its health."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.healthy = True
+        self.lag = None
+        self.checked_at = None
+        self.checking = False
+
+
+class ReplicaRouter:
+    """
+    Chooses the engine read-only requests run on.
+
+    Replicas are taken in turn. Each is checked with a trivial query (and,
+    on Postgres, its replay lag) at most every check_interval seconds; one
+    that fails, lags more than max_lag seconds, or drops a connection while
+    serving a request is skipped until its next check. Only one request
+    runs a due check; the others go by the last result meanwhile. With no
+    healthy replica, or none configured, reads go to the primary.
+    """
+
+    def __init__(self, primary, replica_engines=(), check_interval=10, max_lag=None):
+        self.primary = primary
+        self.replicas = [Replica(engine) for engine in replica_engines]
+        self.check_interval = check_interval
+        self.max_lag = max_lag
+        self._lock = threading.Lock()
+        self._turn = itertools.count()
+        for replica in self.replicas:
+            event.listen(replica.engine, 'handle_error', self._connection_lost(replica))
+
+    def _connection_lost(self, replica):
+        def handle_error(context):
+            if context.is_disconnect or context.connection is None:
+                self._mark(replica, False)
+        return handle_error
+
+    def _mark(self, replica, healthy, lag=None):
+        with self._lock:
+            if replica.healthy and not healthy:
+                logger.warning('Read replica %s is unavailable; reading from the primary', replica.engine.url)
+            replica.healthy = healthy
+            replica.lag = lag
+            replica.checked_at = time.monotonic()
+
+    def check(self, replica):
+        """Probes the replica now and records whether it may serve reads."""
+        try:
+            with replica.engine.connect() as connection:
+                connection.execute(text('SELECT 1'))
+                lag = None
+                if replica.engine.dialect.name == 'postgresql':
+                    lag = connection.scalar(_PG_REPLICA_LAG)
+                    lag = float(lag) if lag is not None else None
+        except SQLAlchemyError:
+            self._mark(replica, False)
+            return False
+        healthy = self.max_lag is None or lag is None or lag <= self.max_lag
+        if not healthy:
+            logger.warning('Read replica %s is %.1fs behind the primary', replica.engine.url, lag)
+        self._mark(replica, healthy, lag)
+        return healthy
+
+    def _take_check(self, replica):
+        # True for the one caller that should probe a due replica now
+        with self._lock:
+            if replica.checking:
+                return False
+            if replica.checked_at is not None and time.monotonic() - replica.checked_at < self.check_interval:
+                return False
+            replica.checking = True
+            return True
+
+    def read_engine(self):
+        """A healthy replica's engine, or the primary's when there is none."""
+        if not self.replicas:
+            return self.primary
+        start = next(self._turn)
+        for offset in range(len(self.replicas)):
+            replica = self.replicas[(start + offset) % len(self.replicas)]
+            if self._take_check(replica):
+                try:
+                    healthy = self.check(replica)
+                finally:
+                    replica.checking = False
+            else:
+                healthy = replica.healthy
+            if healthy:
+                return replica.engine
+        return self.primary
@@ -0,0 +1,116 @@
+import random
+from datetime import date, timedelta
+from sqlalchemy import select, func, insert, text
+from database import Block, Room, Bed, Person, PaymentLedger, Worker
+from queries import MONTHS, EB_COLUMNS, month_bit
+
+# Named data sizes for the benchmarks: blocks, rooms per block, beds per room
+SIZES = {
+    'small': (5, 10, 4),
+    'medium': (20, 25, 4),
+    'large': (50, 50, 4),
+}
+
+# Rows per executemany INSERT
+BATCH_SIZE = 5000
+
+_DEPARTMENTS = ['Kitchen', 'Housekeeping', 'Security', 'Maintenance', 'Office']
+
+
+def _next_id(connection, model):
+    return (connection.scalar(select(func.max(model.id))) or 0) + 1
+
+
+def _insert(connection, model, rows):
+    for start in range(0, len(rows), BATCH_SIZE):
+        connection.execute(insert(model), rows[start:start + BATCH_SIZE])
+
+
+def _resync_sequences(connection, models):
+    """Moves PostgreSQL's id sequences past the ids written explicitly here."""
+    if connection.dialect.name != 'postgresql':
+        return
+    for model in models:
+        table = model.__tablename__
+        connection.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE(MAX(id), 1)) FROM {table}"
+        ))
+
+
+def generate_hostel(bind, blocks=5, rooms_per_block=10, beds_per_room=4, occupancy=0.7,
+                    departed_ratio=0.5, workers=20, today=None, seed=7):
+    """
+    Adds a synthetic hostel to the database at bind.
+
+    occupancy is the share of beds with a current resident. departed_ratio
+    adds that many former residents per current one, with leaving dates
+    spread over the past year. Every resident, current or departed, gets
+    ledger entries for the twelve months up to today (mostly paid, with EB
+    amounts).
+    Rows are written with batched Core INSERTs and explicit ids, so it is
+    quick even at tens of thousands of beds; existing data is left alone.
+    Returns the number of rows written per table.
+    """
+    rng = random.Random(seed)
+    today = today or date.today()
+    counts = {}
+    with bind.begin() as connection:
+        block_id = _next_id(connection, Block)
+        room_id = _next_id(connection, Room)
+        bed_id = _next_id(connection, Bed)
+        person_id = _next_id(connection, Person)
+        worker_id = _next_id(connection, Worker)
+
+        block_rows, room_rows, bed_rows, person_rows, ledger_rows = [], [], [], [], []
+        # The twelve (year, month index) pairs up to this month
+        months = [((today.year * 12 + today.month - 1 - back) // 12, (today.month - 1 - back) % 12)
+                  for back in range(len(MONTHS))]
+
+        def add_person(room, leaving_date=None):
+            nonlocal person_id
+            joined = today - timedelta(days=rng.randrange(30, 730))
+            person_rows.append({
+                'id': person_id, 'name': f'Resident {person_id}', 'aadhar': str(9000000000 + person_id),
+                'joining_date': joined, 'leaving_date': leaving_date, 'room_id': room,
+            })
+            years = {}
+            for year, index in months:
+                entry = years.setdefault(year, {'person_id': person_id, 'year': year, 'paid_mask': 0,
+                                                **dict.fromkeys(EB_COLUMNS, 0)})
+                if rng.random() < 0.8:
+                    entry['paid_mask'] |= month_bit(index)
+                entry[EB_COLUMNS[index]] = rng.randrange(0, 600, 10)
+            ledger_rows.extend(years.values())
+            person_id += 1
+            return person_id - 1
+
+        for b in range(blocks):
+            block_rows.append({'id': block_id, 'name': f'Block {block_id}'})
+            for r in range(rooms_per_block):
+                room_rows.append({'id': room_id, 'name': f'{block_id}-{r + 1}', 'bed_count': beds_per_room,
+                                  'block_id': block_id})
+                for number in range(1, beds_per_room + 1):
+                    occupant = add_person(room_id) if rng.random() < occupancy else None
+                    bed_rows.append({'id': bed_id, 'bed_number': number, 'room_id': room_id,
+                                     'is_occupied': occupant is not None, 'person_id': occupant})
+                    bed_id += 1
+                room_id += 1
+            block_id += 1
+
+        current = len(person_rows)
+        for _ in range(int(current * departed_ratio)):
+            room = rng.choice(room_rows)['id'] if room_rows else None
+            add_person(room, leaving_date=today - timedelta(days=rng.randrange(1, 365)))
+
+        worker_rows = [
+            {'id': worker_id + n, 'name': f'Staff {worker_id + n}', 'department': rng.choice(_DEPARTMENTS),
+             'mobile': str(8000000000 + worker_id + n), 'gender': rng.choice(['Male', 'Female'])}
+            for n in range(workers)
+        ]
+
+        for model, rows in ((Block, block_rows), (Room, room_rows), (Person, person_rows),
+                            (Bed, bed_rows), (PaymentLedger, ledger_rows), (Worker, worker_rows)):
+            _insert(connection, model, rows)
+            counts[model.__tablename__] = len(rows)
+        _resync_sequences(connection, (Block, Room, Bed, Person, Worker))
+    return counts
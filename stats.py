@@ -0,0 +1,192 @@
+import threading
+import time
+from sqlalchemy import select, func, case, distinct, event
+from database import Block, Room, Bed, Person, Worker
+
+
+def _percent(part, whole):
+    return round(part / whole * 100, 2) if whole > 0 else 0
+
+
+def compute_occupancy(db_session):
+    """
+    Computes global and per-block occupancy counters in one round trip.
+
+    Blocks are outer-joined to their rooms and beds and grouped by block;
+    the guest and staff counts ride along as uncorrelated scalar subqueries.
+    Returns (totals, blocks) where blocks maps block id -> raw counters.
+    """
+    total_persons = (
+        select(func.count(Person.id)).where(Person.leaving_date == None).scalar_subquery()
+    )
+    total_workers = select(func.count(Worker.id)).scalar_subquery()
+
+    stmt = (
+        select(
+            Block.id,
+            Block.name,
+            func.count(distinct(Room.id)),
+            func.count(Bed.id),
+            func.coalesce(func.sum(case((Bed.is_occupied == True, 1), else_=0)), 0),
+            total_persons,
+            total_workers,
+        )
+        .select_from(Block)
+        .outerjoin(Room, Room.block_id == Block.id)
+        .outerjoin(Bed, Bed.room_id == Room.id)
+        .group_by(Block.id, Block.name)
+        .order_by(Block.id)
+    )
+    rows = db_session.execute(stmt).all()
+
+    blocks = {}
+    totals = {'rooms': 0, 'beds': 0, 'occupied': 0, 'persons': 0, 'workers': 0}
+    for block_id, name, rooms, beds, occupied, persons, workers in rows:
+        blocks[block_id] = {'name': name, 'rooms': rooms, 'beds': beds, 'occupied': int(occupied)}
+        totals['rooms'] += rooms
+        totals['beds'] += beds
+        totals['occupied'] += int(occupied)
+        totals['persons'] = persons
+        totals['workers'] = workers
+
+    if not rows:
+        # No blocks yet, so the grouped query had nothing to carry the
+        # guest/staff counts on.
+        persons, workers = db_session.execute(select(total_persons, total_workers)).one()
+        totals['persons'] = persons
+        totals['workers'] = workers
+
+    return totals, blocks
+
+
+def format_occupancy(totals, blocks):
+    """Shapes raw counters into the global_stats/block_stats used by profile.html."""
+    global_stats = {
+        'total_beds': totals['beds'],
+        'occupied_beds': totals['occupied'],
+        'unoccupied_beds': totals['beds'] - totals['occupied'],
+        'occupancy_percent': _percent(totals['occupied'], totals['beds']),
+        'total_persons': totals['persons'],
+        'total_workers': totals['workers'],
+        'total_rooms': totals['rooms'],
+    }
+    block_stats = [
+        {
+            'id': block_id,
+            'name': block['name'],
+            'total_rooms': block['rooms'],
+            'total_beds': block['beds'],
+            'occupied_beds': block['occupied'],
+            'unoccupied_beds': block['beds'] - block['occupied'],
+            'occupancy_percent': _percent(block['occupied'], block['beds']),
+        }
+        for block_id, block in sorted(blocks.items())
+    ]
+    return global_stats, block_stats
+
+
+def merge_occupancy(counts):
+    """
+    Adds up the raw counters of several properties, given as {property id:
+    (totals, blocks)}. Returns (totals, blocks, per-property totals) with
+    blocks keyed by (property id, block id) and named "property / block".
+    """
+    totals = {'rooms': 0, 'beds': 0, 'occupied': 0, 'persons': 0, 'workers': 0}
+    blocks = {}
+    for property_id, (property_totals, property_blocks) in counts.items():
+        for key in totals:
+            totals[key] += property_totals[key]
+        for block_id, block in property_blocks.items():
+            blocks[property_id, block_id] = dict(block, name=f'{property_id} / {block["name"]}')
+    per_property = {property_id: property_totals for property_id, (property_totals, _) in counts.items()}
+    return totals, blocks, per_property
+
+
+class OccupancyCache:
+    """
+    In-process occupancy counters for the /profile dashboard.
+
+    The write routes mark their session as tracked and commit it through
+    commit() with the change they made, so the counters stay current
+    without touching the database. The commit and the change happen under
+    the lock a recompute holds, so a recompute sees both or neither and no
+    change is lost or counted twice. Any flush of a Block/Room/Bed/Person/
+    Worker from an untracked session invalidates the cache, and counters
+    older than max_age seconds are recomputed to pick up writes made by
+    other processes.
+    """
+
+    TRACKED_MODELS = (Block, Room, Bed, Person, Worker)
+
+    def __init__(self, max_age=30):
+        self.max_age = max_age
+        # Reentrant: commit() holds it while the session's commit hooks run
+        self._lock = threading.RLock()
+        self._totals = None
+        self._blocks = None
+        self._loaded_at = 0.0
+
+    def watch(self, session_factory):
+        """Listens for flushes on sessions created by session_factory."""
+        event.listen(session_factory, 'after_flush', self._after_flush)
+
+    def _after_flush(self, session, flush_context):
+        if session.info.get('occupancy_tracked'):
+            return
+        changed = list(session.new) + list(session.dirty) + list(session.deleted)
+        if any(isinstance(obj, self.TRACKED_MODELS) for obj in changed):
+            self.invalidate()
+
+    def track(self, db_session):
+        """Marks db_session's writes as ones the caller will report through apply()."""
+        db_session.info['occupancy_tracked'] = True
+
+    def invalidate(self):
+        with self._lock:
+            self._totals = None
+            self._blocks = None
+
+    def _is_fresh(self):
+        return self._totals is not None and time.monotonic() - self._loaded_at < self.max_age
+
+    def counts(self, db_session):
+        """Returns copies of the raw (totals, blocks) counters, recomputing only when stale."""
+        with self._lock:
+            if not self._is_fresh():
+                self._totals, self._blocks = compute_occupancy(db_session)
+                self._loaded_at = time.monotonic()
+            return dict(self._totals), {block_id: dict(block) for block_id, block in self._blocks.items()}
+
+    def snapshot(self, db_session):
+        """Returns (global_stats, block_stats), recomputing only when stale."""
+        return format_occupancy(*self.counts(db_session))
+
+    def commit(self, db_session, *changes):
+        """Commits db_session and applies its changes, given as dicts of apply() arguments."""
+        with self._lock:
+            db_session.commit()
+            for change in changes:
+                self.apply(**change)
+
+    def apply(self, block_id=None, name=None, rooms=0, beds=0, occupied=0, persons=0, workers=0):
+        """Applies a committed change to the counters (a no-op while they are stale)."""
+        with self._lock:
+            if self._totals is None:
+                return
+            if block_id is not None:
+                block = self._blocks.get(block_id)
+                if block is None:
+                    if name is None:
+                        # A block we have never seen: only a recompute can fix that.
+                        self._totals = None
+                        self._blocks = None
+                        return
+                    block = self._blocks[block_id] = {'name': name, 'rooms': 0, 'beds': 0, 'occupied': 0}
+                block['rooms'] += rooms
+                block['beds'] += beds
+                block['occupied'] += occupied
+            self._totals['rooms'] += rooms
+            self._totals['beds'] += beds
+            self._totals['occupied'] += occupied
+            self._totals['persons'] += persons
+            self._totals['workers'] += workers
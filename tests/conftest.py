@@ -0,0 +1,107 @@
+import os
+import sys
+import tempfile
+from datetime import date
+
+import pytest
+from sqlalchemy import event
+
+# The app reads its database and cache locations from the environment when
+# it is imported, so point them at a scratch directory first
+_scratch = tempfile.mkdtemp(prefix='hostel-tests-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_scratch, 'hostel.db')
+os.environ['DATA_VERSION_FILE'] = os.path.join(_scratch, 'data-version')
+os.environ['REPORTS_DIR'] = os.path.join(_scratch, 'reports')
+os.environ['TEMPLATE_CACHE_DIR'] = os.path.join(_scratch, 'templates')
+os.environ['METRICS_DIR'] = os.path.join(_scratch, 'metrics')
+# One host here; tests that need the database check build their own DataVersion
+os.environ['DATA_VERSION_CHECK_INTERVAL'] = '0'
+os.environ.pop('DATABASE_REPLICA_URLS', None)
+os.environ.pop('PROPERTY_DATABASE_URLS', None)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as hostel_app
+from database import Base, Block, Room, Bed, Person, engine, init_db
+
+
+def _empty_hostel():
+    """Recreates the database empty and empties every in-process cache."""
+    Base.metadata.drop_all(engine)
+    init_db()
+    state = hostel_app.current_property()
+    state.occupancy_cache.invalidate()
+    state.free_beds.invalidate()
+    state.fragment_cache.clear()
+    hostel_app.page_cache.clear()
+
+
+@pytest.fixture
+def app():
+    """The app on an empty database."""
+    _empty_hostel()
+    hostel_app.app.config['TESTING'] = True
+    return hostel_app.app
+
+
+@pytest.fixture
+def empty_hostel(app):
+    """Starts the test over on an empty database, for tests that compare hostels."""
+    return _empty_hostel
+
+
+@pytest.fixture
+def db_session(app):
+    session = hostel_app.DBSession()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def client(app):
+    """A test client that is logged in."""
+    client = app.test_client()
+    with client.session_transaction() as flask_session:
+        flask_session['logged_in'] = True
+    return client
+
+
+@pytest.fixture
+def seed_hostel(db_session):
+    """Adds blocks x rooms x beds, with a resident in every other bed."""
+    def seed(blocks, rooms, beds):
+        residents = 0
+        for b in range(blocks):
+            block = Block(name=f'Block {b}')
+            db_session.add(block)
+            for r in range(rooms):
+                room = Room(name=f'{b}-{r}', bed_count=beds, block=block)
+                db_session.add(room)
+                for number in range(1, beds + 1):
+                    bed = Bed(bed_number=number, room=room, is_occupied=False)
+                    if number % 2:
+                        residents += 1
+                        bed.person = Person(name=f'Resident {residents}', aadhar=str(10 ** 11 + residents),
+                                            joining_date=date(2024, 1, 1))
+                        bed.is_occupied = True
+                    db_session.add(bed)
+        db_session.commit()
+    return seed
+
+
+@pytest.fixture
+def count_queries():
+    """count_queries(fn) -> (fn(), number of SQL statements it sent)."""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+
+    def count(fn):
+        del statements[:]
+        result = fn()
+        return result, len(statements)
+
+    yield count
+    event.remove(engine, 'before_cursor_execute', before_cursor_execute)
@@ -0,0 +1,50 @@
+from datetime import date
+
+import pytest
+
+import app as hostel_app
+from allocator import BedUnavailable, allocate_bed
+from database import Bed, Person
+
+
+def _newcomer(db_session, name, aadhar):
+    person = Person(name=name, aadhar=aadhar, joining_date=date(2024, 1, 1))
+    db_session.add(person)
+    db_session.flush()
+    return person.id
+
+
+def test_two_sessions_claiming_the_same_bed_only_one_wins(seed_hostel, db_session):
+    seed_hostel(blocks=1, rooms=1, beds=2)
+    bed_id = db_session.query(Bed.id).filter_by(is_occupied=False).scalar()
+    free_beds = hostel_app.current_property().free_beds
+    first, second = hostel_app.DBSession(), hostel_app.DBSession()
+    try:
+        won = allocate_bed(first, free_beds, _newcomer(first, 'First', '900000000001'), bed_id=bed_id)
+        first.commit()
+        with pytest.raises(BedUnavailable):
+            allocate_bed(second, free_beds, _newcomer(second, 'Second', '900000000002'), bed_id=bed_id)
+        second.rollback()
+    finally:
+        first.close()
+        second.close()
+
+    assert won[0] == bed_id
+    assert db_session.query(Person.name).join(Bed, Bed.person_id == Person.id).filter(Bed.id == bed_id).scalar() == 'First'
+
+
+def test_a_rolled_back_claim_puts_the_bed_back_in_the_index(seed_hostel, db_session):
+    seed_hostel(blocks=1, rooms=1, beds=2)
+    free_beds = hostel_app.current_property().free_beds
+    free_beds.invalidate()
+
+    bed_id = allocate_bed(db_session, free_beds, _newcomer(db_session, 'First', '900000000001'))[0]
+    db_session.rollback()
+
+    # No reload needed: the index itself offers the bed again
+    free_beds.invalidate = lambda: pytest.fail('the index was reloaded')
+    try:
+        assert allocate_bed(db_session, free_beds, _newcomer(db_session, 'Second', '900000000002'))[0] == bed_id
+        db_session.commit()
+    finally:
+        del free_beds.invalidate
@@ -0,0 +1,61 @@
+from datetime import date, datetime
+
+from archive import archive_departed
+from database import ArchivedPaymentLedger, ArchivedPerson, PaymentLedger, Person, create_tables, engine
+from queries import archived_payment_totals, month_bit
+
+
+def _departed(db_session, name, aadhar, year, paid_month):
+    person = Person(name=name, aadhar=aadhar, joining_date=date(year, 1, 1), leaving_date=date(year, 3, 1))
+    db_session.add(person)
+    db_session.flush()
+    db_session.add(PaymentLedger(person_id=person.id, year=year, paid_mask=month_bit(paid_month)))
+    db_session.commit()
+    return person.id
+
+
+def test_reused_person_ids_stay_separate_in_the_archive(empty_hostel, db_session):
+    first = _departed(db_session, 'Asha', '900000000001', 2022, 0)
+    assert archive_departed(db_session, retention_days=30, today=date(2024, 1, 1)) == (1, 1)
+    # SQLite hands the freed id to the next resident
+    second = _departed(db_session, 'Ravi', '900000000002', 2023, 1)
+    assert second == first
+    assert archive_departed(db_session, retention_days=30, today=date(2024, 1, 1)) == (1, 1)
+
+    archived = {person.name: person for person in db_session.query(ArchivedPerson)}
+    assert archived['Asha'].id != archived['Ravi'].id
+    assert archived['Asha'].person_id == archived['Ravi'].person_id == first
+    years = dict(db_session.query(ArchivedPaymentLedger.person_id, ArchivedPaymentLedger.year))
+    assert years == {archived['Asha'].id: 2022, archived['Ravi'].id: 2023}
+    # January to March stayed, one of them paid
+    totals = archived_payment_totals(db_session, [archived['Asha'].id, archived['Ravi'].id])
+    assert totals == {archived['Asha'].id: {'done': 1, 'pending': 2}, archived['Ravi'].id: {'done': 1, 'pending': 2}}
+
+
+def test_init_db_adopts_archive_rows_that_kept_their_source_ids(empty_hostel, db_session):
+    # As archived before the archive had ids of its own
+    db_session.add(ArchivedPerson(id=7, name='Asha', aadhar='900000000001', joining_date=date(2022, 1, 1),
+                                  leaving_date=date(2022, 3, 1), archived_at=datetime(2023, 1, 1)))
+    db_session.add(ArchivedPaymentLedger(person_id=7, year=2022, paid_mask=1))
+    db_session.commit()
+
+    create_tables(engine)
+    create_tables(engine)
+    db_session.expire_all()
+    assert db_session.get(ArchivedPerson, 7).person_id == 7
+    assert archived_payment_totals(db_session, [7]) == {7: {'done': 1, 'pending': 2}}
+
+
+def test_guests_lists_departed_residents_before_and_after_archiving(client, seed_hostel, db_session):
+    seed_hostel(blocks=1, rooms=1, beds=2)
+    person = db_session.query(Person).one()
+    name = person.name
+    client.post(f'/person/{person.id}/leave')
+    assert name in client.get('/guests').get_data(as_text=True)
+
+    db_session.expire_all()
+    person.leaving_date = date(2020, 1, 1)
+    db_session.commit()
+    assert archive_departed(db_session, retention_days=30)[0] == 1
+    assert name not in client.get('/guests').get_data(as_text=True)
+    assert name in client.get('/guests?include_archived=1').get_data(as_text=True)
@@ -0,0 +1,28 @@
+from datetime import date
+
+from database import Block, Person, PaymentLedger, Room
+
+
+def test_resident_who_left_mid_month_pays_for_their_days(client, db_session):
+    db_session.add(Block(name='A'))
+    db_session.commit()
+    block_id = db_session.query(Block.id).scalar()
+    client.post('/build', data={'action': 'add_room', 'block_id': block_id, 'room_name': '101', 'bed_count': 2})
+    room_id = db_session.query(Room.id).scalar()
+    for name, mobile in (('Asha', '9000000001'), ('Ravi', '9000000002')):
+        client.post('/build', data={'action': 'add_person', 'block_pref': block_id, 'person_name': name,
+                                    'aadhar': mobile, 'joining_date': '2024-05-01'})
+    asha, ravi = db_session.query(Person).order_by(Person.id).all()
+
+    # Ravi leaves, which frees his bed; he stayed until 16 June
+    client.post(f'/person/{ravi.id}/leave')
+    db_session.expire_all()
+    ravi.leaving_date = date(2024, 6, 16)
+    db_session.commit()
+
+    response = client.post('/payments/eb_bills',
+                           json={'month': '2024-06', 'readings': [{'room_id': room_id, 'amount': 3000}]})
+    assert response.get_json()['residents'] == 2
+
+    shares = dict(db_session.query(PaymentLedger.person_id, PaymentLedger.eb_jun).filter_by(year=2024))
+    assert shares == {asha.id: 2000, ravi.id: 1000}
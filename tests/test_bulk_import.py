@@ -0,0 +1,36 @@
+import io
+import json
+
+from database import Bed, BedEvent, Person, Room
+from bulk_import import import_csv
+
+CSV = (
+    'block,room,bed_count,name,mobile,joining_date\n'
+    'A,101,2,Asha,9000000001,2024-06-01\n'
+    'A,101,2,Ravi,9000000002,2024-06-03\n'
+    'A,102,3,,,\n'
+)
+
+
+def test_import_leaves_the_commit_to_the_caller(db_session):
+    result = import_csv(db_session, io.StringIO(CSV))
+    assert result.ok
+    assert db_session.query(Bed).count() == 5
+
+    db_session.rollback()
+    assert db_session.query(Bed).count() == 0
+
+
+def test_invalid_file_writes_nothing(db_session):
+    result = import_csv(db_session, io.StringIO(CSV + 'A,103,x,,,\n'))
+    assert not result.ok
+    assert db_session.query(Room).count() == 0
+
+
+def test_upload_commits_rows_and_reload_event_together(client, db_session):
+    response = client.post('/import', data={'file': (io.BytesIO(CSV.encode()), 'hostel.csv')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 200
+    assert db_session.query(Person).count() == 2
+    assert db_session.query(Bed).count() == 5
+    assert [json.loads(event.payload) for event in db_session.query(BedEvent)] == [{'reload': True}]
@@ -0,0 +1,20 @@
+from database import Block, Room
+
+
+def test_room_reusing_a_deleted_rooms_id_is_redrawn(client, db_session):
+    db_session.add(Block(name='A'))
+    db_session.commit()
+    block_id = db_session.query(Block.id).scalar()
+
+    client.post('/build', data={'action': 'add_room', 'block_id': block_id, 'room_name': 'OLDROOM', 'bed_count': 3})
+    assert b'Room OLDROOM (3 beds)' in client.get('/build').data
+    old_id = db_session.query(Room.id).scalar()
+
+    client.post(f'/delete_room/{old_id}')
+    client.post('/build', data={'action': 'add_room', 'block_id': block_id, 'room_name': 'NEWROOM', 'bed_count': 2})
+    db_session.expire_all()
+    assert db_session.query(Room.id).scalar() == old_id  # SQLite hands the id out again
+
+    page = client.get('/build').data
+    assert b'Room NEWROOM (2 beds)' in page
+    assert b'Room OLDROOM (3 beds)' not in page
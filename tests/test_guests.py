@@ -0,0 +1,17 @@
+from datetime import date
+
+from database import Person
+
+
+def test_residents_who_left_are_found_by_leaving_month(client, seed_hostel, db_session):
+    seed_hostel(blocks=1, rooms=1, beds=4)
+    leaver, stayer = db_session.query(Person).order_by(Person.id).all()
+    client.post(f'/person/{leaver.id}/leave')
+
+    page = client.get(f'/guests?month_filter={date.today():%Y-%m}').get_data(as_text=True)
+    assert leaver.name in page
+    assert stayer.name not in page
+
+    # Without a filter both are listed, the leaver without a bed
+    page = client.get('/guests').get_data(as_text=True)
+    assert leaver.name in page and stayer.name in page
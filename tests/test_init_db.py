@@ -0,0 +1,36 @@
+from sqlalchemy import inspect, text
+
+from database import Admin, Base, ChangeCounter, Person, engine
+
+
+def _schema():
+    inspector = inspect(engine)
+    return {table: ({column['name'] for column in inspector.get_columns(table)},
+                    {index['name'] for index in inspector.get_indexes(table)})
+            for table in inspector.get_table_names()}
+
+
+def test_init_db_can_run_again_on_a_live_database(app, seed_hostel, db_session):
+    seed_hostel(blocks=1, rooms=2, beds=2)
+    schema = _schema()
+    assert set(schema) >= set(Base.metadata.tables)
+
+    runner = app.test_cli_runner()
+    for _ in range(2):
+        result = runner.invoke(args=['init-db'])
+        assert result.exit_code == 0, result.output
+        assert _schema() == schema
+
+    db_session.expire_all()
+    assert db_session.query(Admin).count() == 1
+    assert db_session.query(ChangeCounter).count() == 1
+    assert db_session.query(Person).count() == 2
+
+
+def test_init_db_adds_indexes_missing_from_an_older_database(app):
+    with engine.begin() as connection:
+        connection.execute(text('DROP INDEX ix_beds_room_occupied'))
+    assert 'ix_beds_room_occupied' not in _schema()['beds'][1]
+
+    assert app.test_cli_runner().invoke(args=['init-db']).exit_code == 0
+    assert 'ix_beds_room_occupied' in _schema()['beds'][1]
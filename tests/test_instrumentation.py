@@ -0,0 +1,22 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from database import engine
+
+
+def test_failed_statement_leaves_no_start_time_behind(app):
+    with engine.connect() as connection:
+        with pytest.raises(OperationalError):
+            connection.execute(text('SELECT * FROM no_such_table'))
+        connection.execute(text('SELECT 1'))
+        assert connection.info['query_started'] == []
+
+
+def test_server_timing_only_on_buffered_responses(client, seed_hostel):
+    seed_hostel(blocks=1, rooms=1, beds=2)
+    assert 'db;dur=' in client.get('/build').headers['Server-Timing']
+
+    streamed = client.get('/accommodate?stream=1')
+    assert streamed.status_code == 200
+    assert 'Server-Timing' not in streamed.headers
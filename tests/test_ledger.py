@@ -0,0 +1,124 @@
+from datetime import date
+
+import pytest
+
+import app as hostel_app
+from database import Payment, PaymentLedger, Person
+from ledger import legacy_payment_year, migrate_payments
+from queries import MONTH_INDEX, month_bit, outstanding_dues
+
+
+@pytest.mark.parametrize('month, joined, left, today, expected', [
+    # Paid months fall in the last year the month came round
+    ('Mar', date(2020, 1, 1), None, date(2024, 6, 15), 2024),
+    ('Sep', date(2020, 1, 1), None, date(2024, 6, 15), 2023),
+    # ...counted back from the leaving date for those who left
+    ('Sep', date(2020, 1, 1), date(2022, 5, 1), date(2024, 6, 15), 2021),
+    # ...but never before the resident joined
+    ('Mar', date(2023, 11, 20), None, date(2024, 2, 1), 2024),
+    ('Nov', date(2023, 11, 20), None, date(2024, 2, 1), 2023),
+    ('Oct', date(2023, 11, 20), None, date(2024, 2, 1), 2024),
+])
+def test_legacy_payment_year(month, joined, left, today, expected):
+    assert legacy_payment_year(MONTH_INDEX[month], joined, left, today) == expected
+
+
+def _legacy_residents(db_session, count):
+    people = [Person(name=f'Guest {n}', aadhar=f'{10**11 + n}', joining_date=date(2023, 1, 1)) for n in range(count)]
+    db_session.add_all(people)
+    db_session.flush()
+    for person in people:
+        db_session.add_all([Payment(person_id=person.id, month='Jan', status='done', eb_amount=300),
+                            Payment(person_id=person.id, month='Feb', status='pending', eb_amount=200)])
+    db_session.commit()
+    return [person.id for person in people]
+
+
+def test_migrate_payments_resumes_after_an_interrupted_run(empty_hostel, db_session, monkeypatch):
+    person_ids = _legacy_residents(db_session, 3)
+    # A month already paid in the ledger, and an EB amount already recorded there, are kept
+    db_session.add(PaymentLedger(person_id=person_ids[0], year=2024, paid_mask=month_bit(MONTH_INDEX['Mar']),
+                                 eb_jan=500))
+    db_session.commit()
+
+    # The second batch's commit fails, as if the process died
+    commit, commits = db_session.commit, []
+    def interrupted_commit():
+        commits.append(1)
+        if len(commits) == 2:
+            raise RuntimeError('interrupted')
+        commit()
+    monkeypatch.setattr(db_session, 'commit', interrupted_commit)
+    with pytest.raises(RuntimeError):
+        migrate_payments(db_session, today=date(2024, 6, 1), batch_size=1)
+    db_session.rollback()
+    monkeypatch.undo()
+    assert db_session.query(Payment).count() == 4
+
+    assert migrate_payments(db_session, today=date(2024, 6, 1), batch_size=1) == 4
+    assert db_session.query(Payment).count() == 0
+    ledger = {entry.person_id: entry for entry in db_session.query(PaymentLedger).filter_by(year=2024)}
+    assert sorted(ledger) == person_ids
+    assert ledger[person_ids[0]].paid_mask == month_bit(MONTH_INDEX['Jan']) | month_bit(MONTH_INDEX['Mar'])
+    assert ledger[person_ids[0]].eb_jan == 500
+    for person_id in person_ids[1:]:
+        assert ledger[person_id].paid_mask == month_bit(MONTH_INDEX['Jan'])
+        assert (ledger[person_id].eb_jan, ledger[person_id].eb_feb) == (300, 200)
+
+
+def test_dues_count_only_the_unpaid_months_of_that_year(seed_hostel, db_session):
+    seed_hostel(blocks=1, rooms=1, beds=4)
+    residents = [person_id for person_id, in db_session.query(Person.id).order_by(Person.id)]
+    # Both paid January 2024; one also paid January 2025
+    db_session.add_all([PaymentLedger(person_id=person_id, year=2024, paid_mask=month_bit(0)) for person_id in residents])
+    db_session.add(PaymentLedger(person_id=residents[0], year=2025, paid_mask=month_bit(0)))
+    db_session.commit()
+
+    dues = {row['month']: row['residents'] for row in outstanding_dues(db_session, date(2024, 1, 1), date(2025, 2, 1))}
+    assert '2024-01' not in dues
+    assert dues['2024-02'] == 2
+    assert dues['2025-01'] == 1
+    assert dues['2025-02'] == 2
+
+
+def test_payments_page_keeps_the_dues_panel_until_a_write(client, seed_hostel, monkeypatch):
+    seed_hostel(blocks=1, rooms=1, beds=2)
+    calls = []
+    def counted(*args, **kwargs):
+        calls.append(args)
+        return outstanding_dues(*args, **kwargs)
+    monkeypatch.setattr(hostel_app, 'outstanding_dues', counted)
+
+    assert client.get('/payments?year=2024').status_code == 200
+    assert client.get('/payments?year=2024&person_name=Guest').status_code == 200
+    assert len(calls) == 1
+
+    person_id = hostel_app.DBSession().query(Person.id).scalar()
+    client.post(f'/update_payment/{person_id}/Jan', json={'year': 2024, 'status': 'done'})
+    assert client.get('/payments?year=2024').status_code == 200
+    assert len(calls) == 2
+
+
+@pytest.mark.parametrize('year', ['0', '-5', '10000'])
+def test_payments_page_clamps_the_year(client, year):
+    assert client.get(f'/payments?year={year}').status_code == 200
+
+
+def test_the_same_cell_posted_twice_leaves_one_ledger_row(client, seed_hostel, db_session):
+    seed_hostel(blocks=1, rooms=1, beds=2)
+    person_id = db_session.query(Person.id).scalar()
+    update = {'person_id': person_id, 'year': 2024, 'month': 'Mar', 'status': 'done', 'eb_amount': 150}
+    for _ in range(2):
+        assert client.post('/update_payments', json={'updates': [update]}).status_code == 200
+    assert client.post(f'/update_payment/{person_id}/Mar', json={'year': 2024, 'status': 'done',
+                                                                 'eb_amount': 150}).status_code == 200
+
+    entries = db_session.query(PaymentLedger).filter_by(person_id=person_id).all()
+    assert [(entry.year, entry.paid_mask, entry.eb_mar) for entry in entries] == [(2024, month_bit(2), 150)]
+
+
+def test_a_refused_payment_update_leaves_the_session_usable(client, seed_hostel, db_session):
+    seed_hostel(blocks=1, rooms=1, beds=2)
+    person_id = db_session.query(Person.id).scalar()
+    assert client.post(f'/update_payment/{person_id}/Smarch', json={'year': 2024}).status_code == 400
+    assert client.post(f'/update_payment/{person_id}/Mar', json={'year': 2024, 'status': 'done'}).status_code == 200
@@ -0,0 +1,25 @@
+import json
+import time
+
+from sqlalchemy import insert
+
+from app import DBSession
+from database import BedEvent
+from live import BedEventFeed, bed_state
+from page_cache import DataVersion
+
+
+def test_feed_picks_up_events_the_version_file_never_saw(db_session):
+    # A version nobody bumps: the write below stands for one made on another host
+    feed = BedEventFeed(DBSession, DataVersion(), poll_interval=0.01, db_poll_interval=0.2, heartbeat=5)
+    try:
+        events = feed.stream()
+        assert next(events) == 'retry: 3000\n\n'
+        time.sleep(0.1)  # past the poller's first read
+
+        db_session.execute(insert(BedEvent), [{'payload': json.dumps(bed_state(7, True, 'Asha'))}])
+        db_session.commit()
+
+        assert '"person": "Asha"' in next(events)
+    finally:
+        feed.close()
@@ -0,0 +1,54 @@
+import re
+import time
+
+from flask import Flask
+from sqlalchemy import create_engine
+
+import instrumentation as instrumentation_module
+from instrumentation import Instrumentation
+
+COUNTER = re.compile(r'^(hostel_\w+(?:_total|_count|_bucket)\{[^}]*\}) (\S+)$', re.M)
+
+
+def _worker(directory):
+    """A stand-in for one gunicorn worker: its own app and in-memory metrics, sharing directory."""
+    app = Flask(__name__)
+    app.config['METRICS_DIR'] = directory
+    instrumentation = Instrumentation()
+    instrumentation.init_app(app, create_engine('sqlite://'))
+    app.add_url_rule('/ping', 'ping', lambda: 'pong')
+    return app.test_client(), instrumentation
+
+
+def _counters(text):
+    return {series: float(value) for series, value in COUNTER.findall(text)}
+
+
+def test_scrapes_add_up_every_worker_and_never_go_backwards(tmp_path, monkeypatch):
+    monkeypatch.setattr(instrumentation_module, 'FLUSH_INTERVAL', 0.05)
+    workers = [_worker(str(tmp_path)) for _ in range(2)]
+    previous = {}
+    for round_ in range(1, 6):
+        # Busy and idle workers alike; the scrape reaches either one
+        for _ in range(round_):
+            workers[0][0].get('/ping')
+        workers[1][0].get('/ping')
+        counters = _counters(workers[round_ % 2][1].render_metrics())
+        for series, value in previous.items():
+            assert counters.get(series, 0) >= value, series
+        previous = counters
+
+    # The worker that was not scraped last writes its latest requests on its own
+    time.sleep(0.2)
+    previous = _counters(workers[0][1].render_metrics())
+    assert previous['hostel_responses_total{endpoint="ping",status="200"}'] == 15 + 5
+    assert previous['hostel_request_duration_seconds_count{endpoint="ping"}'] == 20
+
+
+def test_app_metrics_endpoint(client):
+    client.get('/build')
+    first = _counters(client.get('/metrics').get_data(as_text=True))
+    client.get('/build')
+    second = _counters(client.get('/metrics').get_data(as_text=True))
+    series = 'hostel_responses_total{endpoint="build",status="200"}'
+    assert second[series] == first[series] + 1
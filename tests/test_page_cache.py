@@ -0,0 +1,47 @@
+import time
+
+from sqlalchemy.orm import sessionmaker
+
+from database import Block, Worker, engine
+from page_cache import DataVersion
+
+
+def test_cached_page_is_revalidated_until_a_write(client, db_session):
+    first = client.get('/staff')
+    assert first.status_code == 200
+    etag = first.headers['ETag'].strip('"')
+    assert client.get('/staff', headers={'If-None-Match': f'"{etag}"'}).status_code == 304
+
+    client.post('/staff', data={'name': 'Meena', 'department': 'Kitchen', 'mobile': '8000000001',
+                                'gender': 'Female'})
+    client.get('/staff')  # shows and clears the flash message
+    fresh = client.get('/staff', headers={'If-None-Match': f'"{etag}"'})
+    assert fresh.status_code == 200
+    assert b'Meena' in fresh.data
+
+
+def test_write_through_another_host_moves_the_version(app, tmp_path):
+    # Two hosts: separate version files and sessions, one database
+    hosts = []
+    for name in ('a', 'b'):
+        version = DataVersion(str(tmp_path / f'version-{name}'), check_interval=0.05)
+        sessions = sessionmaker(bind=engine)
+        version.watch(sessions)
+        hosts.append((version, sessions))
+    (version_a, _), (_, sessions_b) = hosts
+    dropped = []
+    version_a.on_foreign_change(lambda: dropped.append(True))
+
+    before = version_a.current()
+    time.sleep(0.1)
+    assert version_a.current() == before
+
+    db_session = sessions_b()
+    db_session.add(Worker(name='Meena', department='Kitchen', mobile='8000000001', gender='Female'))
+    db_session.add(Block(name='B'))
+    db_session.commit()
+    db_session.close()
+
+    time.sleep(0.1)
+    assert version_a.current() != before
+    assert dropped
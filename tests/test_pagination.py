@@ -0,0 +1,38 @@
+import pytest
+
+from database import Bed, Person
+from queries import bed_table_query, guests_query, keyset_page, load_payment_matrix
+
+
+def _walk(fetch):
+    """Every id across the pages fetch(after) returns, following next_cursor."""
+    ids, after = [], None
+    while True:
+        page = fetch(after)
+        ids += [item.id for item in page.items]
+        if page.next_cursor is None:
+            return ids
+        assert page.next_cursor == page.items[-1].id
+        after = page.next_cursor
+
+
+@pytest.mark.parametrize('limit', [1, 3, 4, 7, 12, 100])
+def test_keyset_pages_have_no_gaps_or_duplicates(seed_hostel, db_session, limit):
+    seed_hostel(blocks=2, rooms=2, beds=3)
+    bed_ids = [bed_id for bed_id, in db_session.query(Bed.id).order_by(Bed.id)]
+    person_ids = [person_id for person_id, in db_session.query(Person.id).order_by(Person.id)]
+
+    assert _walk(lambda after: keyset_page(bed_table_query(db_session), Bed.id, after, limit)) == bed_ids
+    assert _walk(lambda after: keyset_page(guests_query(db_session), Person.id, after, limit)) == person_ids
+    assert _walk(lambda after: load_payment_matrix(db_session, 2024, after=after, limit=limit)) == person_ids
+
+
+def test_rows_removed_behind_the_cursor_do_not_shift_later_pages(seed_hostel, db_session):
+    seed_hostel(blocks=1, rooms=2, beds=4)
+    bed_ids = [bed_id for bed_id, in db_session.query(Bed.id).order_by(Bed.id)]
+
+    first = keyset_page(bed_table_query(db_session), Bed.id, None, 3)
+    db_session.delete(db_session.get(Bed, bed_ids[0]))
+    db_session.commit()
+    second = keyset_page(bed_table_query(db_session), Bed.id, first.next_cursor, 3)
+    assert [bed.id for bed in first.items + second.items] == bed_ids[:6]
@@ -0,0 +1,35 @@
+from database import Bed, PaymentLedger, Person, Room
+from queries import EB_COLUMNS, MONTHS, load_payment_matrix, month_bit, stream_payment_matrix
+
+
+def _per_person_rows(db_session, year):
+    """The matrix as the page used to build it: one lookup per resident and month."""
+    rows = []
+    for person in db_session.query(Person).join(Bed, Bed.person_id == Person.id).order_by(Person.id):
+        room = db_session.get(Room, person.bed.room_id)
+        entry = db_session.query(PaymentLedger).filter_by(person_id=person.id, year=year).first()
+        cells = []
+        for index in range(len(MONTHS)):
+            paid = bool(entry and entry.paid_mask & month_bit(index))
+            eb_amount = getattr(entry, EB_COLUMNS[index]) if entry else None
+            cells.append(('done' if paid else 'pending', eb_amount or None))
+        rows.append((person.id, person.name, room.block.name, room.name, cells))
+    return rows
+
+
+def test_pivoted_matrix_matches_the_per_person_rows(seed_hostel, db_session):
+    seed_hostel(blocks=2, rooms=2, beds=3)
+    first, second, third = [person_id for person_id, in db_session.query(Person.id).order_by(Person.id).limit(3)]
+    db_session.add_all([
+        PaymentLedger(person_id=first, year=2024, paid_mask=month_bit(0) | month_bit(2), eb_jan=120, eb_feb=80),
+        PaymentLedger(person_id=second, year=2023, paid_mask=month_bit(5), eb_jun=50),
+        PaymentLedger(person_id=third, year=2024, paid_mask=0, eb_dec=300),
+    ])
+    db_session.commit()
+
+    expected = _per_person_rows(db_session, 2024)
+    page = load_payment_matrix(db_session, 2024)
+    assert page.next_cursor is None
+    assert [(row.id, row.name, row.block_name, row.room_name, [tuple(cell) for cell in row.cells])
+            for row in page.items] == expected
+    assert list(stream_payment_matrix(db_session, 2024)) == page.items
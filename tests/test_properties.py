@@ -0,0 +1,44 @@
+import time
+
+from sqlalchemy import create_engine, text
+
+from properties import PropertyShards
+
+
+def _property_database(path, name):
+    engine = create_engine(f'sqlite:///{path}')
+    with engine.begin() as connection:
+        connection.execute(text('CREATE TABLE hostel (name TEXT)'))
+        connection.execute(text('INSERT INTO hostel VALUES (:name)'), {'name': name})
+    engine.dispose()
+    return f'sqlite:///{path}'
+
+
+def test_sessions_switch_between_property_databases(tmp_path):
+    urls = {name: _property_database(tmp_path / f'{name}.db', name) for name in ('north', 'south')}
+    shards = PropertyShards(urls, 'main', create_engine('sqlite://'), idle_timeout=0)
+    north, south = shards.sessionmaker('north'), shards.sessionmaker('south')
+
+    for _ in range(3):
+        for sessions, name in ((north, 'north'), (south, 'south')):
+            with sessions() as session:
+                assert session.scalar(text('SELECT name FROM hostel')) == name
+            time.sleep(0.01)
+
+
+def test_an_idle_pool_with_a_connection_out_is_not_disposed(tmp_path):
+    urls = {name: _property_database(tmp_path / f'{name}.db', name) for name in ('north', 'south')}
+    shards = PropertyShards(urls, 'main', create_engine('sqlite://'), idle_timeout=0)
+    north = shards.sessionmaker('north')
+
+    # e.g. a report still reading from north while other requests use south
+    with north() as session:
+        rows = session.execute(text('SELECT name FROM hostel'))
+        engine = shards.engine('north')
+        time.sleep(0.01)
+        shards.engine('south')
+        assert shards.engine('north') is engine
+        assert rows.scalar() == 'north'
+    time.sleep(0.01)
+    shards.engine('south')
+    assert shards.engine('north') is not engine
@@ -0,0 +1,35 @@
+import pytest
+from sqlalchemy import func
+
+from database import Bed, Block, Person, Room
+from provisioning import ProvisioningError, provision_block
+
+
+def test_a_block_template_yields_its_rooms_and_beds(client, db_session):
+    client.post('/build', data={'action': 'provision_block', 'block_name': 'Tower', 'floors': 3,
+                                'rooms_per_floor': 4, 'beds_per_room': 2, 'room_pattern': 'T{floor}-{room}'})
+    block = db_session.query(Block).filter_by(name='Tower').one()
+    rooms = db_session.query(Room).filter_by(block_id=block.id).order_by(Room.id).all()
+    assert len(rooms) == 12
+    assert [room.name for room in rooms[:5]] == ['T1-1', 'T1-2', 'T1-3', 'T1-4', 'T2-1']
+    beds = dict(db_session.query(Bed.room_id, func.count(Bed.id)).group_by(Bed.room_id))
+    assert beds == {room.id: 2 for room in rooms}
+    assert {tuple(bed.bed_number for bed in room.beds) for room in rooms} == {(1, 2)}
+    assert db_session.query(Bed).filter_by(is_occupied=True).count() == 0
+
+    # The new beds can be filled straight away
+    client.post('/build', data={'action': 'add_person', 'block_pref': block.id, 'person_name': 'Asha',
+                                'aadhar': '9000000001', 'joining_date': '2024-05-01'})
+    assert db_session.query(Bed).join(Person, Bed.person_id == Person.id).one().room.block_id == block.id
+
+
+def test_an_invalid_template_writes_nothing(empty_hostel, db_session):
+    with pytest.raises(ProvisioningError):
+        provision_block(db_session, 'Tower', floors=2, rooms_per_floor=3, beds_per_room=2, room_pattern='{floor}')
+    db_session.rollback()
+    provision_block(db_session, 'Tower', floors=1, rooms_per_floor=1, beds_per_room=1)
+    db_session.commit()
+    with pytest.raises(ProvisioningError):
+        provision_block(db_session, ' Tower ', floors=1, rooms_per_floor=1, beds_per_room=1)
+    db_session.rollback()
+    assert (db_session.query(Block).count(), db_session.query(Room).count(), db_session.query(Bed).count()) == (1, 1, 1)
@@ -0,0 +1,17 @@
+import pytest
+
+
+@pytest.mark.parametrize('path', ['/build', '/profile'])
+def test_query_count_does_not_grow_with_the_hostel(client, seed_hostel, empty_hostel, count_queries, path):
+    seed_hostel(blocks=1, rooms=2, beds=2)
+    response, small = count_queries(lambda: client.get(path))
+    assert response.status_code == 200
+
+    empty_hostel()
+    seed_hostel(blocks=6, rooms=10, beds=4)
+    response, large = count_queries(lambda: client.get(path))
+    assert response.status_code == 200
+    assert b'Block 5' in response.data
+
+    assert small == large, (small, large)
+    assert small > 0
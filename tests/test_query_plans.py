@@ -0,0 +1,12 @@
+from query_plans import check_query_plans
+
+
+def test_route_queries_use_indexes():
+    plans, problems = check_query_plans('sqlite://')
+    assert plans
+    assert problems == {}
+
+
+def test_vacant_beds_come_from_the_room_occupancy_index():
+    plans, _ = check_query_plans('sqlite://')
+    assert any('ix_beds_room_occupied' in line for line in plans['build: vacant beds in room'])
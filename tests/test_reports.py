@@ -0,0 +1,68 @@
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import date
+
+from app import DBSession
+from archive import archive_departed
+from database import Block, Person
+from reports import ReportJobs, _dues, _movement, parse_month
+
+
+def _wait(jobs, job_id, timeout=10):
+    deadline = time.monotonic() + timeout
+    while jobs.status(job_id)['status'] in ('queued', 'running'):
+        assert time.monotonic() < deadline
+        time.sleep(0.02)
+    return jobs.status(job_id)
+
+
+def test_export_runs_in_the_background(tmp_path, seed_hostel):
+    seed_hostel(blocks=1, rooms=2, beds=2)
+    jobs = ReportJobs(DBSession, str(tmp_path))
+    job = _wait(jobs, jobs.start('occupancy', '2024-06', 'csv')['id'])
+    assert job['status'] == 'done'
+    assert job['rows'] == 4
+    with open(jobs.output_path(job['id'])) as f:
+        assert f.readline().startswith('Block,Room,Bed')
+
+
+def test_job_of_a_stopped_worker_is_marked_failed(tmp_path):
+    worker = subprocess.Popen([sys.executable, '-c', 'pass'])
+    worker.wait()
+    job_id = 'ab' * 16
+    with open(os.path.join(tmp_path, f'{job_id}.json'), 'w') as f:
+        json.dump({'id': job_id, 'status': 'running', 'pid': worker.pid, 'format': 'csv',
+                   'created': '2024-06-30T10:00:00', 'finished': None, 'error': None}, f)
+
+    jobs = ReportJobs(DBSession, str(tmp_path))
+    assert jobs.status(job_id)['status'] == 'failed'
+    assert [job['status'] for job in jobs.recent()] == ['failed']
+
+
+def test_dues_and_movement_keep_the_room_of_residents_who_left(client, db_session):
+    db_session.add(Block(name='A'))
+    db_session.commit()
+    block_id = db_session.query(Block.id).scalar()
+    client.post('/build', data={'action': 'add_room', 'block_id': block_id, 'room_name': '101', 'bed_count': 2})
+    for name, aadhar in (('Asha', '9000000001'), ('Ravi', '9000000002')):
+        client.post('/build', data={'action': 'add_person', 'block_pref': block_id, 'person_name': name,
+                                    'aadhar': aadhar, 'joining_date': '2024-05-01'})
+    ravi = db_session.query(Person).filter_by(name='Ravi').one()
+    client.post(f'/person/{ravi.id}/leave')
+    db_session.expire_all()
+    ravi.leaving_date = date(2024, 6, 16)
+    db_session.commit()
+    june = parse_month('2024-06')
+
+    _, total, rows = _dues(db_session, *june)
+    assert total == 2
+    assert [row[:4] for row in rows] == [('Asha', '9000000001', 'A', '101'), ('Ravi', '9000000002', 'A', '101')]
+
+    left = ('Left', date(2024, 6, 16), 'Ravi', '9000000002', 'A', '101')
+    assert list(_movement(db_session, *june)[2]) == [left]
+    # Archived, they still show in their room
+    assert archive_departed(db_session, retention_days=30, today=date(2024, 8, 1))[0] == 1
+    assert list(_movement(db_session, *june)[2]) == [left]
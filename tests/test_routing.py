@@ -0,0 +1,56 @@
+import threading
+import time
+
+from sqlalchemy import create_engine, text
+
+from routing import ReplicaRouter
+
+
+def _database(path, name):
+    engine = create_engine(f'sqlite:///{path}')
+    with engine.begin() as connection:
+        connection.execute(text('CREATE TABLE server (name TEXT)'))
+        connection.execute(text('INSERT INTO server VALUES (:name)'), {'name': name})
+    return engine
+
+
+def _served_by(engine):
+    with engine.connect() as connection:
+        return connection.scalar(text('SELECT name FROM server'))
+
+
+def test_reads_go_to_the_replica_and_fall_back_when_it_is_gone(tmp_path):
+    primary = _database(tmp_path / 'primary.db', 'primary')
+    replica_path = tmp_path / 'replica.db'
+    _database(replica_path, 'replica').dispose()
+    # Read-only, so a missing file is an error instead of a new empty database
+    replica = create_engine(f'sqlite:///file:{replica_path}?mode=ro&uri=true')
+    router = ReplicaRouter(primary, [replica], check_interval=0)
+
+    assert _served_by(router.read_engine()) == 'replica'
+
+    replica.dispose()
+    replica_path.unlink()
+    assert router.read_engine() is primary
+    assert _served_by(router.read_engine()) == 'primary'
+
+
+def test_one_request_runs_a_due_check(tmp_path):
+    primary = _database(tmp_path / 'primary.db', 'primary')
+    replica = _database(tmp_path / 'replica.db', 'replica')
+    router = ReplicaRouter(primary, [replica], check_interval=60)
+    checks = []
+    def slow_check(checked):
+        checks.append(checked)
+        time.sleep(0.2)
+        return True
+    router.check = slow_check
+
+    engines = []
+    threads = [threading.Thread(target=lambda: engines.append(router.read_engine())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(checks) == 1
+    assert engines == [replica] * 8
@@ -0,0 +1,34 @@
+from datetime import date
+
+import pytest
+
+from database import Bed, Block, PaymentLedger, Person, Room, Worker, engine
+from seed_data import SIZES, generate_hostel
+
+
+@pytest.mark.parametrize('blocks, rooms, beds, occupancy', [(3, 4, 2, 0.5), (1, 1, 6, 1.0), (2, 3, 4, 0.0)])
+def test_generates_the_requested_sizes(empty_hostel, db_session, blocks, rooms, beds, occupancy):
+    counts = generate_hostel(engine, blocks, rooms, beds, occupancy=occupancy, departed_ratio=0.5, workers=3,
+                             today=date(2024, 6, 15))
+
+    assert db_session.query(Block).count() == counts['blocks'] == blocks
+    assert db_session.query(Room).count() == counts['rooms'] == blocks * rooms
+    assert db_session.query(Bed).count() == counts['beds'] == blocks * rooms * beds
+    assert db_session.query(Worker).count() == counts['workers'] == 3
+    assert {bed_count for bed_count, in db_session.query(Room.bed_count)} == {beds}
+
+    occupied = db_session.query(Bed).filter_by(is_occupied=True).count()
+    if occupancy in (0.0, 1.0):
+        assert occupied == occupancy * blocks * rooms * beds
+    current = db_session.query(Person).filter(Person.leaving_date == None).count()
+    assert current == occupied
+    assert db_session.query(Person).count() == counts['persons'] == current + int(current * 0.5)
+    # Twelve months of ledger, over one or two calendar years
+    assert db_session.query(PaymentLedger).count() == counts['payment_ledger'] == 2 * counts['persons']
+
+
+def test_a_second_run_adds_to_the_existing_hostel(empty_hostel, db_session):
+    first = generate_hostel(engine, *SIZES['small'], workers=2)
+    second = generate_hostel(engine, *SIZES['small'], workers=2, seed=8)
+    assert db_session.query(Bed).count() == first['beds'] + second['beds'] == 2 * 5 * 10 * 4
+    assert db_session.query(Person).count() == first['persons'] + second['persons']
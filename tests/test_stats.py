@@ -0,0 +1,58 @@
+import threading
+import time
+
+import app as hostel_app
+from database import Block, Person, Room
+from stats import OccupancyCache, compute_occupancy
+
+
+def _matches_the_database(db_session):
+    cached = hostel_app.current_property().occupancy_cache.counts(db_session)
+    assert cached == compute_occupancy(db_session)
+
+
+def test_cached_counters_follow_adds_leaves_and_deletes(client, db_session):
+    _matches_the_database(db_session)
+    client.post('/build', data={'action': 'add_block', 'block_name': 'A'})
+    block_id = db_session.query(Block.id).scalar()
+    client.post('/build', data={'action': 'add_room', 'block_id': block_id, 'room_name': '101', 'bed_count': 3})
+    client.post('/build', data={'action': 'add_room', 'block_id': block_id, 'room_name': '102', 'bed_count': 2})
+    for name, aadhar in (('Asha', '9000000001'), ('Ravi', '9000000002')):
+        client.post('/build', data={'action': 'add_person', 'block_pref': block_id, 'person_name': name,
+                                    'aadhar': aadhar, 'joining_date': '2024-05-01'})
+    _matches_the_database(db_session)
+
+    client.post(f'/person/{db_session.query(Person.id).filter_by(name="Ravi").scalar()}/leave')
+    _matches_the_database(db_session)
+
+    client.post(f'/delete_room/{db_session.query(Room.id).filter_by(name="102").scalar()}')
+    totals, blocks = compute_occupancy(db_session)
+    assert (totals['rooms'], totals['beds'], totals['occupied'], totals['persons']) == (1, 3, 1, 1)
+    _matches_the_database(db_session)
+
+
+def test_a_recompute_waits_for_a_commit_and_its_change(seed_hostel, db_session):
+    seed_hostel(blocks=1, rooms=1, beds=2)
+    cache = OccupancyCache()
+    cache.counts(db_session)
+    cache.invalidate()
+    person = db_session.query(Person).one()
+    person.leaving_date = person.joining_date
+    cache.track(db_session)
+
+    # A recompute is asked for while the commit is under way
+    real_commit, recomputed = db_session.commit, []
+    def recompute():
+        with hostel_app.DBSession() as session:
+            recomputed.append(cache.counts(session))
+    reader = threading.Thread(target=recompute)
+    def slow_commit():
+        reader.start()
+        time.sleep(0.1)
+        real_commit()
+        assert not recomputed
+    db_session.commit = slow_commit
+    cache.commit(db_session, dict(persons=-1))
+    reader.join()
+    assert recomputed[0][0]['persons'] == 0
+    assert cache.counts(db_session) == compute_occupancy(db_session)
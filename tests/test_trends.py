@@ -0,0 +1,50 @@
+from datetime import date
+
+from archive import archive_departed
+from database import Block, OccupancyDaily, Person, Room
+from trends import HOSTEL, backfill, capture_snapshot, trend
+
+
+def test_snapshot_records_each_room_and_rolls_up_the_hostel(seed_hostel, db_session):
+    seed_hostel(blocks=2, rooms=2, beds=4)
+    assert capture_snapshot(db_session, date(2024, 3, 5)) == 4
+    db_session.commit()
+
+    rows = db_session.query(OccupancyDaily.beds, OccupancyDaily.occupied).filter_by(day=date(2024, 3, 5)).all()
+    assert sorted(rows) == [(4, 2)] * 4
+    block_id = db_session.query(Block.id).filter_by(name='Block 0').scalar()
+    assert trend(db_session, 'week', HOSTEL) == [{'start': '2024-03-04', 'days': 1, 'average_beds': 16.0,
+                                                 'average_occupied': 8.0, 'occupancy_percent': 50.0,
+                                                 'peak_occupied': 8}]
+    assert trend(db_session, 'month', block_id)[0]['average_occupied'] == 4.0
+
+
+def test_backfill_keeps_departed_residents_in_their_room(client, db_session):
+    db_session.add(Block(name='A'))
+    db_session.commit()
+    block_id = db_session.query(Block.id).scalar()
+    client.post('/build', data={'action': 'add_room', 'block_id': block_id, 'room_name': '101', 'bed_count': 2})
+    room_id = db_session.query(Room.id).scalar()
+    for name, aadhar in (('Asha', '9000000001'), ('Ravi', '9000000002')):
+        client.post('/build', data={'action': 'add_person', 'block_pref': block_id, 'person_name': name,
+                                    'aadhar': aadhar, 'joining_date': '2024-05-01'})
+    ravi = db_session.query(Person).filter_by(name='Ravi').one()
+    client.post(f'/person/{ravi.id}/leave')
+    db_session.expire_all()
+    ravi.leaving_date = date(2024, 5, 11)
+    db_session.commit()
+    # Archived residents keep their room as well
+    assert archive_departed(db_session, retention_days=30, today=date(2024, 7, 1))[0] == 1
+
+    assert backfill(db_session, date(2024, 5, 1), date(2024, 5, 20)) == 20
+    db_session.commit()
+
+    occupied = dict(db_session.query(OccupancyDaily.day, OccupancyDaily.occupied).filter_by(room_id=room_id))
+    assert occupied[date(2024, 5, 10)] == 2
+    assert occupied[date(2024, 5, 11)] == 1
+    assert db_session.query(OccupancyDaily).filter_by(room_id=None).count() == 0
+    assert trend(db_session, 'month', block_id) == [{'start': '2024-05-01', 'days': 20, 'average_beds': 2.0,
+                                                     'average_occupied': 1.5, 'occupancy_percent': 75.0,
+                                                     'peak_occupied': 2}]
+    # Days already recorded are left alone
+    assert backfill(db_session, date(2024, 5, 1), date(2024, 5, 20)) == 0
@@ -0,0 +1,214 @@
+from collections import defaultdict
+from datetime import date, timedelta
+from sqlalchemy import select, func, case, delete, insert, and_, or_
+from database import Room, Bed, Person, ArchivedPerson, OccupancyDaily, OccupancyRollup
+from queries import _month_range
+
+# block_id of the rollups that cover the whole hostel
+HOSTEL = 0
+
+PERIODS = ('week', 'month')
+
+# Rows per executemany INSERT while back-filling
+BATCH_SIZE = 5000
+
+
+def period_start(day, period):
+    """The Monday of day's week, or the first of its month."""
+    if period == 'week':
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def period_end(start, period):
+    """The first day after the period that begins on start."""
+    if period == 'week':
+        return start + timedelta(days=7)
+    return _month_range(start.year, start.month)[1]
+
+
+def _room_beds(db_session):
+    """{room id: (block id, beds, occupied beds)} as the beds stand now."""
+    rows = db_session.execute(
+        select(Room.id, Room.block_id, func.count(Bed.id),
+               func.coalesce(func.sum(case((Bed.is_occupied == True, 1), else_=0)), 0))
+        .select_from(Room)
+        .outerjoin(Bed, Bed.room_id == Room.id)
+        .group_by(Room.id, Room.block_id)
+    )
+    return {room_id: (block_id, beds, int(occupied)) for room_id, block_id, beds, occupied in rows}
+
+
+def capture_snapshot(db_session, day=None):
+    """
+    Records each room's beds and occupied beds for day (default today) and
+    refreshes the week and month rollups containing it. Meant to run once a
+    day from a scheduler (flask snapshot-occupancy); running it again the
+    same day replaces that day's rows. Returns the number of rooms recorded.
+    """
+    day = day or date.today()
+    rooms = _room_beds(db_session)
+    db_session.execute(delete(OccupancyDaily).where(OccupancyDaily.day == day))
+    if rooms:
+        db_session.execute(insert(OccupancyDaily), [
+            {'day': day, 'block_id': block_id, 'room_id': room_id, 'beds': beds, 'occupied': occupied}
+            for room_id, (block_id, beds, occupied) in rooms.items()
+        ])
+    refresh_rollups(db_session, day, day)
+    return len(rooms)
+
+
+def backfill(db_session, since=None, until=None):
+    """
+    Rebuilds daily rows for the days in [since, until] that have none yet,
+    from the residents' joining and leaving dates.
+
+    A resident counts from their joining date up to the day before they
+    left, in the room of their stay (Person.room_id, which departed and
+    archived residents keep after their bed is freed). Stays with no room
+    on record, or in a room since deleted, are kept on a row without a
+    room, which counts towards the whole hostel but no block. Room sizes
+    are taken as they are today. Returns the number of days filled.
+    """
+    until = until or date.today() - timedelta(days=1)
+    if since is None:
+        firsts = [db_session.scalar(select(func.min(Person.joining_date))),
+                  db_session.scalar(select(func.min(ArchivedPerson.joining_date)))]
+        firsts = [first for first in firsts if first]
+        if not firsts:
+            return 0
+        since = min(firsts)
+    if since > until:
+        return 0
+
+    rooms = {room_id: (block_id, beds) for room_id, (block_id, beds, _) in _room_beds(db_session).items()}
+    existing = set(db_session.scalars(
+        select(OccupancyDaily.day).where(OccupancyDaily.day >= since, OccupancyDaily.day <= until).distinct()
+    ))
+
+    # Occupancy per room on since, then the changes on each later day
+    current = defaultdict(int)
+    changes = defaultdict(lambda: defaultdict(int))
+    stays = db_session.execute(
+        select(Person.joining_date, Person.leaving_date, func.coalesce(Person.room_id, Bed.room_id))
+        .select_from(Person)
+        .outerjoin(Bed, Bed.person_id == Person.id)
+        .where(Person.joining_date <= until)
+        .where(or_(Person.leaving_date == None, Person.leaving_date > since))
+    ).all()
+    stays += db_session.execute(
+        select(ArchivedPerson.joining_date, ArchivedPerson.leaving_date, ArchivedPerson.room_id)
+        .where(ArchivedPerson.joining_date <= until, ArchivedPerson.leaving_date > since)
+    ).all()
+    for joined, left, room_id in stays:
+        if left is not None and left <= joined:
+            continue
+        if room_id not in rooms:
+            room_id = None
+        if joined <= since:
+            current[room_id] += 1
+        else:
+            changes[joined][room_id] += 1
+        if left is not None and left <= until:
+            changes[left][room_id] -= 1
+
+    filled = 0
+    rows = []
+    day = since
+    while day <= until:
+        for room_id, delta in changes.get(day, {}).items():
+            current[room_id] += delta
+        if day not in existing:
+            filled += 1
+            for room_id, (block_id, beds) in rooms.items():
+                rows.append({'day': day, 'block_id': block_id, 'room_id': room_id,
+                             'beds': beds, 'occupied': current[room_id]})
+            if current[None]:
+                rows.append({'day': day, 'block_id': None, 'room_id': None, 'beds': 0, 'occupied': current[None]})
+            if len(rows) >= BATCH_SIZE:
+                db_session.execute(insert(OccupancyDaily), rows)
+                rows = []
+        day += timedelta(days=1)
+    if rows:
+        db_session.execute(insert(OccupancyDaily), rows)
+    if filled:
+        refresh_rollups(db_session, since, until)
+    return filled
+
+
+def refresh_rollups(db_session, first, last):
+    """
+    Recomputes the weekly and monthly rollups of every period touching
+    [first, last] from the daily rows, in one grouped query.
+    """
+    low = min(period_start(first, period) for period in PERIODS)
+    high = max(period_end(period_start(last, period), period) for period in PERIODS)
+    daily = db_session.execute(
+        select(OccupancyDaily.day, OccupancyDaily.block_id,
+               func.sum(OccupancyDaily.beds), func.sum(OccupancyDaily.occupied))
+        .where(OccupancyDaily.day >= low, OccupancyDaily.day < high)
+        .group_by(OccupancyDaily.day, OccupancyDaily.block_id)
+    ).all()
+
+    # Hostel-wide figures per day, including the stays without a room
+    per_day = defaultdict(lambda: [0, 0])
+    for day, block_id, beds, occupied in daily:
+        per_day[day][0] += beds
+        per_day[day][1] += occupied
+    samples = [(day, block_id, beds, occupied) for day, block_id, beds, occupied in daily if block_id is not None]
+    samples += [(day, HOSTEL, beds, occupied) for day, (beds, occupied) in per_day.items()]
+
+    totals = {}
+    for day, block_id, beds, occupied in samples:
+        for period in PERIODS:
+            start = period_start(day, period)
+            total = totals.setdefault((period, start, block_id), [0, 0, 0, 0])
+            total[0] += 1
+            total[1] += beds
+            total[2] += occupied
+            total[3] = max(total[3], occupied)
+
+    for period in PERIODS:
+        start = period_start(first, period)
+        starts = []
+        while start <= last:
+            starts.append(start)
+            start = period_end(start, period)
+        db_session.execute(delete(OccupancyRollup).where(
+            and_(OccupancyRollup.period == period, OccupancyRollup.period_start.in_(starts))
+        ))
+    rows = [
+        {'period': period, 'period_start': start, 'block_id': block_id, 'days': days,
+         'bed_days': bed_days, 'occupied_days': occupied_days, 'peak_occupied': peak}
+        for (period, start, block_id), (days, bed_days, occupied_days, peak) in totals.items()
+        if start <= last and period_end(start, period) > first
+    ]
+    if rows:
+        db_session.execute(insert(OccupancyRollup), rows)
+
+
+def trend(db_session, period='month', block_id=HOSTEL, limit=12):
+    """
+    The latest limit rollups of a block (or the whole hostel), oldest first.
+    Served by the rollups' unique index, so it costs the same however much
+    history there is.
+    """
+    if period not in PERIODS:
+        raise ValueError(f'Unknown period "{period}".')
+    rows = db_session.execute(
+        select(OccupancyRollup)
+        .where(OccupancyRollup.period == period, OccupancyRollup.block_id == block_id)
+        .order_by(OccupancyRollup.period_start.desc())
+        .limit(limit)
+    ).scalars().all()
+    return [
+        {
+            'start': row.period_start.isoformat(),
+            'days': row.days,
+            'average_beds': round(row.bed_days / row.days, 1),
+            'average_occupied': round(row.occupied_days / row.days, 1),
+            'occupancy_percent': round(row.occupied_days / row.bed_days * 100, 2) if row.bed_days else 0,
+            'peak_occupied': row.peak_occupied,
+        }
+        for row in reversed(rows)
+    ]